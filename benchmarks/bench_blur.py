@@ -0,0 +1,141 @@
+import argparse
+import json
+import sys
+import time
+import bench_editor # sets up the offscreen platform and the import path of the editor
+import cv2
+import numpy as np
+from PyQt6.QtGui import QImage
+import image_editor_blur as blur_engine
+import image_editor_buffers as buffers
+import image_editor_core as core
+
+'''
+This script measures the blur of the editor (image_editor_blur.py) against the exact gaussian
+For every input, image size and strength it reports the path the engine took, its time and throughput,
+the time of the exact cv2.GaussianBlur with the same kernel, and how far the result is from it
+(largest and mean difference, in levels out of 255). It fails when the largest difference is over
+the bound of the engine (blur_engine.SMOOTH_ERROR on photos, blur_engine.MAX_ERROR of the path on
+the others) or over --max-error when given, so it doubles as the accuracy check of the approximated paths:
+    * photo - smooth gradients with some noise (bench_editor.synthetic_image)
+    * noise - uniform random noise
+    * squares - black and white squares a quarter of the kernel wide, the hardest input for the blur
+
+    python benchmarks/bench_blur.py --sizes 1mp,12mp --strengths 5,51,201,501 --output blur.json
+'''
+
+STRENGTHS = (5, 15, 31, 51, 101, 201, 301, 501)
+
+def noise_image(width, height, strength):
+    image, view = buffers.new_image(width, height, QImage.Format.Format_RGB32)
+    view[...] = np.random.default_rng(1).integers(0, 256, view.shape, dtype=np.uint8)
+    view[:, :, 3] = 255
+    return image
+
+def squares_image(width, height, strength):
+    image, view = buffers.new_image(width, height, QImage.Format.Format_Grayscale8)
+    square = max(1, strength // 4)
+    rows, columns = np.ogrid[:height, :width]
+    view[...] = ((rows // square + columns // square) % 2 * 255).astype(np.uint8)
+    return image
+
+# input name: function(width, height, strength) returning the image, and whether it is smooth like a photo
+INPUTS = {
+    "photo": (lambda width, height, strength: bench_editor.synthetic_image(width, height), True),
+    "noise": (noise_image, False),
+    "squares": (squares_image, False),
+}
+
+'''
+This function times the blur of image at strength against the exact gaussian and adds its record to results
+Returns a description of the failure when the result is too far from the exact gaussian, None otherwise
+'''
+def measure(image, input_name, smooth, size_name, strength, args, results):
+    width, height = image.width(), image.height()
+    source = buffers.image_to_array(image)
+    plan = blur_engine.BlurPlan(strength, image.size())
+    times = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        result = core.blur(image, strength)
+        times.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    exact = cv2.GaussianBlur(source, (plan.kernel_size, plan.kernel_size), 0)
+    exact_seconds = time.perf_counter() - start
+    difference = cv2.absdiff(buffers.image_to_array(result), exact)
+
+    max_error = args.max_error
+    if max_error is None:
+        max_error = blur_engine.SMOOTH_ERROR if smooth else blur_engine.MAX_ERROR[plan.path]
+
+    record = {
+        "input": input_name,
+        "size": size_name,
+        "strength": strength,
+        "path": plan.path,
+        "levels": plan.levels,
+        "seconds": min(times),
+        "megapixels_per_second": width * height / 1e6 / min(times),
+        "exact_seconds": exact_seconds,
+        "max_error": int(difference.max()),
+        "mean_error": float(np.mean(difference)),
+        "allowed_error": max_error,
+    }
+    results.append(record)
+    print("%-8s %-10s %4d %-8s %9.4f s %8.1f MP/s   exact %9.4f s   error max %2d of %2d mean %.3f" % (input_name,
+          size_name, strength, plan.path, record["seconds"], record["megapixels_per_second"], exact_seconds,
+          record["max_error"], max_error, record["mean_error"]))
+    if record["max_error"] > max_error:
+        return "%s %s @ %d (%s): off by %d levels" % (input_name, size_name, strength, plan.path, record["max_error"])
+    return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the blur engine against the exact gaussian.")
+    parser.add_argument("--sizes", default="1mp,12mp", help="comma separated sizes among: %s" % ", ".join(bench_editor.SIZES))
+    parser.add_argument("--strengths", default=",".join(map(str, STRENGTHS)), help="comma separated blur strengths")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each blur; the best time is kept")
+    parser.add_argument("--inputs", default=",".join(INPUTS), help="comma separated inputs among: %s" % ", ".join(INPUTS))
+    parser.add_argument("--max-error", type=int, help="largest difference allowed with the exact gaussian "
+                                                          "(default: the bound of the engine for the input and path)")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+    for size in sizes:
+        if size not in bench_editor.SIZES:
+            parser.error("unknown size: %s" % size)
+    inputs = [name.strip() for name in args.inputs.split(",") if name.strip()]
+    for name in inputs:
+        if name not in INPUTS:
+            parser.error("unknown input: %s" % name)
+    try:
+        strengths = [int(strength) for strength in args.strengths.split(",") if strength.strip()]
+    except ValueError:
+        parser.error("strengths must be integers")
+
+    results, failures = [], []
+    for input_name in inputs:
+        make_image, smooth = INPUTS[input_name]
+        for size_name in sizes:
+            width, height = bench_editor.SIZES[size_name]
+            for strength in strengths:
+                image = make_image(width, height, strength)
+                failure = measure(image, input_name, smooth, size_name, strength, args, results)
+                if failure:
+                    failures.append(failure)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"machine": bench_editor.machine_info(), "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "repeat": args.repeat, "band_threads": core.BAND_THREADS, "results": results}, file, indent=2)
+
+    if failures:
+        print("\n%d blur(s) too far from the exact gaussian:" % len(failures), file=sys.stderr)
+        for failure in failures:
+            print("  " + failure, file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import threading
+import time
+
+# run without a display; must be set before Qt is imported
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import QPoint, PYQT_VERSION_STR, QT_VERSION_STR
+from PyQt6.QtGui import QImage
+import cv2
+import numpy as np
+import image_editor_buffers as buffers
+import image_editor_cache as result_cache
+
+'''
+This script times the operations of the image editor (image_editor_functions.py) the way the
+editor runs them: through the EditorFunctions canvas, including background workers, the undo
+history and the refresh of the canvas. It runs headless on the Qt offscreen platform.
+
+For every operation and image size it records the wall time (median and best of the repeats),
+the peak memory used on top of what was in use before, the bytes allocated by the QImage/numpy
+bridge, the memory of the resulting image and the throughput in megapixels per second.
+With --gray the images are grayscale, which the editor keeps at one byte per pixel. Results are saved as JSON and can be compared
+with a baseline saved earlier, failing when an operation got slower than the threshold allows:
+
+    python benchmarks/bench_editor.py --sizes thumbnail,1mp --output results.json
+    python benchmarks/bench_editor.py --baseline results.json --threshold 0.15
+'''
+
+# synthetic image sizes, from a thumbnail to a 50 megapixel photo
+SIZES = {
+    "thumbnail": (160, 120),
+    "1mp": (1280, 800),
+    "12mp": (4000, 3000),
+    "50mp": (8660, 5774),
+}
+
+BRUSH_MOVES = 200 # mouse moves of the benchmarked brush stroke
+
+'''
+These functions run one editor operation on the canvas; they return when the result is shown
+'''
+def run_rotate(canvas):
+    canvas.rotate_image("right")
+
+def run_mirror(canvas):
+    canvas.mirror_image("horizontal")
+
+def run_blur(strength):
+    def run(canvas):
+        canvas.blur_image(strength)
+        canvas.runner.wait()
+    return run
+
+def run_grayscale(canvas):
+    canvas.black_white_image()
+
+def run_pixelate(canvas):
+    canvas.pixelate_image(8)
+    canvas.runner.wait()
+
+def run_contrast(canvas):
+    canvas.adjust_contrast_image(40)
+    canvas.runner.wait()
+
+def run_sketch(canvas):
+    canvas.sketch_image()
+    canvas.runner.wait()
+
+def run_invert(canvas):
+    canvas.invert_colors_image()
+    canvas.runner.wait()
+
+def run_histogram(canvas):
+    canvas.image_histogram()
+
+def run_auto_levels(canvas):
+    canvas.auto_levels_image()
+    canvas.runner.wait()
+
+def run_auto_contrast(canvas):
+    canvas.auto_contrast_image()
+    canvas.runner.wait()
+
+def run_brush(canvas):
+    # a diagonal stroke across the image, painted as the mouse would report it
+    width, height = canvas.image.width(), canvas.image.height()
+    for step in range(BRUSH_MOVES):
+        canvas.paint_pixels_image(QPoint(step * (width - 8) // BRUSH_MOVES, step * (height - 8) // BRUSH_MOVES), 5)
+    canvas.prev_paint_loc = None
+    canvas.finish_stroke()
+
+def run_brush_coalesced(canvas):
+    # the same stroke, with its mouse moves coalesced into one polyline as the canvas does within a screen refresh
+    width, height = canvas.image.width(), canvas.image.height()
+    canvas.paint_points([(step * (width - 8) // BRUSH_MOVES + 0.5, step * (height - 8) // BRUSH_MOVES + 0.5)
+                         for step in range(BRUSH_MOVES)], 5)
+    canvas.prev_paint_loc = None
+    canvas.finish_stroke()
+
+OPERATIONS = {
+    "rotate": run_rotate,
+    "mirror": run_mirror,
+    "blur:5": run_blur(5),
+    "blur:15": run_blur(15),
+    "blur:45": run_blur(45),
+    "blur:201": run_blur(201),
+    "grayscale": run_grayscale,
+    "pixelate": run_pixelate,
+    "contrast": run_contrast,
+    "sketch": run_sketch,
+    "invert": run_invert,
+    "histogram": run_histogram,
+    "autolevels": run_auto_levels,
+    "autocontrast": run_auto_contrast,
+    "brush": run_brush,
+    "brush:coalesced": run_brush_coalesced,
+}
+
+'''
+This function makes a deterministic test image: smooth gradients with noise, like a photo
+'''
+def synthetic_image(width, height):
+    image, view = buffers.new_image(width, height, QImage.Format.Format_RGB32)
+    rows = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    columns = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    noise = np.random.default_rng(0).integers(0, 32, (height, width), dtype=np.uint8)
+    view[:, :, 0] = cv2.add((rows * 0.5 + columns * 0.5).astype(np.uint8), noise)
+    view[:, :, 1] = cv2.add(rows.astype(np.uint8) + np.zeros((1, width), np.uint8), noise)
+    view[:, :, 2] = cv2.add(columns.astype(np.uint8) + np.zeros((height, 1), np.uint8), noise)
+    view[:, :, 3] = 255
+    return image
+
+'''
+This class samples the resident memory of the process on a thread to find its peak during an operation
+Falls back to the peak of the whole process where /proc is not available
+'''
+class MemorySampler:
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.start_rss = current_rss()
+        self.peak = self.start_rss
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop_event.set()
+        self.thread.join()
+        self.peak = max(self.peak, current_rss())
+
+    def _sample(self):
+        while not self.stop_event.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    @property
+    def extra_bytes(self):
+        return max(0, self.peak - self.start_rss)
+
+def current_rss():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # peak of the whole process so far, in kilobytes on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+'''
+This function times one operation on one image size and returns its result record
+'''
+def benchmark(canvas, name, size_name, repeat, gray=False):
+    width, height = SIZES[size_name]
+    image = synthetic_image(width, height)
+    if gray:
+        image = image.convertToFormat(QImage.Format.Format_Grayscale8)
+        size_name += " gray"
+    times, peaks, allocated = [], [], []
+    for _ in range(repeat):
+        canvas.set_image(QImage(image))
+        result_cache.results.clear() # every repeat computes the operation, rather than finding it cached
+        gc.collect()
+        buffers.allocations.reset()
+        with MemorySampler() as memory:
+            start = time.perf_counter()
+            OPERATIONS[name](canvas)
+            times.append(time.perf_counter() - start)
+        peaks.append(memory.extra_bytes)
+        allocated.append(buffers.allocations.bytes)
+        result_bytes = canvas.image.sizeInBytes()
+
+    megapixels = width * height / 1e6
+    seconds = statistics.median(times)
+    return {
+        "operation": name,
+        "size": size_name,
+        "width": width,
+        "height": height,
+        "megapixels": round(megapixels, 3),
+        "seconds": seconds,
+        "min_seconds": min(times),
+        "peak_memory_mb": max(peaks) / 2**20,
+        "allocated_mb": max(allocated) / 2**20,
+        "result_mb": result_bytes / 2**20,
+        "megapixels_per_second": megapixels / seconds if seconds > 0 else None,
+    }
+
+def machine_info():
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "qt": QT_VERSION_STR,
+        "pyqt": PYQT_VERSION_STR,
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+    }
+
+'''
+This function compares results with a baseline and returns the regressions found
+An operation regresses when its median time grows by more than threshold (a fraction, 0.1 = 10%),
+or its peak memory by more than memory_threshold when given. Times under min_seconds are too
+noisy to compare and are skipped
+'''
+def compare(results, baseline, threshold, memory_threshold=None, min_seconds=0.002):
+    previous = {(record["operation"], record["size"]): record for record in baseline["results"]}
+    regressions = []
+    for record in results:
+        old = previous.get((record["operation"], record["size"]))
+        if old is None:
+            continue
+        ratio = record["seconds"] / old["seconds"] if old["seconds"] > 0 else 1.0
+        record["baseline_seconds"] = old["seconds"]
+        record["change"] = ratio - 1
+        if max(record["seconds"], old["seconds"]) >= min_seconds and ratio > 1 + threshold:
+            regressions.append("%s @ %s: %.4fs -> %.4fs (%+.0f%%)" % (record["operation"], record["size"],
+                               old["seconds"], record["seconds"], (ratio - 1) * 100))
+        if memory_threshold is not None and old.get("peak_memory_mb"):
+            memory_ratio = record["peak_memory_mb"] / old["peak_memory_mb"]
+            if memory_ratio > 1 + memory_threshold:
+                regressions.append("%s @ %s: peak memory %.1f MB -> %.1f MB" % (record["operation"], record["size"],
+                                   old["peak_memory_mb"], record["peak_memory_mb"]))
+    return regressions
+
+def print_record(record):
+    change = ""
+    if "change" in record:
+        change = "%+6.0f%%" % (record["change"] * 100)
+    throughput = record["megapixels_per_second"] or 0
+    print("%-10s %-10s %9.4f s %9.1f MP/s %8.1f MB peak %8.1f MB alloc %8.1f MB result %s" % (record["operation"],
+          record["size"], record["seconds"], throughput, record["peak_memory_mb"], record["allocated_mb"],
+          record.get("result_mb", 0), change))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the image editor operations on synthetic images.")
+    parser.add_argument("--sizes", default=",".join(SIZES), help="comma separated sizes among: %s" % ", ".join(SIZES))
+    parser.add_argument("--operations", default=",".join(OPERATIONS),
+                        help="comma separated operations among: %s" % ", ".join(OPERATIONS))
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each operation; the median time is kept")
+    parser.add_argument("--gray", action="store_true", help="run on grayscale images (sizes are reported as e.g. '12mp gray')")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown before failing (0.10 = 10%%)")
+    parser.add_argument("--memory-threshold", type=float, default=None, help="allowed growth of peak memory (off by default)")
+    parser.add_argument("--min-seconds", type=float, default=0.002, help="operations faster than this are too noisy to compare")
+    args = parser.parse_args(argv)
+
+    sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+    operations = [name.strip() for name in args.operations.split(",") if name.strip()]
+    for name, known in [(size, SIZES) for size in sizes] + [(name, OPERATIONS) for name in operations]:
+        if name not in known:
+            parser.error("unknown size or operation: %s" % name)
+
+    app = QApplication.instance() or QApplication([])
+    from image_editor_functions import EditorFunctions # needs the application
+    canvas = EditorFunctions(None)
+
+    results = []
+    for size_name in sizes:
+        for name in operations:
+            record = benchmark(canvas, name, size_name, args.repeat, args.gray)
+            results.append(record)
+            print_record(record)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold, args.memory_threshold, args.min_seconds)
+        print("\ncompared with %s:" % args.baseline)
+        for record in results:
+            if "change" in record:
+                print_record(record)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"machine": machine_info(), "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "repeat": args.repeat, "results": results}, file, indent=2)
+
+    if regressions:
+        print("\n%d regression(s):" % len(regressions), file=sys.stderr)
+        for regression in regressions:
+            print("  " + regression, file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
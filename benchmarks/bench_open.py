@@ -0,0 +1,105 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import bench_editor # sets up the offscreen platform and the import path of the editor
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import QEventLoop
+from PyQt6.QtGui import QImage
+
+'''
+This script measures how fast the editor opens images (image_editor_loader.py)
+For every size and file format it reports:
+    * blocking - the time QImage(path) blocks the window, the way files used to be opened
+    * first pixel - the time until something is shown (the reduced preview, or the image itself)
+    * full resolution - the time until the full image is on the canvas and can be edited
+
+    python benchmarks/bench_open.py --sizes 12mp,50mp --formats jpg,png --output open.json
+'''
+
+FORMATS = ("jpg", "png")
+
+'''
+This function opens a file through the editor canvas and returns (time to first pixel, time to full resolution)
+'''
+def time_open(app, canvas, path):
+    times = {}
+    start = time.perf_counter()
+
+    def first_pixel(*args):
+        times.setdefault("first", time.perf_counter() - start)
+
+    def full(*args):
+        times.setdefault("first", time.perf_counter() - start)
+        times["full"] = time.perf_counter() - start
+
+    canvas.loader.preview_ready.connect(first_pixel)
+    canvas.loader.loaded.connect(full)
+    canvas.loader.failed.connect(full)
+    canvas.loader.load(path, canvas.screen().availableGeometry().size())
+    while "full" not in times:
+        app.processEvents(QEventLoop.ProcessEventsFlag.AllEvents, 5)
+    canvas.loader.preview_ready.disconnect(first_pixel)
+    canvas.loader.loaded.disconnect(full)
+    canvas.loader.failed.disconnect(full)
+    return times["first"], times["full"]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark opening images in the editor.")
+    parser.add_argument("--sizes", default="12mp,50mp", help="comma separated sizes among: %s" % ", ".join(bench_editor.SIZES))
+    parser.add_argument("--formats", default=",".join(FORMATS), help="comma separated file formats among: %s" % ", ".join(FORMATS))
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each measure; the best time is kept")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+    formats = [file_format.strip().lstrip(".") for file_format in args.formats.split(",") if file_format.strip()]
+    for name, known in [(size, bench_editor.SIZES) for size in sizes] + [(name, FORMATS) for name in formats]:
+        if name not in known:
+            parser.error("unknown size or format: %s" % name)
+
+    app = QApplication.instance() or QApplication([])
+    from image_editor_functions import EditorFunctions # needs the application
+    canvas = EditorFunctions(None)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size_name in sizes:
+            width, height = bench_editor.SIZES[size_name]
+            image = bench_editor.synthetic_image(width, height)
+            for file_format in formats:
+                path = os.path.join(directory, "%s.%s" % (size_name, file_format))
+                image.save(path)
+
+                blocking, first, full = [], [], []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    QImage(path)
+                    blocking.append(time.perf_counter() - start)
+                    first_pixel, full_resolution = time_open(app, canvas, path)
+                    first.append(first_pixel)
+                    full.append(full_resolution)
+
+                record = {
+                    "size": size_name,
+                    "format": file_format,
+                    "file_mb": os.path.getsize(path) / 2**20,
+                    "blocking_seconds": min(blocking),
+                    "first_pixel_seconds": min(first),
+                    "full_resolution_seconds": min(full),
+                }
+                results.append(record)
+                print("%-10s %-4s %8.1f MB   blocking %7.3f s   first pixel %7.3f s   full resolution %7.3f s" % (
+                      size_name, file_format, record["file_mb"], record["blocking_seconds"],
+                      record["first_pixel_seconds"], record["full_resolution_seconds"]))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"machine": bench_editor.machine_info(), "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "repeat": args.repeat, "results": results}, file, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import bench_editor # sets up the offscreen platform and the import path of the editor
+import numpy as np
+import image_editor_buffers as buffers
+import image_editor_cache as result_cache
+import image_editor_core as core
+
+'''
+This script measures how the neighbourhood filters (blur, sketch, pixelate) scale with the number of cores:
+every filter runs with 1, 2, 4... band threads (see core.run_filter), and for each number it reports the time,
+the speedup over one thread and the efficiency (speedup per thread). One thread runs the whole image in a
+single call, the way the filters ran before; every other result must be the same to the last byte, or the
+script fails, so it doubles as the check that cutting the image into bands changes nothing:
+
+    python benchmarks/bench_parallel.py --sizes 12mp,50mp --threads 1,2,4,8,16 --output parallel.json
+
+The speedup can only grow up to the number of cores of the machine (listed with the results).
+'''
+
+OPERATIONS = {
+    "blur": lambda image: core.blur(image, 31),
+    "blur_large": lambda image: core.blur(image, 201),
+    "sketch": core.sketch,
+    "pixelate": lambda image: core.pixelate(image, 16),
+}
+
+'''
+This function returns the numbers of threads measured by default: the powers of two up to the number of cores, and that number
+'''
+def default_threads():
+    cores = os.cpu_count() or 1
+    threads = [1 << power for power in range(cores.bit_length()) if 1 << power <= cores]
+    return threads + ([cores] if cores not in threads else [])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the neighbourhood filters on 1, 2, 4... cores.")
+    parser.add_argument("--sizes", default="12mp", help="comma separated sizes among: %s" % ", ".join(bench_editor.SIZES))
+    parser.add_argument("--operations", default=",".join(OPERATIONS), help="comma separated among: %s" % ", ".join(OPERATIONS))
+    parser.add_argument("--threads", default=",".join(map(str, default_threads())), help="comma separated numbers of threads")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each filter; the median is kept")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+    operations = [name.strip() for name in args.operations.split(",") if name.strip()]
+    for size in sizes:
+        if size not in bench_editor.SIZES:
+            parser.error("unknown size: %s" % size)
+    for name in operations:
+        if name not in OPERATIONS:
+            parser.error("unknown operation: %s" % name)
+    try:
+        threads = sorted(set(int(count) for count in args.threads.split(",") if count.strip()) | {1})
+    except ValueError:
+        parser.error("threads must be integers")
+    if threads[0] < 1:
+        parser.error("threads must be positive")
+
+    results, failures = [], []
+    for size_name in sizes:
+        image = bench_editor.synthetic_image(*bench_editor.SIZES[size_name])
+        for name in operations:
+            reference, single = None, None
+            for count in threads:
+                core.set_band_threads(count)
+                times = []
+                for _ in range(args.repeat):
+                    result_cache.results.clear() # the sketch would find its planes cached
+                    start = time.perf_counter()
+                    result = OPERATIONS[name](image)
+                    times.append(time.perf_counter() - start)
+                seconds = statistics.median(times)
+
+                pixels = buffers.image_to_array(result)
+                if reference is None:
+                    reference, single = pixels.copy(), seconds
+                identical = bool(np.array_equal(pixels, reference))
+                if not identical:
+                    failures.append("%s on %s with %d threads" % (name, size_name, count))
+
+                record = {
+                    "size": size_name,
+                    "operation": name,
+                    "threads": count,
+                    "seconds": seconds,
+                    "speedup": single / seconds,
+                    "efficiency": single / seconds / count,
+                    "identical": identical,
+                }
+                results.append(record)
+                print("%-10s %-11s %3d threads %9.4f s   speedup %5.2f   efficiency %4.0f%%%s" % (size_name, name,
+                      count, seconds, record["speedup"], record["efficiency"] * 100, "" if identical else "   DIFFERENT"))
+    core.set_band_threads(os.cpu_count() or 1)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"machine": bench_editor.machine_info(), "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "repeat": args.repeat, "results": results}, file, indent=2)
+
+    if failures:
+        print("\n%d result(s) differ from the single threaded one:" % len(failures), file=sys.stderr)
+        for failure in failures:
+            print("  " + failure, file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
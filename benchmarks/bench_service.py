@@ -0,0 +1,164 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import bench_editor # sets up the offscreen platform and the import path of the editor
+from PyQt6.QtCore import QBuffer, QIODevice
+import image_editor_service as service
+
+'''
+This script measures the local service of the editor (image_editor_service.py), started in its own process
+on a Unix socket as other tools would use it:
+    * one call - a small image processed by a new process (image_editor_batch.py on one file), the way a tool
+      calls the editor without the service, and by the service
+    * concurrent calls - small images sent by several clients at once, with batching and without it
+      (--max-batch 1): requests per second, latency seen by the clients and the mean batch size
+    * large image - a large image sent as a PNG file and through shared memory
+
+    python benchmarks/bench_service.py --workers 4 --clients 16 --requests 50 --output service.json
+'''
+
+SMALL_OPS = "blur:3,contrast:20,invert"
+LARGE_OPS = "invert"
+
+'''
+This function starts the service and returns its process once it is ready for requests
+'''
+def start_service(socket_path, workers, max_batch):
+    editor = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen([sys.executable, os.path.join(editor, "image_editor_service.py"), "serve",
+                                "--socket", socket_path, "--workers", str(workers), "--max-batch", str(max_batch)],
+                               stdout=subprocess.PIPE, text=True)
+    if not process.stdout.readline().startswith("serving"):
+        process.kill()
+        raise RuntimeError("the service did not start")
+    return process
+
+def stop_service(process):
+    process.terminate()
+    process.wait()
+
+def encode_png(image):
+    device = QBuffer()
+    device.open(QIODevice.OpenModeFlag.WriteOnly)
+    image.save(device, "PNG")
+    return bytes(device.data())
+
+'''
+This function sends requests calls of the file data from each of clients threads at once
+Returns (requests per second, latencies in seconds)
+'''
+def concurrent_calls(socket_path, data, clients, requests):
+    latencies = []
+    lock = threading.Lock()
+
+    def run_client():
+        client = service.ServiceClient(socket_path)
+        times = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            client.process(data, SMALL_OPS)
+            times.append(time.perf_counter() - start)
+        client.close()
+        with lock:
+            latencies.extend(times)
+
+    threads = [threading.Thread(target=run_client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return clients * requests / (time.perf_counter() - start), sorted(latencies)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the local image processing service.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes of the service")
+    parser.add_argument("--clients", type=int, default=16, help="clients sending requests at the same time")
+    parser.add_argument("--requests", type=int, default=50, help="requests sent by each client")
+    parser.add_argument("--small", default="thumbnail", help="size of the small images among: %s" % ", ".join(bench_editor.SIZES))
+    parser.add_argument("--large", default="12mp", help="size of the large image among: %s" % ", ".join(bench_editor.SIZES))
+    parser.add_argument("--repeat", type=int, default=5, help="runs of the single call measures; the median is kept")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    args = parser.parse_args(argv)
+    for size in (args.small, args.large):
+        if size not in bench_editor.SIZES:
+            parser.error("unknown size: %s" % size)
+
+    small = bench_editor.synthetic_image(*bench_editor.SIZES[args.small])
+    small_data = encode_png(small)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        socket_path = os.path.join(directory, "service.sock")
+
+        # a new process for every call: what the service saves
+        os.makedirs(os.path.join(directory, "in"))
+        with open(os.path.join(directory, "in", "small.png"), "wb") as file:
+            file.write(small_data)
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "image_editor_batch.py"),
+                   os.path.join(directory, "in"), os.path.join(directory, "out"), "--ops", SMALL_OPS, "--workers", "1"]
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+        results["new_process_call_seconds"] = statistics.median(times)
+
+        for max_batch, name in ((service.MAX_BATCH, "batched"), (1, "unbatched")):
+            process = start_service(socket_path, args.workers, max_batch)
+            try:
+                client = service.ServiceClient(socket_path)
+                if name == "batched":
+                    times = []
+                    for _ in range(args.repeat):
+                        start = time.perf_counter()
+                        client.process(small_data, SMALL_OPS)
+                        times.append(time.perf_counter() - start)
+                    results["service_call_seconds"] = statistics.median(times)
+
+                    large = bench_editor.synthetic_image(*bench_editor.SIZES[args.large])
+                    large_data = encode_png(large)
+                    start = time.perf_counter()
+                    client.process(large_data, LARGE_OPS)
+                    results["large_file_seconds"] = time.perf_counter() - start
+                    start = time.perf_counter()
+                    client.process_image(large, LARGE_OPS)
+                    results["large_shared_seconds"] = time.perf_counter() - start
+
+                throughput, latencies = concurrent_calls(socket_path, small_data, args.clients, args.requests)
+                metrics = client.metrics()
+                client.close()
+            finally:
+                stop_service(process)
+            results[name] = {
+                "requests_per_second": throughput,
+                "p50_ms": statistics.median(latencies) * 1000,
+                "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+                "mean_batch_size": metrics["mean_batch_size"],
+                "max_queue_depth": metrics["max_queue_depth"],
+            }
+
+    print("one call (%s)       new process %8.3f s   service %8.4f s" % (
+          args.small, results["new_process_call_seconds"], results["service_call_seconds"]))
+    for name in ("batched", "unbatched"):
+        row = results[name]
+        print("%-10s %d clients   %8.0f requests/s   p50 %7.1f ms   p99 %7.1f ms   batch %5.1f   max queue %d" % (
+              name, args.clients, row["requests_per_second"], row["p50_ms"], row["p99_ms"],
+              row["mean_batch_size"], row["max_queue_depth"]))
+    print("large image (%s)    PNG file %8.3f s   shared memory %8.3f s" % (
+          args.large, results["large_file_seconds"], results["large_shared_seconds"]))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"machine": bench_editor.machine_info(), "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "workers": args.workers, "clients": args.clients, "requests": args.requests,
+                       "results": results}, file, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+'''
+This script measures how fast the editor starts: every run starts a new Python process that opens the
+editor window the way image_editor_GUI.py does, and reports
+    * start to first paint - from starting the process until the window is first painted, what the user waits for
+    * imports - the time importing image_editor_GUI takes in that process
+    * window - the time the window takes to be created and painted once imported
+    * first filter - the time of a first filter on a small image after the window is shown, which pays for
+      the modules that are only imported when they are used (see image_editor_lazy.py)
+It also lists which of the slow modules (numpy, cv2) were imported when the window was first painted.
+
+    python benchmarks/bench_startup.py --repeat 10 --output startup.json
+'''
+
+SLOW_MODULES = ("numpy", "cv2")
+EDITOR_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+'''
+This function runs in the started process: it opens the editor window, waits for its first paint,
+runs a first filter and prints the times as JSON
+'''
+def child():
+    start = time.perf_counter()
+    sys.path.insert(0, EDITOR_DIRECTORY)
+    import image_editor_GUI as gui
+    imported = time.perf_counter()
+
+    from PyQt6.QtWidgets import QApplication
+    from PyQt6.QtCore import QEvent, QObject, QTimer
+    from PyQt6.QtGui import QImage
+    times = {}
+
+    # the first paint event of the window; the times are taken once it is painted
+    class PaintWatcher(QObject):
+
+        def eventFilter(self, watched, event):
+            if event.type() == QEvent.Type.Paint and "paint" not in times:
+                times["paint"] = None
+                QTimer.singleShot(0, painted)
+            return False
+
+    def painted():
+        times["paint"] = time.perf_counter()
+        times["painted_at"] = time.time()
+        times["loaded"] = [name for name in SLOW_MODULES if name in sys.modules]
+        canvas = window.image_canvas
+        canvas.set_image(QImage(640, 480, QImage.Format.Format_RGB32))
+        filter_start = time.perf_counter()
+        canvas.invert_colors_image()
+        canvas.runner.wait()
+        times["filter"] = time.perf_counter() - filter_start
+        app.quit()
+
+    app = QApplication(sys.argv[:1])
+    watcher = PaintWatcher()
+    app.installEventFilter(watcher)
+    window = gui.PhotoEditorGUI()
+    app.exec()
+    print(json.dumps({
+        "imports_seconds": imported - start,
+        "window_seconds": times["paint"] - imported,
+        "first_filter_seconds": times["filter"],
+        "painted_at": times["painted_at"],
+        "loaded_at_paint": times["loaded"],
+    }))
+    return 0
+
+'''
+This function starts the editor in a new process and returns its times, with the time from starting the process
+until the window was painted; that time also counts the start of Python and the import of Qt
+'''
+def run_once():
+    environment = dict(os.environ)
+    environment.setdefault("QT_QPA_PLATFORM", "offscreen")
+    # wall clock times, the only clock both processes share
+    start = time.time()
+    process = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"], stdout=subprocess.PIPE,
+                             env=environment, cwd=EDITOR_DIRECTORY, text=True)
+    if process.returncode != 0 or not process.stdout.strip():
+        raise RuntimeError("the editor did not start (exit code %s)" % process.returncode)
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result["first_paint_seconds"] = result.pop("painted_at") - start
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the start of the editor, until its window is painted.")
+    parser.add_argument("--repeat", type=int, default=5, help="number of starts; the median and the best are reported")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        return child()
+
+    runs = [run_once() for _ in range(max(1, args.repeat))]
+    results = {}
+    for key, name in (("first_paint_seconds", "start to first paint"), ("imports_seconds", "imports"),
+                      ("window_seconds", "window"), ("first_filter_seconds", "first filter")):
+        values = [run[key] for run in runs]
+        results[key] = {"median": statistics.median(values), "best": min(values)}
+        print("%-22s median %7.3f s   best %7.3f s" % (name, results[key]["median"], results[key]["best"]))
+    results["loaded_at_paint"] = runs[-1]["loaded_at_paint"]
+    print("%-22s %s" % ("loaded at first paint", ", ".join(results["loaded_at_paint"]) or "none of " + ", ".join(SLOW_MODULES)))
+
+    if args.output:
+        import bench_editor # the machine description; imports the slow modules, so only here
+        with open(args.output, "w") as file:
+            json.dump({"machine": bench_editor.machine_info(), "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "repeat": args.repeat, "results": results, "runs": runs}, file, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
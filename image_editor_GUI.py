@@ -1,8 +1,14 @@
 import sys
-from PyQt6.QtWidgets import QApplication, QMainWindow, QToolBar,QHBoxLayout, QLabel, QInputDialog, QScrollArea, QWidget, QToolButton
-from PyQt6.QtCore import Qt, QSize
-from PyQt6.QtGui import QIcon, QImage, QAction, QColor
+from PyQt6.QtWidgets import QApplication, QMainWindow, QToolBar,QHBoxLayout, QLabel, QInputDialog, QScrollArea, QWidget, QToolButton, QProgressBar, QSpinBox, QDialog, QDockWidget, QVBoxLayout, QPlainTextEdit, QFileDialog
+from PyQt6.QtCore import Qt, QSize, QPointF
+from PyQt6.QtGui import QImage, QAction, QColor, QKeySequence, QFontDatabase
+import image_editor_brush as brush
+import image_editor_cache as result_cache
 import image_editor_functions as img
+import image_editor_histogram as histogram
+import image_editor_icons as icons
+import image_editor_preview as preview
+import image_editor_trace as trace
 
 '''
 This class represents the application window that is shown to the user
@@ -30,6 +36,7 @@ class PhotoEditorGUI(QMainWindow):
         
        
         self.create_image_canvas() # create the widget where the image will be displayed
+        self.create_histogram_panel() # create the panel showing the histogram of the image, hidden at first
         self.create_menu_bar() # create a menu bar for file options (opening, saving, reverting)
        
         self.create_tool_bar() # create a toolbar where editor features will be displayed
@@ -43,7 +50,7 @@ class PhotoEditorGUI(QMainWindow):
     def create_image_canvas(self):
     
         self.image_canvas = img.EditorFunctions(self) # create instance of editing features to allow image manipulation
-        self.image_canvas.resize(self.image_canvas.pixmap().size()) # create a pixmap the size of the image
+        self.image_canvas.resize(self.image_canvas.canvas_size()) # the canvas is the size of the image at its zoom
 
         self.scroll_area = QScrollArea() # create a scroll area widget; if images are big then user can scroll 
         self.scroll_area.setAlignment(Qt.AlignmentFlag.AlignCenter) # set scroll area alignment to center of area
@@ -53,6 +60,26 @@ class PhotoEditorGUI(QMainWindow):
         
         self.scroll_area.setStyleSheet("background-color: #A1B5C1;") 
 
+        # files are saved in the background; the status bar tells when they are written
+        saver = self.image_canvas.saver
+        saver.busy_changed.connect(lambda busy: self.statusBar().showMessage("Saving...") if busy else None)
+        saver.saved.connect(self.show_saved)
+        saver.failed.connect(lambda path, message: self.statusBar().clearMessage())
+
+    '''
+    This method creates a dock on the right of the window for the histogram panel
+    The panel only counts the image while it is shown, and is only created when the dock is first shown
+    '''
+    def create_histogram_panel(self):
+        self.histogram_dock = QDockWidget("Histogram", self)
+        self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.histogram_dock)
+        self.histogram_dock.hide()
+        self.histogram_dock.visibilityChanged.connect(self.show_histogram_panel)
+
+    def show_histogram_panel(self, visible):
+        if visible and self.histogram_dock.widget() is None:
+            self.histogram_dock.setWidget(histogram.HistogramPanel(self.image_canvas))
+
     '''
     This method creates an menu bar on the window where file operation can be performed
     Options are File opening, saving, and reverting changes
@@ -62,29 +89,137 @@ class PhotoEditorGUI(QMainWindow):
         menu = self.menuBar() # create a menu bar
 
         # create action for opening a file
-        self.open_act = QAction(QIcon("./icons/open.png"),'Open File', self)
+        self.open_act = QAction(icons.icon("open"),'Open File', self)
         self.open_act.triggered.connect(self.image_canvas.open_image)
 
         # create action for saving a file
-        self.save_act = QAction(QIcon("./icons/save.png"), "Save File", self)
+        self.save_act = QAction(icons.icon("save"), "Save File", self)
         self.save_act.triggered.connect(self.image_canvas.save_image)
        
+        # create actions for saving the whole session (image, original and history) as a project to continue later
+        self.save_project_act = QAction("Save Project", self)
+        self.save_project_act.setShortcut(QKeySequence.StandardKey.Save)
+        self.save_project_act.triggered.connect(lambda: self.image_canvas.save_project())
+
+        self.save_project_as_act = QAction("Save Project As...", self)
+        self.save_project_as_act.setShortcut(QKeySequence.StandardKey.SaveAs)
+        self.save_project_as_act.triggered.connect(lambda: self.image_canvas.save_project(save_as=True))
+        self.image_canvas.project_saved.connect(self.show_project_saved)
+
         # create action for revering changes on an image
-        self.revert_act = QAction(QIcon("./icons/revert.png"), "Revert", self)
+        self.revert_act = QAction(icons.icon("revert"), "Revert", self)
         self.revert_act.triggered.connect(lambda: self.image_canvas.revert_original())
         self.revert_act.setEnabled(True)
 
         # create action for exting the application
-        self.close_act = QAction(QIcon("./icons/close.png"), "Close", self)
+        self.close_act = QAction(icons.icon("close"), "Close", self)
         self.close_act.triggered.connect(lambda: self.close())
 
         # add options to file menu
         file_menu = menu.addMenu("File")
-        file_menu.addActions([self.open_act, self.save_act, self.close_act])
+        file_menu.addActions([self.open_act, self.save_act, self.save_project_act, self.save_project_as_act, self.close_act])
+
+        # create actions for undoing and redoing the last edits
+        self.undo_act = QAction("Undo", self)
+        self.undo_act.setShortcut(QKeySequence.StandardKey.Undo)
+        self.undo_act.triggered.connect(lambda: self.image_canvas.undo_edit())
+
+        self.redo_act = QAction("Redo", self)
+        self.redo_act.setShortcut(QKeySequence.StandardKey.Redo)
+        self.redo_act.triggered.connect(lambda: self.image_canvas.redo_edit())
 
-        # add revert action to editing menu
+        # add undo, redo and revert actions to editing menu
         editing_menu = menu.addMenu("Edit")
-        editing_menu.addAction(self.revert_act)
+        editing_menu.addActions([self.undo_act, self.redo_act, self.revert_act])
+
+        # create actions for the selection; filters only change the selected part of the image
+        self.select_all_act = QAction("Select All", self)
+        self.select_all_act.setShortcut(QKeySequence.StandardKey.SelectAll)
+        self.select_all_act.triggered.connect(lambda: self.image_canvas.select_all())
+
+        self.deselect_act = QAction("Deselect", self)
+        self.deselect_act.setShortcut(QKeySequence("Ctrl+D"))
+        self.deselect_act.triggered.connect(lambda: self.image_canvas.clear_selection())
+
+        self.ellipse_act = QAction("Elliptical Selection", self)
+        self.ellipse_act.setCheckable(True)
+        self.ellipse_act.toggled.connect(lambda checked: self.image_canvas.set_selection_shape("ellipse" if checked else "rectangle"))
+
+        self.crop_act = QAction("Crop to Selection", self)
+        self.crop_act.setShortcut(QKeySequence("Ctrl+Shift+X"))
+        self.crop_act.triggered.connect(lambda: self.image_canvas.crop_image())
+
+        # add selection actions to select menu; drag on the image (with the paintbrush off) to select
+        select_menu = menu.addMenu("Select")
+        select_menu.addActions([self.select_all_act, self.deselect_act, self.ellipse_act, self.crop_act])
+
+        # create actions for the tone adjustments (point operations)
+        self.brightness_act = QAction("Brightness", self)
+        self.brightness_act.triggered.connect(lambda: self.apply_brightness_effect())
+
+        self.gamma_act = QAction("Gamma", self)
+        self.gamma_act.triggered.connect(lambda: self.apply_gamma_effect())
+
+        self.levels_act = QAction("Levels", self)
+        self.levels_act.triggered.connect(lambda: self.apply_levels_effect())
+
+        # create actions for the tone adjustments found from the histogram of the image
+        self.auto_levels_act = QAction("Auto Levels", self)
+        self.auto_levels_act.setShortcut(QKeySequence("Ctrl+Shift+L"))
+        self.auto_levels_act.triggered.connect(lambda: self.apply_auto_adjustment(self.image_canvas.auto_levels_image))
+
+        self.auto_contrast_act = QAction("Auto Contrast", self)
+        self.auto_contrast_act.setShortcut(QKeySequence("Alt+Ctrl+Shift+L"))
+        self.auto_contrast_act.triggered.connect(lambda: self.apply_auto_adjustment(self.image_canvas.auto_contrast_image))
+
+        # add tone adjustments to adjust menu
+        adjust_menu = menu.addMenu("Adjust")
+        adjust_menu.addActions([self.brightness_act, self.gamma_act, self.levels_act])
+        adjust_menu.addSeparator()
+        adjust_menu.addActions([self.auto_levels_act, self.auto_contrast_act])
+
+        # create actions for zooming the canvas
+        self.zoom_in_act = QAction("Zoom In", self)
+        self.zoom_in_act.setShortcut(QKeySequence.StandardKey.ZoomIn)
+        self.zoom_in_act.triggered.connect(lambda: self.zoom_canvas(1.25))
+
+        self.zoom_out_act = QAction("Zoom Out", self)
+        self.zoom_out_act.setShortcut(QKeySequence.StandardKey.ZoomOut)
+        self.zoom_out_act.triggered.connect(lambda: self.zoom_canvas(0.8))
+
+        self.fit_act = QAction("Fit to Window", self)
+        self.fit_act.setShortcut(QKeySequence("Ctrl+0"))
+        self.fit_act.triggered.connect(lambda: self.fit_canvas())
+
+        self.actual_size_act = QAction("Actual Size", self)
+        self.actual_size_act.setShortcut(QKeySequence("Ctrl+1"))
+        self.actual_size_act.triggered.connect(lambda: self.zoom_canvas(1 / self.image_canvas.zoom))
+
+        # add zoom actions to view menu; ctrl + mouse wheel zooms too
+        view_menu = menu.addMenu("View")
+        view_menu.addActions([self.zoom_in_act, self.zoom_out_act, self.fit_act, self.actual_size_act])
+        view_menu.addSeparator()
+        view_menu.addAction(self.histogram_dock.toggleViewAction())
+        self.image_canvas.zoom_requested.connect(self.zoom_canvas)
+
+        # create actions for recording where the time of the edits goes (see image_editor_trace)
+        self.trace_act = QAction("Record Timings", self)
+        self.trace_act.setCheckable(True)
+        self.trace_act.setChecked(trace.tracer.enabled)
+        self.trace_act.toggled.connect(lambda checked: trace.tracer.enable() if checked else trace.tracer.disable())
+
+        self.trace_summary_act = QAction("Show Timings", self)
+        self.trace_summary_act.triggered.connect(lambda: self.show_trace_summary())
+
+        self.trace_export_act = QAction("Export Trace", self)
+        self.trace_export_act.triggered.connect(lambda: self.export_trace())
+
+        self.trace_clear_act = QAction("Clear Timings", self)
+        self.trace_clear_act.triggered.connect(lambda: trace.tracer.clear())
+
+        # add tracing actions to profile menu
+        profile_menu = menu.addMenu("Profile")
+        profile_menu.addActions([self.trace_act, self.trace_summary_act, self.trace_export_act, self.trace_clear_act])
 
     '''
     This method creates a tool bar that contains actions for image processing
@@ -105,28 +240,28 @@ class PhotoEditorGUI(QMainWindow):
 
         # Create button for rotating right
         self.rotate_right_act = QToolButton()
-        self.rotate_right_act.setIcon(QIcon("./icons/rotate_right.png"))
+        self.rotate_right_act.setIcon(icons.icon("rotate_right"))
         self.rotate_right_act.setIconSize(QSize(30,30))
         self.rotate_right_act.setToolTip('Rotate Right')
         self.rotate_right_act.clicked.connect(lambda: self.image_canvas.rotate_image("right"))
 
         # Create button for rotating left
         self.rotate_left_act = QToolButton()
-        self.rotate_left_act.setIcon(QIcon("./icons/rotate_left.png"))
+        self.rotate_left_act.setIcon(icons.icon("rotate_left"))
         self.rotate_left_act.setIconSize(QSize(30,30))
         self.rotate_left_act.setToolTip('Rotate Left')
         self.rotate_left_act.clicked.connect(lambda: self.image_canvas.rotate_image("left"))
 
         # Create button for mirroring vertical
         self.mirror_vertical = QToolButton()
-        self.mirror_vertical.setIcon(QIcon("./icons/mirror_x.png"))
+        self.mirror_vertical.setIcon(icons.icon("mirror_x"))
         self.mirror_vertical.setIconSize(QSize(30,30))
         self.mirror_vertical.setToolTip('Mirror Vertical Axis')
         self.mirror_vertical.clicked.connect(lambda: self.image_canvas.mirror_image("horizontal"))
 
         # Create button for mirroring horizontal
         self.mirror_horizontal = QToolButton()
-        self.mirror_horizontal.setIcon(QIcon("./icons/mirror_y.png"))
+        self.mirror_horizontal.setIcon(icons.icon("mirror_y"))
         self.mirror_horizontal.setIconSize(QSize(30,30))
         self.mirror_horizontal.setToolTip('Mirror Horizontal Axis')
         self.mirror_horizontal.clicked.connect(lambda: self.image_canvas.mirror_image("vertical"))
@@ -146,7 +281,7 @@ class PhotoEditorGUI(QMainWindow):
 
         # Create button for blurring the image
         self.blur_act  = QToolButton()
-        self.blur_act.setIcon(QIcon("./icons/blur.png"))
+        self.blur_act.setIcon(icons.icon("blur"))
         self.blur_act.setIconSize(QSize(30,30))
         self.blur_act.setToolTip("Blurring")
         self.blur_act.clicked.connect(lambda: self.apply_blur_effect())
@@ -154,35 +289,35 @@ class PhotoEditorGUI(QMainWindow):
         
         # Create button for converting image to black and white 
         self.convert_blackwhite_act = QToolButton()
-        self.convert_blackwhite_act.setIcon(QIcon("./icons/black_and_white.png"))
+        self.convert_blackwhite_act.setIcon(icons.icon("black_and_white"))
         self.convert_blackwhite_act.setIconSize(QSize(30,30))
         self.convert_blackwhite_act.setToolTip("Black and White")
         self.convert_blackwhite_act.clicked.connect(lambda: self.image_canvas.black_white_image())
         
         # Create button for applying pixelation to the image
         self.pixelation_act = QToolButton()
-        self.pixelation_act.setIcon(QIcon("./icons/pixelate.png"))
+        self.pixelation_act.setIcon(icons.icon("pixelate"))
         self.pixelation_act.setIconSize(QSize(30,30))
         self.pixelation_act.setToolTip("Pixelate")
         self.pixelation_act.clicked.connect(lambda: self.apply_pixelation_effect())
 
         # Create button for modifying contrast of the image
         self.contrast_act = QToolButton()
-        self.contrast_act.setIcon(QIcon("./icons/contrast.png"))
+        self.contrast_act.setIcon(icons.icon("contrast"))
         self.contrast_act.setIconSize(QSize(30,30))
         self.contrast_act.setToolTip("Contrast")
         self.contrast_act.clicked.connect(lambda: self.apply_contrast_effect())
         
         # Create button for applying sketch filter to the image
         self.sketch_act = QToolButton()
-        self.sketch_act.setIcon(QIcon("./icons/sketch.png"))
+        self.sketch_act.setIcon(icons.icon("sketch"))
         self.sketch_act.setIconSize(QSize(30,30))
         self.sketch_act.setToolTip("Sketch")
         self.sketch_act.clicked.connect(lambda: self.image_canvas.sketch_image())
         
         # Create button for inverting the colors of the image
         self.invert_act = QToolButton()
-        self.invert_act.setIcon(QIcon("./icons/invert.png"))
+        self.invert_act.setIcon(icons.icon("invert"))
         self.invert_act.setIconSize(QSize(30,30))
         self.invert_act.setToolTip("Invert")
         self.invert_act.clicked.connect(lambda: self.image_canvas.invert_colors_image())
@@ -203,7 +338,7 @@ class PhotoEditorGUI(QMainWindow):
 
         # Create button for the paintbrush
         self.paintbrush_act = QToolButton()
-        self.paintbrush_act.setIcon(QIcon("./icons/brush.png"))
+        self.paintbrush_act.setIcon(icons.icon("brush"))
         self.paintbrush_act.setIconSize(QSize(30,30))
         self.paintbrush_act.setToolTip("Toggle Paintbrush")
         self.paintbrush_act.clicked.connect(lambda: self.image_canvas.togglePaintbrush())
@@ -211,7 +346,7 @@ class PhotoEditorGUI(QMainWindow):
 
         # Create button for paintbrush color black
         self.color_black_act = QToolButton()
-        self.color_black_act.setIcon(QIcon("./icons/color_black.png"))
+        self.color_black_act.setIcon(icons.icon("color_black"))
         self.color_black_act.setIconSize(QSize(30,30))
         self.color_black_act.setToolTip("Black")
         self.color_black_act.clicked.connect(lambda: self.set_color("black"))
@@ -220,7 +355,7 @@ class PhotoEditorGUI(QMainWindow):
 
         # Create button for paintbrush color white
         self.color_white_act = QToolButton()
-        self.color_white_act.setIcon(QIcon("./icons/color_white.png"))
+        self.color_white_act.setIcon(icons.icon("color_white"))
         self.color_white_act.setIconSize(QSize(30,30))
         self.color_white_act.setToolTip("White")
         self.color_white_act.clicked.connect(lambda: self.set_color("white"))
@@ -228,7 +363,7 @@ class PhotoEditorGUI(QMainWindow):
         
         # Create button for paintbrush color red
         self.color_red_act = QToolButton()
-        self.color_red_act.setIcon(QIcon("./icons/color_red.png"))
+        self.color_red_act.setIcon(icons.icon("color_red"))
         self.color_red_act.setIconSize(QSize(30,30))
         self.color_red_act.setToolTip("Red")
         self.color_red_act.clicked.connect(lambda: self.set_color("red"))
@@ -236,7 +371,7 @@ class PhotoEditorGUI(QMainWindow):
         
         # Create button for paintbrush color blue
         self.color_blue_act = QToolButton()
-        self.color_blue_act.setIcon(QIcon("./icons/color_blue.png"))
+        self.color_blue_act.setIcon(icons.icon("color_blue"))
         self.color_blue_act.setIconSize(QSize(30,30))
         self.color_blue_act.setToolTip("Blue")
         self.color_blue_act.clicked.connect(lambda: self.set_color("blue"))
@@ -244,12 +379,27 @@ class PhotoEditorGUI(QMainWindow):
 
         # Create button for paintbrush color green
         self.color_green_act = QToolButton()
-        self.color_green_act.setIcon(QIcon("./icons/color_green.png"))
+        self.color_green_act.setIcon(icons.icon("color_green"))
         self.color_green_act.setIconSize(QSize(30,30))
         self.color_green_act.setToolTip("Black")
         self.color_green_act.clicked.connect(lambda: self.set_color("green"))
         self.color_green_act.setCheckable(True)
 
+        # Size and opacity of the paintbrush
+        self.brush_size_box = QSpinBox()
+        self.brush_size_box.setRange(1, brush.MAX_BRUSH_SIZE)
+        self.brush_size_box.setValue(self.image_canvas.brush.size)
+        self.brush_size_box.setSuffix(" px")
+        self.brush_size_box.setToolTip("Brush Size")
+        self.brush_size_box.valueChanged.connect(lambda size: setattr(self.image_canvas.brush, "size", size))
+
+        self.brush_opacity_box = QSpinBox()
+        self.brush_opacity_box.setRange(1, 100)
+        self.brush_opacity_box.setValue(round(self.image_canvas.brush.opacity * 100))
+        self.brush_opacity_box.setSuffix(" %")
+        self.brush_opacity_box.setToolTip("Brush Opacity")
+        self.brush_opacity_box.valueChanged.connect(lambda opacity: setattr(self.image_canvas.brush, "opacity", opacity / 100))
+
         # for fixing the coloring checking
         self.colors.extend([self.color_black_act,self.color_white_act,self.color_red_act,self.color_blue_act,self.color_green_act])
 
@@ -260,6 +410,30 @@ class PhotoEditorGUI(QMainWindow):
         painting_layout.addWidget(self.color_red_act)
         painting_layout.addWidget(self.color_blue_act)
         painting_layout.addWidget(self.color_green_act)
+        painting_layout.addWidget(self.brush_size_box)
+        painting_layout.addWidget(self.brush_opacity_box)
+
+        # Progress of the filter running in the background, with a button to cancel it
+        progress_layout = QHBoxLayout()
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setMaximumWidth(150)
+
+        self.cancel_act = QToolButton()
+        self.cancel_act.setIcon(icons.icon("close"))
+        self.cancel_act.setIconSize(QSize(30,30))
+        self.cancel_act.setToolTip("Cancel")
+        self.cancel_act.clicked.connect(lambda: self.image_canvas.cancel_background_work())
+
+        progress_layout.addWidget(self.progress_bar)
+        progress_layout.addWidget(self.cancel_act)
+        self.show_progress(False) # only visible while a filter is running
+
+        runner = self.image_canvas.runner
+        runner.progress_changed.connect(self.progress_bar.setValue)
+        runner.busy_changed.connect(self.show_progress)
+        runner.failed.connect(lambda message: self.image_canvas.errorMessage(message))
 
         # Create container widget to hold all toolbar layout
         container = QWidget()
@@ -267,6 +441,7 @@ class PhotoEditorGUI(QMainWindow):
         container_layout.addLayout(transformation_layout)
         container_layout.addLayout(filters_layout)
         container_layout.addLayout(painting_layout)
+        container_layout.addLayout(progress_layout)
 
         tool_bar.addWidget(container)
         
@@ -274,44 +449,186 @@ class PhotoEditorGUI(QMainWindow):
 
     '''
     This method creates a dialog button that allows the user to apply blurring
-    Allows the strength to be set in a integer range between 1 and 50
+    Allows the strength to be set in a integer range between 1 and 500, previewed live while dragging
     '''
     def apply_blur_effect(self):
         if self.image_canvas.image.isNull():
             self.image_canvas.errorMessage("no image to blur")
             return
-        blur_strength, ok_pressed = QInputDialog.getInt(self, "Set Blur Strength", 
-                                                        "Strength (min: 1 max: 50):", 5, 1, 50, 1)
+        blur_strength, ok_pressed = preview.FilterPreviewDialog.getInt(self, self.image_canvas, "Set Blur Strength",
+                                                               "Strength (min: 1 max: 500):", 5, 1, 500, preview.preview_blur)
         if ok_pressed:
             self.image_canvas.blur_image(blur_strength) 
 
     '''
     This method creates a dialog that allows the user to apply pixelation
-    Allows the pixel size to be set in a integer range between 1 and 100
+    Allows the pixel size to be set in a integer range between 1 and 100, previewed live while dragging
     '''
     def apply_pixelation_effect(self):
         if self.image_canvas.image.isNull():
             self.image_canvas.errorMessage("no image to pixelate")
             return
-        pixel_size, ok_pressed = QInputDialog.getInt(self, "Pixelate Image",
-                                                     "Pixel Size (min: 1 max: 100):", 10, 1, 100, 1)
+        pixel_size, ok_pressed = preview.FilterPreviewDialog.getInt(self, self.image_canvas, "Pixelate Image",
+                                                            "Pixel Size (min: 1 max: 100):", 10, 1, 100, preview.preview_pixelate)
         if ok_pressed:
             self.image_canvas.pixelate_image(pixel_size)
 
     '''
     This method creates a dialog that allows the user to apply contrast
-    Allows the contrast level to be set in a integer range between -255 and 255
+    Allows the contrast level to be set in a integer range between -255 and 255, previewed live while dragging
     '''
     def apply_contrast_effect(self):
         if self.image_canvas.image.isNull():
             self.image_canvas.errorMessage("no image to contrast")
             return
 
-        contrast_level, ok_pressed = QInputDialog.getInt(self, "Adjust Contrast",
-                                                         "Contrast Level (min: -255 max: 255):", 0, -255, 255, 1)
+        contrast_level, ok_pressed = preview.FilterPreviewDialog.getInt(self, self.image_canvas, "Adjust Contrast",
+                                                                "Contrast Level (min: -255 max: 255):", 0, -255, 255, preview.preview_contrast)
         if ok_pressed:
             self.image_canvas.adjust_contrast_image(contrast_level)
+
+    '''
+    This method creates a dialog that allows the user to change the brightness
+    Allows the brightness level to be set in a integer range between -255 and 255
+    '''
+    def apply_brightness_effect(self):
+        if self.image_canvas.image.isNull():
+            self.image_canvas.errorMessage("no image to brighten")
+            return
+
+        brightness_level, ok_pressed = preview.FilterPreviewDialog.getInt(self, self.image_canvas, "Adjust Brightness",
+                                                                  "Brightness Level (min: -255 max: 255):", 0, -255, 255, preview.preview_brightness)
+        if ok_pressed:
+            self.image_canvas.adjust_brightness_image(brightness_level)
+
+    '''
+    This method creates a dialog that allows the user to apply gamma correction
+    Allows gamma to be set in a range between 0.1 and 10.0
+    '''
+    def apply_gamma_effect(self):
+        if self.image_canvas.image.isNull():
+            self.image_canvas.errorMessage("no image to gamma correct")
+            return
+
+        gamma, ok_pressed = QInputDialog.getDouble(self, "Gamma Correction",
+                                                   "Gamma (min: 0.1 max: 10.0):", 1.0, 0.1, 10.0, 2)
+        if ok_pressed:
+            self.image_canvas.adjust_gamma_image(gamma)
+
+    '''
+    This method creates dialogs that allow the user to apply a levels adjustment
+    Asks for the black point and then the white point, both between 0 and 255
+    '''
+    def apply_levels_effect(self):
+        if self.image_canvas.image.isNull():
+            self.image_canvas.errorMessage("no image to adjust levels")
+            return
+
+        black_point, ok_pressed = QInputDialog.getInt(self, "Adjust Levels",
+                                                      "Black Point (min: 0 max: 254):", 0, 0, 254, 1)
+        if not ok_pressed:
+            return
+        white_point, ok_pressed = QInputDialog.getInt(self, "Adjust Levels",
+                                                      "White Point (min: %d max: 255):" % (black_point + 1), 255, black_point + 1, 255, 1)
+        if ok_pressed:
+            self.image_canvas.adjust_levels_image(black_point, white_point)
     
+    '''
+    This method applies an auto adjustment of the canvas (auto levels or auto contrast) to the image
+    '''
+    def apply_auto_adjustment(self, adjustment):
+        if self.image_canvas.image.isNull():
+            self.image_canvas.errorMessage("no image to adjust")
+            return
+        adjustment()
+
+    '''
+    This method zooms the canvas by factor, keeping the image point under anchor (a point of the canvas) in place
+    Without anchor the center of the visible area stays in place
+    '''
+    def zoom_canvas(self, factor, anchor=None):
+        canvas = self.image_canvas
+        if canvas.image.isNull():
+            return
+        viewport = self.scroll_area.viewport()
+        if anchor is None:
+            anchor = canvas.mapFrom(viewport, viewport.rect().center())
+        image_point = QPointF(anchor) / canvas.zoom
+        view_point = canvas.mapTo(viewport, anchor)
+
+        canvas.set_zoom(canvas.zoom * factor)
+
+        # scroll so the same image point is under the same point of the window
+        self.scroll_area.horizontalScrollBar().setValue(round(image_point.x() * canvas.zoom - view_point.x()))
+        self.scroll_area.verticalScrollBar().setValue(round(image_point.y() * canvas.zoom - view_point.y()))
+
+    '''
+    This method zooms the canvas so the whole image fits in the window
+    '''
+    def fit_canvas(self):
+        canvas = self.image_canvas
+        if canvas.image.isNull():
+            return
+        viewport = self.scroll_area.viewport().size()
+        canvas.set_zoom(min(viewport.width() / canvas.image.width(), viewport.height() / canvas.image.height()))
+
+    '''
+    This method shows the percentiles of the recorded operation timings in a dialog, with the counters of the result cache
+    '''
+    def show_trace_summary(self):
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Timings (ms)")
+        text = QPlainTextEdit((trace.tracer.format_summary() if trace.tracer.events else
+                               "Nothing recorded yet. Turn on 'Record Timings' in the 'Profile' menu and edit an image.")
+                              + "\n\n" + result_cache.results.format_stats())
+        text.setReadOnly(True)
+        text.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        text.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(text)
+        dialog.resize(800, 400)
+        dialog.exec()
+
+    '''
+    This method saves the recorded timings as a trace that Chrome (chrome://tracing) or Perfetto can open
+    '''
+    def export_trace(self):
+        trace_file, _ = QFileDialog.getSaveFileName(self, "Export Trace", "trace.json", "Trace Files (*.json)")
+        if trace_file:
+            try:
+                trace.tracer.export_chrome_trace(trace_file)
+            except OSError as error:
+                self.image_canvas.errorMessage("Cannot save trace: %s" % error)
+
+    '''
+    This method reports a file saved in the background on the status bar
+    '''
+    def show_saved(self, path, size, quality):
+        message = "Saved %s (%.1f KB" % (path, size / 1024)
+        if quality:
+            message += ", quality %d" % quality
+        self.statusBar().showMessage(message + ")", 10000)
+
+    '''
+    This method reports a project saved on the status bar, with how much of it had to be written
+    '''
+    def show_project_saved(self, path, written, size):
+        self.statusBar().showMessage("Saved project %s (%.1f KB written, %.1f MB in all)" % (path, written / 1024, size / 1024**2), 10000)
+
+    '''
+    This method waits for the files still being saved before the window closes
+    '''
+    def closeEvent(self, event):
+        self.image_canvas.saver.wait()
+        super().closeEvent(event)
+
+    '''
+    This method shows or hides the progress bar and cancel button of background filters
+    '''
+    def show_progress(self, busy):
+        self.progress_bar.setVisible(busy)
+        self.cancel_act.setVisible(busy)
+
     # adding colors acts
     def set_color(self,colorName):
         color = QColor(colorName)
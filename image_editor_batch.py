@@ -0,0 +1,148 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from PyQt6.QtGui import QImage
+import image_editor_core as core
+import image_editor_loader as loader
+
+'''
+This module is the headless batch processor of the image editor
+It applies a chain of operations from image_editor_core.py to every image of a directory,
+spreading the files over a pool of worker processes and writing results to an output directory
+
+Example:
+    python image_editor_batch.py ./photos ./out --ops "rotate:right,blur:5,contrast:40"
+'''
+
+# file types that are picked up from the input directory
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+'''
+This function lists the image files of input_dir as paths relative to it
+'''
+def find_images(input_dir, recursive=False):
+    images = []
+    for root, dirs, files in os.walk(input_dir):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                images.append(os.path.relpath(os.path.join(root, name), input_dir))
+        if not recursive:
+            break
+        dirs.sort()
+    return images
+
+'''
+This function runs when a worker process starts: the cores are shared between the workers, so the filters
+of each one cut the image into band_threads bands instead of one per core (see core.run_filter)
+'''
+def _start_worker(band_threads):
+    core.set_band_threads(band_threads)
+
+'''
+This function processes a single file; it runs inside a worker process
+task is a tuple (input_path, output_path, chain)
+Returns a tuple (input_path, error, bytes_read, bytes_written); error is None on success
+'''
+def process_file(task):
+    input_path, output_path, chain = task
+    try:
+        bytes_read = os.path.getsize(input_path)
+        # decoded upright, with the EXIF orientation of photos applied
+        try:
+            image = loader.read_image(input_path)
+        except ValueError:
+            return input_path, "cannot read image", bytes_read, 0
+
+        result = core.apply_chain(image, chain)
+
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        if not result.save(output_path):
+            return input_path, "cannot write %s" % output_path, bytes_read, 0
+        return input_path, None, bytes_read, os.path.getsize(output_path)
+    # keep the pool alive whatever goes wrong with one file
+    except Exception as error:
+        return input_path, str(error), 0, 0
+
+'''
+This function runs a chain over a list of files with a pool of worker processes
+Results are streamed back as each file finishes; report is called with every result
+Returns a dictionary of totals and throughput
+'''
+def run_batch(input_dir, output_dir, chain, workers=None, output_format=None, recursive=False, report=None):
+    tasks = []
+    for relative_path in find_images(input_dir, recursive):
+        output_path = os.path.join(output_dir, relative_path)
+        if output_format:
+            output_path = os.path.splitext(output_path)[0] + "." + output_format.lstrip(".")
+        tasks.append((os.path.join(input_dir, relative_path), output_path, chain))
+
+    workers = workers or os.cpu_count() or 1
+    processed, failed, bytes_read, bytes_written = 0, 0, 0, 0
+    start = time.perf_counter()
+    if tasks:
+        # small chunks keep all workers busy while results still stream back steadily
+        chunk_size = max(1, min(16, len(tasks) // (workers * 4)))
+        processes = min(workers, len(tasks))
+        band_threads = max(1, (os.cpu_count() or 1) // processes)
+        with multiprocessing.Pool(processes, initializer=_start_worker, initargs=(band_threads,)) as pool:
+            for result in pool.imap_unordered(process_file, tasks, chunksize=chunk_size):
+                input_path, error, read, written = result
+                if error is None:
+                    processed += 1
+                else:
+                    failed += 1
+                bytes_read += read
+                bytes_written += written
+                if report is not None:
+                    report(result)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "processed": processed,
+        "failed": failed,
+        "seconds": elapsed,
+        "bytes_read": bytes_read,
+        "bytes_written": bytes_written,
+        "images_per_second": processed / elapsed if elapsed > 0 else 0.0,
+        "megabytes_per_second": bytes_read / (1024 * 1024) / elapsed if elapsed > 0 else 0.0,
+    }
+
+'''
+This function prints one line per failed file so the batch can keep going
+'''
+def print_result(result):
+    input_path, error, _, _ = result
+    if error is not None:
+        print("skipped %s: %s" % (input_path, error), file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply a chain of Image Lab operations to a directory of images.")
+    parser.add_argument("input_dir", help="directory containing the images to process")
+    parser.add_argument("output_dir", help="directory where the processed images are written")
+    parser.add_argument("--ops", required=True,
+                        help='comma separated chain, e.g. "rotate:right,mirror:vertical,blur:5,pixelate:10,'
+                             'contrast:40,sketch,invert,grayscale,crop:left:top:width:height"')
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes (default: all cores)")
+    parser.add_argument("--format", dest="output_format", default=None, help="output file type, e.g. png or jpg")
+    parser.add_argument("--recursive", action="store_true", help="also process images in subdirectories")
+    args = parser.parse_args(argv)
+
+    try:
+        chain = core.parse_chain(args.ops)
+    except ValueError as error:
+        parser.error(str(error))
+    if not os.path.isdir(args.input_dir):
+        parser.error("input directory does not exist: %s" % args.input_dir)
+
+    totals = run_batch(args.input_dir, args.output_dir, chain, args.workers,
+                       args.output_format, args.recursive, report=print_result)
+
+    print("processed %d image(s), %d failed in %.2f s (%.2f images/s, %.2f MB/s)" % (
+        totals["processed"], totals["failed"], totals["seconds"],
+        totals["images_per_second"], totals["megabytes_per_second"]))
+    return 0 if totals["failed"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
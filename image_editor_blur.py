@@ -0,0 +1,143 @@
+import math
+import image_editor_lazy as lazy
+cv2 = lazy.module("cv2")
+
+'''
+This module is the blur engine of the image editor
+The blur strength is the size of a gaussian kernel, as it has always been. A true gaussian costs
+more per pixel the larger the kernel, so the engine picks the cheapest path that looks the same:
+    * gaussian - small kernels: the exact cv2.GaussianBlur, fastest while the kernel is small
+    * box - medium kernels: three box blurs in a row (the idea behind stack blur), which add up to
+      a very close approximation of the gaussian. A box blur costs the same whatever its size,
+      so this path takes the same time for any strength
+    * pyramid - large kernels: the image is reduced 2**levels times, box blurred with what is left
+      of the strength and enlarged back, so most of the work is done on a much smaller image
+How far each path is from the true gaussian depends on the image (see SMOOTH_ERROR and MAX_ERROR,
+measured with benchmarks/bench_blur.py): one or two levels (out of 255) on photos, but more where
+large black and white areas meet, as the sum of boxes and the resampling of the pyramid are not
+quite the shape of a gaussian across a sharp edge
+Every path mirrors the image at its borders as cv2.GaussianBlur does (cv2.BORDER_REFLECT_101)
+'''
+
+GAUSSIAN_MAX_SIGMA = 8.0 # the exact gaussian is used below this sigma (kernels up to 51 pixels)
+PYRAMID_SIGMA = 6.0 # the pyramid is reduced until sigma is between this and twice this at its smallest level
+MIN_PYRAMID_SIDE = 64 # the smallest level of the pyramid keeps at least this many pixels on its shorter side
+BOX_PASSES = 3
+
+# largest difference with the true gaussian, in levels out of 255: on smooth images such as photos, and on
+# any image, the worst being black and white squares about a quarter of the kernel wide (noise stays within 3)
+SMOOTH_ERROR = 2
+MAX_ERROR = {"gaussian": 0, "box": 7, "pyramid": 20}
+
+'''
+This function returns the sigma OpenCV gives a gaussian kernel of kernel_size pixels
+'''
+def kernel_sigma(kernel_size):
+    return 0.3 * ((kernel_size - 1) * 0.5 - 1) + 0.8
+
+'''
+This function returns the odd kernel size whose sigma (see kernel_sigma) is the closest to sigma
+'''
+def sigma_kernel_size(sigma):
+    return 2 * max(0, int(round((sigma - 0.8) / 0.3 + 1))) + 1
+
+'''
+This function returns the sizes of the box blurs whose succession is closest to a gaussian of sigma
+(W. Jarosz, "Fast Image Convolutions"): passes odd sizes, the smaller ones first
+'''
+def box_sizes(sigma, passes=BOX_PASSES):
+    ideal = math.sqrt(12 * sigma * sigma / passes + 1)
+    lower = int(ideal)
+    if lower % 2 == 0:
+        lower -= 1
+    upper = lower + 2
+    # number of boxes of the smaller size that give exactly the variance of the gaussian
+    smaller = round((12 * sigma * sigma - passes * lower * lower - 4 * passes * lower - 3 * passes) / (-4 * lower - 4))
+    return [lower if index < smaller else upper for index in range(passes)]
+
+'''
+This function box blurs an array passes times and returns the result as float32
+'''
+def box_blur(source, sigma):
+    sizes = box_sizes(sigma)
+    blurred = cv2.boxFilter(source, cv2.CV_32F, (sizes[0], sizes[0]), borderType=cv2.BORDER_REFLECT_101)
+    for size in sizes[1:]:
+        blurred = cv2.boxFilter(blurred, -1, (size, size), borderType=cv2.BORDER_REFLECT_101)
+    return blurred
+
+'''
+This class is how an image is blurred with a given strength: the path, and what it needs
+    halo - pixels of context needed around each output pixel
+    align - the regions of a tiled run must start on multiples of this (the pyramid blocks)
+image_size (a QSize), when given, keeps the pyramid levels large enough for the image
+'''
+class BlurPlan:
+
+    def __init__(self, blur_strength, image_size=None):
+        # the kernel size is odd
+        self.kernel_size = blur_strength if blur_strength % 2 == 1 else blur_strength + 1
+        self.sigma = kernel_sigma(self.kernel_size)
+        self.levels = 0
+        if self.sigma < GAUSSIAN_MAX_SIGMA:
+            self.path = "gaussian"
+            self.halo = self.kernel_size // 2
+        else:
+            self.levels = max(0, int(math.floor(math.log2(self.sigma / PYRAMID_SIGMA))))
+            if image_size is not None:
+                shorter_side = min(image_size.width(), image_size.height())
+                while self.levels > 0 and shorter_side >> self.levels < MIN_PYRAMID_SIDE:
+                    self.levels -= 1
+            self.path = "pyramid" if self.levels > 0 else "box"
+            # the boxes reach sum(size // 2) pixels, plus a block on each side for the reduction and enlargement
+            self.halo = self.scale * (sum(size // 2 for size in box_sizes(self.level_sigma())) + 2 * (self.levels > 0))
+        self.align = self.scale
+
+    @property
+    def scale(self):
+        return 1 << self.levels
+
+    '''
+    This method returns the sigma left to blur with at the smallest level of the pyramid
+    Reducing by averaging blocks and enlarging with linear interpolation blur the image too:
+    their variances, (scale**2 - 1) / 12 and scale**2 / 6, are taken off
+    '''
+    def level_sigma(self):
+        if self.levels == 0:
+            return self.sigma
+        scale = self.scale
+        variance = self.sigma ** 2 - (scale * scale - 1) / 12 - scale * scale / 6
+        return math.sqrt(max(variance, 0.25)) / scale
+
+    '''
+    This method blurs the array source into out, where offset = (row, column) is where out starts
+    inside source (the kernel of a TiledFilter, see image_editor_core)
+    '''
+    def blur(self, source, out, offset):
+        if self.path == "gaussian":
+            # writing straight into the output when there is no halo to cut off
+            if source.shape == out.shape:
+                cv2.GaussianBlur(source, (self.kernel_size, self.kernel_size), 0, dst=out, borderType=cv2.BORDER_REFLECT_101)
+            else:
+                blurred = cv2.GaussianBlur(source, (self.kernel_size, self.kernel_size), 0, borderType=cv2.BORDER_REFLECT_101)
+                out[...] = blurred[offset[0]:offset[0] + out.shape[0], offset[1]:offset[1] + out.shape[1]]
+            return
+
+        blurred = box_blur(source, self.sigma) if self.path == "box" else self.pyramid_blur(source)
+        # back to 8 bits, rounded (the values are never negative, so the absolute value changes nothing)
+        out[...] = cv2.convertScaleAbs(blurred[offset[0]:offset[0] + out.shape[0], offset[1]:offset[1] + out.shape[1]])
+
+    '''
+    This method blurs an array through the pyramid and returns the result as float32
+    '''
+    def pyramid_blur(self, source):
+        scale = self.scale
+        height, width = source.shape[:2]
+        # complete the last blocks by mirroring, so every block averages scale x scale pixels
+        pad_rows, pad_columns = -height % scale, -width % scale
+        if pad_rows or pad_columns:
+            source = cv2.copyMakeBorder(source, 0, pad_rows, 0, pad_columns, cv2.BORDER_REFLECT_101)
+        padded_height, padded_width = source.shape[:2]
+        small = cv2.resize(source, (padded_width // scale, padded_height // scale), interpolation=cv2.INTER_AREA)
+        small = box_blur(small, self.level_sigma())
+        blurred = cv2.resize(small, (padded_width, padded_height), interpolation=cv2.INTER_LINEAR)
+        return blurred[:height, :width]
@@ -0,0 +1,105 @@
+import math
+from PyQt6.QtCore import QRect
+from PyQt6.QtGui import QImage
+import image_editor_buffers as buffers
+import image_editor_lazy as lazy
+np = lazy.module("numpy")
+
+'''
+This module is the brush engine of the image editor
+A stroke is a polyline through the points the mouse went through, in image coordinates (pixel
+centers at x + 0.5, y + 0.5). Each segment of it is rasterized at once with numpy: how much of a
+pixel the round, anti-aliased tip covers on its way follows from the distance from the pixel center
+to the segment. The coverage of the whole stroke only grows, and the painted pixels are blended
+from what they were before the stroke with the coverage times the opacity, so a stroke crossing
+itself does not build up where it overlaps and the joints of its segments do not show.
+'''
+
+MAX_BRUSH_SIZE = 200
+
+'''
+This class holds the settings of the brush: its diameter in pixels and its opacity from 0 to 1
+'''
+class Brush:
+
+    def __init__(self, size=3, opacity=1.0):
+        self.size = size
+        self.opacity = opacity
+
+    @property
+    def radius(self):
+        return self.size / 2
+
+'''
+This function returns the part of the rectangle (left, top, width, height) that a round tip of radius
+covers going from start to end (x, y tuples), as a float32 array from 0 to 1
+'''
+def segment_coverage(start, end, radius, left, top, width, height):
+    xs = np.arange(left, left + width, dtype=np.float32)[None, :] + 0.5 - start[0]
+    ys = np.arange(top, top + height, dtype=np.float32)[:, None] + 0.5 - start[1]
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    length2 = dx * dx + dy * dy
+    if length2 == 0:
+        distance = np.sqrt(xs * xs + ys * ys)
+    else:
+        # the point of the segment closest to each pixel center
+        along = np.clip((xs * dx + ys * dy) / length2, 0, 1)
+        distance = np.sqrt((xs - along * dx) ** 2 + (ys - along * dy) ** 2)
+    # a pixel half inside the edge of the tip is half covered
+    return np.clip(radius + 0.5 - distance, 0, 1, out=distance)
+
+'''
+This class paints one stroke of a brush on an image, in place
+recorder is the history.StrokeRecorder of the stroke: it keeps the pixels as they were before,
+which the stroke is blended from
+'''
+class BrushStroke:
+
+    def __init__(self, brush, color, image, recorder):
+        self.radius = brush.radius
+        self.weight = int(round(brush.opacity * 255))
+        self.recorder = recorder
+        if image.format() == QImage.Format.Format_Grayscale8:
+            self.color = np.uint16(color.red())
+        else:
+            self.color = np.array([color.blue(), color.green(), color.red(), 255], dtype=np.uint16)
+        # untouched parts of the mask cost no memory: the pages of zeros are only mapped when written
+        self.coverage = np.zeros((image.height(), image.width()), dtype=np.uint8)
+
+    '''
+    This method returns the rectangle of the image the segment from start to end may change
+    '''
+    def segment_rect(self, start, end):
+        reach = self.radius + 1
+        left, top = math.floor(min(start[0], end[0]) - reach), math.floor(min(start[1], end[1]) - reach)
+        right, bottom = math.ceil(max(start[0], end[0]) + reach), math.ceil(max(start[1], end[1]) + reach)
+        height, width = self.coverage.shape
+        left, top = max(left, 0), max(top, 0)
+        return QRect(left, top, min(right, width) - left, min(bottom, height) - top)
+
+    '''
+    This method paints the polyline through points (x, y tuples) on image, a single point being a dab of the tip
+    Returns the rectangles of the image that changed, one per segment
+    '''
+    def paint(self, image, points):
+        segments = list(zip(points[:-1], points[1:])) if len(points) > 1 else [(points[0], points[0])]
+        array = buffers.image_to_array(image, writable=True)
+        changed = []
+        for start, end in segments:
+            rect = self.segment_rect(start, end)
+            if rect.isEmpty():
+                continue
+            top, left, height, width = rect.top(), rect.left(), rect.height(), rect.width()
+            coverage = segment_coverage(start, end, self.radius, left, top, width, height)
+            mask = self.coverage[top:top + height, left:left + width]
+            np.maximum(mask, (coverage * 255 + 0.5).astype(np.uint8), out=mask)
+
+            # the recorder must keep the pixels before they are painted on
+            self.recorder.touch(image, rect)
+            original = self.recorder.original(rect).astype(np.uint16)
+            weight = (mask.astype(np.uint16) * self.weight + 127) // 255
+            if array.ndim == 3:
+                weight = weight[:, :, None]
+            array[top:top + height, left:left + width] = (original * (255 - weight) + self.color * weight + 127) // 255
+            changed.append(rect)
+        return changed
@@ -0,0 +1,156 @@
+from PyQt6.QtGui import QImage
+import image_editor_lazy as lazy
+np = lazy.module("numpy")
+
+'''
+This module is the bridge between QImage and numpy used by every filter of the image editor
+Pixels are exposed as numpy views over the memory Qt owns, so nothing is copied when the image
+is already in the format a filter needs, and results are written straight into a QImage
+allocated by Qt (through the dst arguments of OpenCV) instead of wrapping a temporary array.
+The views keep their QImage alive, so the memory can never be freed while an array points at it.
+
+Every full frame buffer created through the bridge is recorded by the allocation counter,
+which makes it easy to check how many copies an operation makes:
+
+    buffers.allocations.reset()
+    core.blur(image, 5)
+    print(buffers.allocations.count, buffers.allocations.bytes)
+'''
+
+# formats with 4 bytes per pixel in (blue, green, red, alpha) byte order
+FOUR_CHANNEL_FORMATS = (QImage.Format.Format_RGB32, QImage.Format.Format_ARGB32)
+# formats the editor keeps its images in, all of them can be viewed as numpy arrays
+EDITABLE_FORMATS = (QImage.Format.Format_Grayscale8,) + FOUR_CHANNEL_FORMATS
+
+'''
+This class counts the frame buffers allocated by the bridge and their total size in bytes
+'''
+class AllocationCounter:
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.bytes = 0
+
+    def record(self, nbytes):
+        self.count += 1
+        self.bytes += nbytes
+
+# counter shared by all filters
+allocations = AllocationCounter()
+
+'''
+This class exposes the pixels of a QImage through the numpy array interface
+numpy keeps the holder (and with it the QImage) alive as the base of the array
+'''
+class _ImageBuffer:
+
+    def __init__(self, image, writable):
+        self.image = image
+        if writable:
+            before = int(image.constBits())
+            ptr = image.bits() # detaches the image if its pixels are shared with another QImage
+            if int(ptr) != before:
+                allocations.record(image.sizeInBytes())
+        else:
+            ptr = image.constBits()
+
+        height, width = image.height(), image.width()
+        if channel_count(image) == 1:
+            shape, strides = (height, width), (image.bytesPerLine(), 1)
+        else:
+            shape, strides = (height, width, 4), (image.bytesPerLine(), 4, 1)
+
+        self.__array_interface__ = {
+            "version": 3,
+            "shape": shape,
+            "typestr": "|u1",
+            "data": (int(ptr), not writable),
+            "strides": strides,
+        }
+
+'''
+This function returns the number of channels of the numpy view of an image (1 or 4)
+'''
+def channel_count(image):
+    if image.format() == QImage.Format.Format_Grayscale8:
+        return 1
+    if image.format() in FOUR_CHANNEL_FORMATS:
+        return 4
+    raise ValueError("unsupported image format for numpy view: %s" % image.format().name)
+
+'''
+This function exposes a QImage as a numpy array without copying
+Grayscale8 images give (height, width) arrays and 32 bit images (height, width, 4) arrays
+in (blue, green, red, alpha) order. Rows may be padded, so the array can be non contiguous
+A writable view of an image that shares its pixels detaches it first (recorded as an allocation)
+'''
+def image_to_array(image, writable=False):
+    return np.asarray(_ImageBuffer(image, writable))
+
+'''
+This function returns the image in one of the given formats
+The image itself is returned (no copy) when it already has one of them,
+otherwise it is converted to the first format and the conversion is recorded
+'''
+def as_format(image, *formats):
+    if image.format() in formats:
+        return image
+    converted = image.convertToFormat(formats[0])
+    allocations.record(converted.sizeInBytes())
+    return converted
+
+'''
+This function returns the 32 bit format filters work in for this image:
+ARGB32 when it has an alpha channel, RGB32 otherwise
+'''
+def color_format(image):
+    if image.format() in FOUR_CHANNEL_FORMATS:
+        return image.format()
+    return QImage.Format.Format_ARGB32 if image.hasAlphaChannel() else QImage.Format.Format_RGB32
+
+'''
+This function returns the image in a format that can be viewed as a numpy array
+Grayscale and 32 bit images are kept as they are, anything else is converted to a 32 bit format
+'''
+def as_editable(image):
+    if image.isNull() or image.format() in EDITABLE_FORMATS:
+        return image
+    return as_format(image, color_format(image))
+
+'''
+This function allocates a new QImage owned by Qt and returns it with a writable numpy view
+Filters write their output into the view (e.g. with the dst argument of OpenCV functions)
+'''
+def new_image(width, height, image_format):
+    image = QImage(width, height, image_format)
+    if image.isNull():
+        raise MemoryError("cannot allocate a %dx%d image" % (width, height))
+    allocations.record(image.sizeInBytes())
+    return image, image_to_array(image, writable=True)
+
+'''
+This function allocates a new QImage with the size and format of another one
+'''
+def new_image_like(image):
+    return new_image(image.width(), image.height(), image.format())
+
+'''
+This function allocates a scratch numpy array for intermediate results of a filter
+'''
+def new_array(shape):
+    array = np.empty(shape, dtype=np.uint8)
+    allocations.record(array.nbytes)
+    return array
+
+'''
+This function copies an array that does not belong to Qt into a new QImage
+Used only when a result cannot be written into a Qt buffer directly
+'''
+def array_to_image(array, image_format):
+    height, width = array.shape[:2]
+    image, view = new_image(width, height, image_format)
+    view[...] = array
+    return image
@@ -0,0 +1,183 @@
+import hashlib
+import itertools
+import os
+import threading
+from collections import OrderedDict
+from PyQt6.QtGui import QImage
+import image_editor_buffers as buffers
+import image_editor_trace as trace
+
+'''
+This module is the memoizing cache of the image editor
+Results are kept by what they are computed from: the fingerprint of the input image, the
+operation and its parameters, so applying the same filter to the same pixels again (after a
+revert, or on the same file opened again) is a lookup instead of a computation. The cache holds
+final results (the steps of the edit graph, see image_editor_graph) and intermediates filters
+can reuse (e.g. the grayscale and blurred planes of the sketch), all within a byte budget,
+dropping the least recently used entries first. Hits and misses are counted to tune the budget.
+
+A fingerprint names the content of an image:
+    * images entering the editor (opened files) are hashed once, on the thread loading them
+    * results of operations are named after what they come from (derive), without hashing
+    * images changed outside of the cache's knowledge (painted on) get a name of their own
+      (mark_unique): nothing is ever found for them, but nothing is hashed either
+Equal fingerprints always mean equal pixels; equal pixels may have different fingerprints.
+
+The budget is 512 MB, or IMAGE_LAB_CACHE_MB megabytes when that environment variable is set.
+'''
+
+CACHE_BUDGET = int(os.environ.get("IMAGE_LAB_CACHE_MB", 512)) * 1024 * 1024
+MAX_FINGERPRINTS = 4096 # images whose fingerprint is remembered
+
+'''
+This function returns the memory used by a cached value: a QImage, a numpy array or a tuple of them
+'''
+def _nbytes(value):
+    if isinstance(value, QImage):
+        return value.sizeInBytes()
+    if isinstance(value, tuple):
+        return sum(_nbytes(item) for item in value)
+    return getattr(value, "nbytes", 0)
+
+'''
+This class keeps values by key, dropping the least recently used ones beyond byte_budget
+It is shared by the GUI thread and the worker threads
+'''
+class ResultCache:
+
+    def __init__(self, byte_budget=CACHE_BUDGET):
+        self.byte_budget = byte_budget
+        self.results = OrderedDict() # key: value, least recently used first
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.results.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.results.move_to_end(key)
+            return value
+
+    '''
+    This method tells if a value is kept for key, without counting a hit or a miss
+    '''
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.results
+
+    def put(self, key, value):
+        with self.lock:
+            if key in self.results:
+                self.nbytes -= _nbytes(self.results.pop(key))
+            self.results[key] = value
+            self.nbytes += _nbytes(value)
+            # the newest value is always kept, even when it is larger than the budget on its own
+            while self.nbytes > self.byte_budget and len(self.results) > 1:
+                _, dropped = self.results.popitem(last=False)
+                self.nbytes -= _nbytes(dropped)
+                self.evictions += 1
+
+    '''
+    This method drops every cached image sharing its pixels with image
+    so the image can be modified in place without Qt copying it first
+    '''
+    def forget(self, image):
+        with self.lock:
+            for key in [key for key, cached in self.results.items()
+                        if isinstance(cached, QImage) and cached.cacheKey() == image.cacheKey()]:
+                self.nbytes -= _nbytes(self.results.pop(key))
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+            self.nbytes = 0
+
+    def reset_counters(self):
+        with self.lock:
+            self.hits = self.misses = self.evictions = 0
+
+    '''
+    This method returns the counters of the cache: hits, misses, hit rate, evictions, entries, bytes used and budget
+    '''
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self.results),
+                "bytes": self.nbytes,
+                "budget": self.byte_budget,
+            }
+
+    def format_stats(self):
+        stats = self.stats()
+        return ("result cache: %d hits, %d misses (%.0f%% hit rate), %d evicted, %d entries, %.1f of %.0f MB" %
+                (stats["hits"], stats["misses"], stats["hit_rate"] * 100, stats["evictions"], stats["entries"],
+                 stats["bytes"] / 2**20, stats["budget"] / 2**20))
+
+# cache shared by the whole editor
+results = ResultCache()
+
+_fingerprints = OrderedDict() # QImage.cacheKey(): fingerprint; a cacheKey changes whenever the pixels do
+_fingerprints_lock = threading.Lock()
+_unique = itertools.count()
+
+'''
+This function returns the fingerprint of an image, hashing its pixels if it is not known yet
+'''
+def fingerprint(image):
+    known = known_fingerprint(image)
+    if known is not None:
+        return known
+    with trace.span("fingerprint", image):
+        digest = hashlib.sha256(("%d %d %d\n" % (image.width(), image.height(), image.format().value)).encode())
+        if not image.isNull():
+            # row by row: the padding at the end of the rows is not part of the image
+            pixels = buffers.image_to_array(image)
+            if pixels.flags.c_contiguous:
+                digest.update(memoryview(pixels).cast("B"))
+            else:
+                for row in pixels:
+                    digest.update(row.tobytes())
+    return derive(image, ("sha256", digest.hexdigest()))
+
+'''
+This function returns the fingerprint of an image if it is known without hashing, otherwise None
+'''
+def known_fingerprint(image):
+    with _fingerprints_lock:
+        value = _fingerprints.get(image.cacheKey())
+        if value is not None:
+            _fingerprints.move_to_end(image.cacheKey())
+        return value
+
+'''
+This function records that the content of image is named value, e.g. (fingerprint of the input, operations),
+and returns value
+'''
+def derive(image, value):
+    with _fingerprints_lock:
+        _fingerprints[image.cacheKey()] = value
+        _fingerprints.move_to_end(image.cacheKey())
+        while len(_fingerprints) > MAX_FINGERPRINTS:
+            _fingerprints.popitem(last=False)
+    return value
+
+'''
+This function gives image a fingerprint of its own if it has none, without hashing it
+Used for images changed by the editor outside of any operation (e.g. painted on)
+'''
+def mark_unique(image):
+    known = known_fingerprint(image)
+    if known is not None:
+        return known
+    return derive(image, ("unique", next(_unique)))
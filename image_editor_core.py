@@ -0,0 +1,759 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+from PyQt6.QtCore import QRect
+from PyQt6.QtGui import QImage
+import image_editor_blur as blur_engine
+import image_editor_buffers as buffers
+import image_editor_cache as result_cache
+import image_editor_lazy as lazy
+import image_editor_point_ops as point_ops
+import image_editor_stats as stats
+import image_editor_trace as trace
+cv2 = lazy.module("cv2")
+np = lazy.module("numpy")
+
+'''
+This module holds the image processing core of the image editor
+Every function takes a QImage and returns a new QImage without touching any widget,
+and accepts an optional progress callback (see run_filter),
+so the same filters can be used by the editor window (image_editor_functions.py)
+and by headless tools such as the batch processor (image_editor_batch.py)
+Has the same categories of features as the editor:
+    * Transformations
+    * Filters/Effects
+    * Point operations (see image_editor_point_ops.py)
+'''
+
+'''
+This class is one of the eight orientations 90 degree rotations and mirroring can give an image
+The image is mirrored horizontally first when flipped, then rotated turns times to the right.
+Any sequence of rotations and mirrors composes into a single orientation, which is applied
+as one exact permutation of the pixels: no resampling, whatever the number of steps
+'''
+class Orientation:
+
+    def __init__(self, turns=0, flipped=False):
+        self.turns = turns % 4
+        self.flipped = flipped
+
+    '''
+    This method returns the orientation of doing this one, then rotating ("left", "right")
+    or mirroring ("horizontal", "vertical")
+    '''
+    def then(self, operation, argument):
+        if operation == "rotate":
+            if argument == "right":
+                return Orientation(self.turns + 1, self.flipped)
+            if argument == "left":
+                return Orientation(self.turns - 1, self.flipped)
+            raise ValueError("unknown rotation direction: %s" % argument)
+        if operation == "mirror":
+            # mirroring after turning right is the same as mirroring first and turning left;
+            # a vertical mirror is a horizontal one followed by a half turn
+            if argument == "horizontal":
+                return Orientation(-self.turns, not self.flipped)
+            if argument == "vertical":
+                return Orientation(2 - self.turns, not self.flipped)
+            raise ValueError("unknown mirror axis: %s" % argument)
+        raise ValueError("unknown transformation: %s" % operation)
+
+    def inverse(self):
+        return Orientation(self.turns if self.flipped else -self.turns, self.flipped)
+
+    def is_identity(self):
+        return self.turns == 0 and not self.flipped
+
+    def __eq__(self, other):
+        return isinstance(other, Orientation) and (self.turns, self.flipped) == (other.turns, other.flipped)
+
+    def __hash__(self):
+        return hash((self.turns, self.flipped))
+
+    def __repr__(self):
+        return "Orientation(turns=%d, flipped=%s)" % (self.turns, self.flipped)
+
+    '''
+    This method returns a view of the array in this orientation (nothing is copied)
+    '''
+    def apply_to_array(self, array):
+        if self.flipped:
+            array = array[:, ::-1]
+        return np.rot90(array, -self.turns)
+
+    '''
+    This method returns the image in this orientation, moving every pixel once
+    '''
+    def apply(self, image, progress=None):
+        image = buffers.as_editable(image)
+        if self.is_identity():
+            return image
+        source = buffers.image_to_array(image)
+        height, width = source.shape[:2] if self.turns % 2 == 0 else source.shape[1::-1]
+        result, out = buffers.new_image(width, height, image.format())
+        # each of the eight orientations is a single OpenCV pass, except the anti-transpose
+        if not self.flipped and self.turns == 1:
+            cv2.rotate(source, cv2.ROTATE_90_CLOCKWISE, dst=out)
+        elif not self.flipped and self.turns == 2:
+            cv2.flip(source, -1, dst=out)
+        elif not self.flipped and self.turns == 3:
+            cv2.rotate(source, cv2.ROTATE_90_COUNTERCLOCKWISE, dst=out)
+        elif self.turns == 0:
+            cv2.flip(source, 1, dst=out)
+        elif self.turns == 2:
+            cv2.flip(source, 0, dst=out)
+        elif self.turns == 3:
+            cv2.transpose(source, dst=out)
+        else:
+            cv2.transpose(source, dst=out)
+            cv2.flip(out, -1, dst=out)
+        return result
+
+    '''
+    This method returns where the rectangle (top, left, height, width) of an image of the
+    given size ends up in this orientation, as (top, left, height, width)
+    '''
+    def map_rect(self, top, left, height, width, image_height, image_width):
+        if self.flipped:
+            left = image_width - left - width
+        for _ in range(self.turns):
+            # a quarter turn to the right: columns become rows, the last row becomes the first column
+            top, left, height, width = left, image_height - top - height, width, height
+            image_height, image_width = image_width, image_height
+        return top, left, height, width
+
+'''
+This function rotates the image by 90 degrees to the left or right
+'''
+def rotate(image, direction, progress=None):
+    return Orientation().then("rotate", direction).apply(image)
+
+'''
+This function mirrors or flips the image along a given axis
+"horizontal" mirrors over the x-axis, "vertical" mirrors over the y-axis
+'''
+def mirror(image, axis, progress=None):
+    return Orientation().then("mirror", axis).apply(image)
+
+'''
+This function returns the part of a rectangle inside an image of the given size, as a QRect
+Raises ValueError when nothing of it is inside
+'''
+def crop_rect(left, top, width, height, image_width, image_height):
+    rect = QRect(left, top, width, height).intersected(QRect(0, 0, image_width, image_height))
+    if rect.isEmpty():
+        raise ValueError("the crop rectangle is outside the image")
+    return rect
+
+'''
+This function crops the image to the rectangle of width x height pixels at (left, top)
+Only the pixels of the rectangle are copied, so every later edit works on the smaller image
+'''
+def crop(image, left, top, width, height, progress=None):
+    rect = crop_rect(left, top, width, height, image.width(), image.height())
+    cropped = image.copy(rect)
+    buffers.allocations.record(cropped.sizeInBytes())
+    return buffers.as_editable(cropped)
+
+'''
+This exception is raised by a progress callback to stop a filter before it finishes
+'''
+class OperationCancelled(Exception):
+    pass
+
+'''
+This class describes a filter that computes each output pixel from a neighbourhood of input pixels,
+so it can be run over the whole image at once or over bands and tiles of it:
+    kernel(source, out, offset) fills the array out from the array source, where source extends
+    out by up to halo pixels on every side and offset = (row, column) is where out starts inside source
+    halo is the number of pixels of context the kernel needs around each output pixel
+    align makes band and tile boundaries fall on multiples of it (e.g. pixelate blocks)
+    source_format(image) gives the format the input is converted to (no copy if it already has it)
+    output_format(source) gives the format of the result
+    parallel lets run_filter work on several bands at once, for kernels that release the GIL
+    (OpenCV calls, numpy copies and arithmetic on whole arrays)
+'''
+class TiledFilter:
+
+    def __init__(self, kernel, halo=0, align=1, source_format=None, output_format=None, parallel=False):
+        self.kernel = kernel
+        self.halo = halo
+        self.align = align
+        self.parallel = parallel
+        self.source_format = source_format or buffers.color_format
+        self.output_format = output_format or (lambda source: source.format())
+
+    '''
+    This method returns the input image in the format the kernel works on
+    '''
+    def prepare(self, image):
+        source_format = self.source_format(image)
+        if image.format() == source_format:
+            return image
+        with trace.span("convertToFormat", image):
+            return buffers.as_format(image, source_format)
+
+    '''
+    This method runs the kernel on the rectangle (top, left, height, width) of the source array
+    and writes it to the same rectangle of out, reading the halo around it where the image has one
+    '''
+    def run_region(self, source, out, top, left, height, width):
+        source_top, source_left = max(top - self.halo, 0), max(left - self.halo, 0)
+        source_bottom = min(top + height + self.halo, source.shape[0])
+        source_right = min(left + width + self.halo, source.shape[1])
+        self.kernel(source[source_top:source_bottom, source_left:source_right],
+                    out[top:top + height, left:left + width],
+                    (top - source_top, left - source_left))
+
+BAND_THREADS = os.cpu_count() or 1 # threads running the bands of parallel filters
+_band_pool = None
+
+'''
+This function returns the thread pool shared by the parallel filters, created when first needed
+The threads work on the pixels of the images themselves: a band is given to a thread as its rows,
+nothing is copied or pickled, and each thread writes its rows of the result where they belong
+'''
+def band_pool():
+    global _band_pool
+    if _band_pool is None:
+        _band_pool = ThreadPoolExecutor(BAND_THREADS, thread_name_prefix="filter-band")
+    return _band_pool
+
+'''
+This function sets the number of threads running the bands of parallel filters (1 runs them one after the other)
+The pool is made again with the new number when next needed, once the bands it runs are done
+'''
+def set_band_threads(threads):
+    global BAND_THREADS, _band_pool
+    if threads < 1:
+        raise ValueError("at least one thread is needed")
+    BAND_THREADS = threads
+    if _band_pool is not None:
+        _band_pool.shutdown(wait=True)
+        _band_pool = None
+
+'''
+This function runs a TiledFilter on an image and returns the result as a new QImage
+Without progress the whole image is processed in one call. With progress, it is processed
+in bands of rows and progress(fraction) is called after each band; progress may raise
+OperationCancelled to stop the filter
+Parallel filters are always processed in bands, BAND_THREADS of them at a time
+The result is the same whichever way the image is cut: each band reads the halo around it from the source
+and writes only its own rows of the result
+'''
+def run_filter(image, tiled_filter, progress=None, band_rows=None):
+    source_image = tiled_filter.prepare(image)
+    source = buffers.image_to_array(source_image)
+    result, out = buffers.new_image(source_image.width(), source_image.height(),
+                                    tiled_filter.output_format(source_image))
+    height, width = source.shape[:2]
+    parallel = tiled_filter.parallel and BAND_THREADS > 1
+
+    if progress is None and band_rows is None and not parallel:
+        with trace.span("kernel", source_image):
+            tiled_filter.run_region(source, out, 0, 0, height, width)
+        return result
+
+    def run_band(top, rows):
+        with trace.span("kernel", source_image):
+            tiled_filter.run_region(source, out, top, 0, rows, width)
+
+    run_bands(height, run_band, progress, parallel, band_rows, tiled_filter.align, tiled_filter.halo)
+    return result
+
+'''
+This function runs run_band(top, rows) over the bands of rows of an image of height rows,
+on the band threads when parallel, and calls progress(fraction) after each band (see run_filter)
+The bands are about 32, never thinner than 64 rows nor than the halo read on each side,
+and their height is a multiple of align unless band_rows is given
+'''
+def run_bands(height, run_band, progress=None, parallel=True, band_rows=None, align=1, halo=0):
+    band_rows = band_rows or max(64, -(-height // 32), 2 * halo)
+    band_rows = max(align, band_rows - band_rows % align)
+    bands = range(0, height, band_rows)
+
+    if not parallel or BAND_THREADS == 1 or len(bands) == 1:
+        for top in bands:
+            run_band(top, min(band_rows, height - top))
+            if progress is not None:
+                progress(min(top + band_rows, height) / height)
+        return
+
+    # progress is still reported (and may cancel) on this thread, band after band
+    futures = [band_pool().submit(run_band, top, min(band_rows, height - top)) for top in bands]
+    try:
+        for top, future in zip(bands, futures):
+            future.result()
+            if progress is not None:
+                progress(min(top + band_rows, height) / height)
+    finally:
+        # bands still running write into out: they must be done before the result can be dropped
+        for future in futures:
+            future.cancel()
+        wait(futures)
+
+'''
+This function returns the format a filter works in when it treats every channel alike:
+grayscale images stay at one byte per pixel, anything else is converted to a 32 bit format
+'''
+def _gray_or_color_format(image):
+    if image.format() == QImage.Format.Format_Grayscale8:
+        return QImage.Format.Format_Grayscale8
+    return buffers.color_format(image)
+
+'''
+This function returns the TiledFilter of a gaussian blur
+blur_strength is of type (int), used as the kernel size (rounded up to an odd number)
+image_size (QSize) lets the engine choose the path that suits the image, see image_editor_blur
+'''
+# conceptualization drawn from reference: https://datacarpentry.org/image-processing/06-blurring.html#gaussian-blur
+def blur_filter(blur_strength, image_size=None):
+    plan = blur_engine.BlurPlan(blur_strength, image_size)
+
+    # every channel is blurred alike, so grayscale images are blurred as they are
+    return TiledFilter(plan.blur, halo=plan.halo, align=plan.align, source_format=_gray_or_color_format, parallel=True)
+
+'''
+This function applies a gaussian blur to the image
+Its cost hardly grows with the strength: large kernels are approximated, see image_editor_blur
+'''
+def blur(image, blur_strength, progress=None):
+    return run_filter(image, blur_filter(blur_strength, image.size()), progress)
+
+'''
+This function converts the image to grayscale to achieve black/white effect
+'''
+def grayscale(image, progress=None):
+    return image.convertToFormat(QImage.Format.Format_Grayscale8)
+
+'''
+This function returns the TiledFilter of the pixelation (mosaic) effect
+Every pixel_size x pixel_size block takes the color of the pixel at its center
+(the last row and column of blocks may be smaller than pixel_size)
+'''
+# reference for conceptualization: https://stackoverflow.com/questions/47143332/how-to-pixelate-a-square-image-to-256-big-pixels-with-python
+def pixelate_filter(pixel_size):
+    if pixel_size <= 0:
+        raise ValueError("pixel size must be positive")
+
+    def kernel(source, out, offset):
+        # regions are aligned on the blocks and have no halo, so source and out cover the same pixels
+        height, width = source.shape[:2]
+        rows = np.minimum(np.arange(0, height, pixel_size) + pixel_size // 2, height - 1)
+        columns = np.minimum(np.arange(0, width, pixel_size) + pixel_size // 2, width - 1)
+        _fill_blocks(out, source[rows][:, columns], pixel_size)
+
+    # bands start on a block, so each one finds the same centers as the whole image
+    return TiledFilter(kernel, align=pixel_size, source_format=_gray_or_color_format, parallel=True)
+
+'''
+This function pixelates an image to achieve a mosaic effect
+pixel_size is of type (int), the side of each mosaic block
+'''
+def pixelate(image, pixel_size, progress=None):
+    return run_filter(image, pixelate_filter(pixel_size), progress)
+
+'''
+This function fills out with blocks of block_size pixels, each one of the color of a pixel of small
+Full blocks are written with one broadcast assignment, the partial blocks of the
+right and bottom edges with one more each
+'''
+def _fill_blocks(out, small, block_size):
+    height, width = out.shape[:2]
+    full_rows, full_columns = height // block_size, width // block_size
+    channels = out.shape[2:]
+
+    # (first pixel, number of blocks, block size) of the full blocks and of the partial edge block
+    row_spans = ((0, full_rows, block_size), (full_rows*block_size, 1, height % block_size))
+    column_spans = ((0, full_columns, block_size), (full_columns*block_size, 1, width % block_size))
+    for row_index, (row_start, row_count, row_size) in enumerate(row_spans):
+        for column_index, (column_start, column_count, column_size) in enumerate(column_spans):
+            if row_count*row_size == 0 or column_count*column_size == 0:
+                continue
+            region = out[row_start:row_start + row_count*row_size, column_start:column_start + column_count*column_size]
+            # view the region as (block rows, rows per block, block columns, columns per block, channels)
+            blocks = region.reshape((row_count, row_size, column_count, column_size) + channels)
+            first_row, first_column = row_index*full_rows, column_index*full_columns
+            colors = small[first_row:first_row + row_count, first_column:first_column + column_count]
+            blocks[...] = colors.reshape((row_count, 1, column_count, 1) + channels)
+
+'''
+This function returns the format the sketch reads: grayscale images as they are, other images as opaque 32 bit
+'''
+def _sketch_format(image):
+    if image.format() == QImage.Format.Format_Grayscale8 or image.format() in buffers.FOUR_CHANNEL_FORMATS:
+        return image.format()
+    return QImage.Format.Format_RGB32
+
+'''
+This function returns the TiledFilter of the sketch/pencil drawing effect
+The result is a grayscale image
+'''
+# reference algorithm: https://www.askpython.com/python/examples/images-to-pencil-sketch
+def sketch_filter():
+
+    def kernel(source, out, offset):
+        height, width = source.shape[:2]
+        # Convert RGB to grayscale; a grayscale image already is (the conversion would give the same values)
+        gray_image = source if source.ndim == 2 else cv2.cvtColor(source, cv2.COLOR_RGB2GRAY, dst=buffers.new_array((height, width)))
+
+        #Invert the gray image, blur it and invert the blurred image, all in one scratch buffer
+        inverted_blur = cv2.bitwise_not(gray_image, dst=buffers.new_array((height, width)))
+        cv2.GaussianBlur(inverted_blur, (21, 21), 0, dst=inverted_blur)
+        cv2.bitwise_not(inverted_blur, dst=inverted_blur)
+
+        # Calculate the DodgeV2 operation on the output region only, straight into the output
+        inner = (slice(offset[0], offset[0] + out.shape[0]), slice(offset[1], offset[1] + out.shape[1]))
+        cv2.divide(gray_image[inner], inverted_blur[inner], dst=out, scale=256.0)
+
+    # Convert QImage to format (BGR) unless it is grayscale, the 21x21 blur needs 10 pixels of context
+    return TiledFilter(kernel, halo=10, source_format=_sketch_format,
+                       output_format=lambda source: QImage.Format.Format_Grayscale8, parallel=True)
+
+'''
+This function returns the two planes the sketch effect divides, as grayscale images:
+the gray version of the image, and the same blurred as a negative (inverted, blurred, inverted back)
+They are kept in the result cache (see image_editor_cache) when the image has a fingerprint,
+so sketching the same pixels again only divides them
+'''
+def sketch_planes(image, progress=None):
+    fingerprint = result_cache.known_fingerprint(image)
+    key = (fingerprint, "sketch planes")
+    if fingerprint is not None:
+        planes = result_cache.results.get(key)
+        if planes is not None:
+            return planes
+
+    def gray_kernel(source, out, offset):
+        # Convert RGB to grayscale
+        cv2.cvtColor(source, cv2.COLOR_RGB2GRAY, dst=out)
+
+    def blur_kernel(source, out, offset):
+        #Invert the gray image, blur it and invert the blurred image, all in one scratch buffer
+        inverted_blur = cv2.bitwise_not(source, dst=buffers.new_array(source.shape))
+        cv2.GaussianBlur(inverted_blur, (21, 21), 0, dst=inverted_blur)
+        cv2.bitwise_not(inverted_blur[offset[0]:offset[0] + out.shape[0], offset[1]:offset[1] + out.shape[1]], dst=out)
+
+    # Convert QImage to format (BGR); a grayscale image is its own gray plane. The 21x21 blur needs 10 pixels of context
+    if image.format() == QImage.Format.Format_Grayscale8:
+        gray = image
+    else:
+        gray = run_filter(image, TiledFilter(gray_kernel, source_format=_sketch_format,
+                                             output_format=lambda source: QImage.Format.Format_Grayscale8, parallel=True),
+                          None if progress is None else lambda fraction: progress(fraction / 4))
+    blurred = run_filter(gray, TiledFilter(blur_kernel, halo=10, source_format=lambda image: image.format(), parallel=True),
+                         None if progress is None else lambda fraction: progress(0.25 + fraction * 3 / 4))
+    if fingerprint is not None:
+        result_cache.results.put(key, (gray, blurred))
+    return gray, blurred
+
+'''
+This function applies a sketch/pencil drawing effect on the image
+The result is a grayscale image, the same as running sketch_filter, whose single pass suits tiles and selections better
+'''
+def sketch(image, progress=None):
+    gray, blurred = sketch_planes(image, progress)
+    # Calculate the DodgeV2 operation
+    sketched, out = buffers.new_image(gray.width(), gray.height(), QImage.Format.Format_Grayscale8)
+    gray_pixels, blurred_pixels = buffers.image_to_array(gray), buffers.image_to_array(blurred)
+
+    def divide_band(top, rows):
+        with trace.span("divide", gray):
+            band = slice(top, top + rows)
+            cv2.divide(gray_pixels[band], blurred_pixels[band], dst=out[band], scale=256.0)
+
+    run_bands(gray.height(), divide_band)
+    return sketched
+
+'''
+This function returns the TiledFilter applying a lookup table (see image_editor_point_ops.py)
+Grayscale images stay grayscale when the table treats all channels alike
+'''
+def table_filter(table):
+
+    def kernel(source, out, offset):
+        table.apply_to_array(source, out=out)
+
+    def source_format(image):
+        if image.format() == QImage.Format.Format_Grayscale8 and table.is_uniform():
+            return QImage.Format.Format_Grayscale8
+        return buffers.color_format(image)
+
+    return TiledFilter(kernel, source_format=source_format)
+
+'''
+These functions apply point operations (lookup tables) to the image
+'''
+def apply_table(image, table, progress=None):
+    return run_filter(image, table_filter(table), progress)
+
+def contrast(image, contrast_level, progress=None):
+    return apply_table(image, point_ops.contrast_table(contrast_level), progress)
+
+def brightness(image, brightness_level, progress=None):
+    return apply_table(image, point_ops.brightness_table(brightness_level), progress)
+
+def gamma(image, gamma_value, progress=None):
+    return apply_table(image, point_ops.gamma_table(gamma_value), progress)
+
+def levels(image, black_point, white_point, gamma_value=1.0, progress=None):
+    return apply_table(image, point_ops.levels_table(black_point, white_point, gamma_value), progress)
+
+def invert(image, progress=None):
+    return apply_table(image, point_ops.invert_table(), progress)
+
+'''
+These functions stretch the tones of the image to the full range from its own histogram (see image_editor_stats.py)
+clip is the percent of the darkest and of the lightest pixels that are let go to black and white
+'''
+def auto_levels(image, clip=stats.DEFAULT_CLIP, progress=None):
+    return apply_table(image, stats.auto_levels_table(stats.histogram(image), clip), progress)
+
+def auto_contrast(image, clip=stats.DEFAULT_CLIP, progress=None):
+    return apply_table(image, stats.auto_contrast_table(stats.histogram(image), clip), progress)
+
+'''
+This class is a selected region of the image: a rectangle, or the ellipse inscribed in it
+Operations applied to a selection (see apply_in_region) change, and compute, only the pixels inside it
+Selections are values: equal selections have equal hashes, so they can be part of edit graph keys
+'''
+class Selection:
+
+    SHAPES = ("rectangle", "ellipse")
+
+    def __init__(self, left, top, width, height, shape="rectangle"):
+        if shape not in Selection.SHAPES:
+            raise ValueError("unknown selection shape: %s" % shape)
+        self.left, self.top, self.width, self.height = left, top, width, height
+        self.shape = shape
+
+    def rect(self):
+        return QRect(self.left, self.top, self.width, self.height)
+
+    '''
+    This method returns the same selection on the image scaled by scale (e.g. a preview proxy)
+    '''
+    def scaled(self, scale):
+        left, top = int(self.left * scale), int(self.top * scale)
+        right, bottom = round((self.left + self.width) * scale), round((self.top + self.height) * scale)
+        return Selection(left, top, max(1, right - left), max(1, bottom - top), self.shape)
+
+    '''
+    This method returns how much each pixel of rect (a part of the selection) is selected,
+    as an array of weights from 0 to 255 with smooth edges, or None when all of it is
+    '''
+    def mask(self, rect):
+        if self.shape == "rectangle":
+            return None
+        mask = np.zeros((self.height, self.width), np.uint8)
+        # coordinates in 1/16 pixel, so the edge is placed exactly on odd sizes
+        cv2.ellipse(mask, (self.width * 8 - 8, self.height * 8 - 8), (self.width * 8, self.height * 8), 0, 0, 360, 255,
+                    thickness=-1, lineType=cv2.LINE_AA, shift=4)
+        top, left = rect.top() - self.top, rect.left() - self.left
+        return mask[top:top + rect.height(), left:left + rect.width()]
+
+    def __eq__(self, other):
+        return isinstance(other, Selection) and self._values() == other._values()
+
+    def __hash__(self):
+        return hash(self._values())
+
+    def __repr__(self):
+        return "Selection(%d, %d, %d, %d, %r)" % self._values()
+
+    def _values(self):
+        return (self.left, self.top, self.width, self.height, self.shape)
+
+'''
+This function applies an operation of OPERATIONS (or a fused "table" step) to the selected part of the image
+Only the selection, and the halo of pixels around it the filter needs, is read and computed;
+inside the selection the result is the same as applying the operation to the whole image.
+Rotations, mirrors and crops change the whole image and cannot be applied to a selection
+'''
+def apply_in_region(image, selection, name, args, progress=None):
+    image = buffers.as_editable(image)
+    rect = selection.rect().intersected(image.rect())
+    if rect.isEmpty():
+        return image
+
+    if name in TILED_FILTERS:
+        # the blur takes the same path as on the whole image
+        tiled_filter = blur_filter(args[0], image.size()) if name == "blur" else TILED_FILTERS[name](*args)
+        # read the halo around the selection, widened to whole blocks of the alignment so they fall where they would on the whole image
+        align, halo = tiled_filter.align, tiled_filter.halo
+        left, top = (rect.left() - halo) // align * align, (rect.top() - halo) // align * align
+        right = -(-(rect.left() + rect.width() + halo) // align) * align
+        bottom = -(-(rect.top() + rect.height() + halo) // align) * align
+        read = QRect(left, top, right - left, bottom - top).intersected(image.rect())
+        region = run_filter(image.copy(read), tiled_filter, progress)
+        region = region.copy(rect.translated(-read.left(), -read.top()))
+    elif name in POINT_OPERATIONS or name == "table":
+        table = args[0] if name == "table" else POINT_OPERATIONS[name](*args)
+        region = apply_table(image.copy(rect), table, progress)
+    elif name in stats.AUTO_TABLES:
+        # the tones are stretched from the histogram of the selection alone
+        region = OPERATIONS[name][0](image.copy(rect), *args, progress=progress)
+    elif name == "grayscale":
+        region = grayscale(image.copy(rect))
+    else:
+        raise ValueError("operation %s cannot be applied to a selection" % name)
+    return _paste(image, region, rect, selection.mask(rect))
+
+'''
+This function returns image with the selected part taken from edited, an image of the same size
+'''
+def composite(image, edited, selection):
+    image = buffers.as_editable(image)
+    rect = selection.rect().intersected(image.rect())
+    if rect.isEmpty():
+        return image
+    return _paste(image, edited.copy(rect), rect, selection.mask(rect))
+
+'''
+This function returns a copy of image with region drawn over the rectangle rect,
+blended by mask (weights from 0 to 255) when given
+The region is converted to the format of the image, e.g. a grayscale part of a color image
+'''
+def _paste(image, region, rect, mask=None):
+    result, out = buffers.new_image_like(image)
+    out[...] = buffers.image_to_array(image)
+    target = out[rect.top():rect.top() + rect.height(), rect.left():rect.left() + rect.width()]
+    pixels = buffers.image_to_array(buffers.as_format(region, image.format()))
+    if mask is None:
+        target[...] = pixels
+    else:
+        weight = (mask if target.ndim == 2 else mask[:, :, None]).astype(np.uint16)
+        target[...] = (pixels * weight + target * (255 - weight) + 127) // 255
+    return result
+
+
+# operations that can be named in a chain, with the types of their parameters
+OPERATIONS = {
+    "rotate": (rotate, (str,)),
+    "mirror": (mirror, (str,)),
+    "crop": (crop, (int, int, int, int)),
+    "blur": (blur, (int,)),
+    "grayscale": (grayscale, ()),
+    "pixelate": (pixelate, (int,)),
+    "sketch": (sketch, ()),
+    "contrast": (contrast, (int,)),
+    "brightness": (brightness, (int,)),
+    "gamma": (gamma, (float,)),
+    "levels": (levels, (int, int, float)),
+    "invert": (invert, ()),
+    "autolevels": (auto_levels, (float,)),
+    "autocontrast": (auto_contrast, (float,)),
+}
+
+# how many of the last parameters of an operation may be left out, to take their defaults
+OPTIONAL_PARAMETERS = {
+    "levels": 1,
+    "autolevels": 1,
+    "autocontrast": 1,
+}
+
+# point operations of the chain mapped to the function building their lookup table
+POINT_OPERATIONS = {
+    "contrast": point_ops.contrast_table,
+    "brightness": point_ops.brightness_table,
+    "gamma": point_ops.gamma_table,
+    "levels": point_ops.levels_table,
+    "invert": point_ops.invert_table,
+}
+
+# neighborhood filters of the chain mapped to the function building their TiledFilter
+TILED_FILTERS = {
+    "blur": blur_filter,
+    "pixelate": pixelate_filter,
+    "sketch": sketch_filter,
+}
+
+# operations that can be limited to a selection (see apply_in_region)
+REGION_OPERATIONS = set(TILED_FILTERS) | set(POINT_OPERATIONS) | set(stats.AUTO_TABLES) | {"grayscale"}
+
+'''
+This function parses a chain of operations such as "rotate:right,blur:5,contrast:40"
+Each step is a name followed by its parameters separated by ':'
+Returns a list of (name, args) tuples
+'''
+def parse_chain(text):
+    chain = []
+    for step in text.split(","):
+        step = step.strip()
+        if not step:
+            continue
+        name, *params = step.split(":")
+        name = name.strip().lower()
+        if name not in OPERATIONS:
+            raise ValueError("unknown operation: %s" % name)
+
+        _, param_types = OPERATIONS[name]
+        # the last parameters may be left out when they have defaults (levels gamma, auto levels clip)
+        required = len(param_types) - OPTIONAL_PARAMETERS.get(name, 0)
+        if name == "levels" and len(params) < required:
+            raise ValueError("operation levels takes a black point and a white point")
+        if not required <= len(params) <= len(param_types):
+            raise ValueError("operation %s takes %d parameter(s)" % (name, len(param_types)))
+        try:
+            args = tuple(param_type(param) for param_type, param in zip(param_types, params))
+        except ValueError:
+            raise ValueError("invalid parameters for %s: %s" % (name, ":".join(params)))
+        chain.append((name, args))
+    return chain
+
+'''
+This function fuses a chain of operations (as returned by parse_chain) into the steps that compute it
+    * consecutive rotations and mirrors become one ("orient", (Orientation,)) step
+    * consecutive point operations become one ("table", (LookupTable,)) step
+    * any other operation is a step of its own, as are ("region", (Selection, name, args)) operations
+      limited to a selection (see apply_in_region)
+Returns a list of (name, args, end) where end is the number of operations of the chain done
+after the step. Steps that leave the image as it is (e.g. four right rotations) are left out
+'''
+def fuse_chain(chain):
+    steps = []
+    for index, (name, args) in enumerate(chain):
+        previous = steps[-1] if steps and steps[-1][2] == index else None
+        if name in ("rotate", "mirror"):
+            if previous is not None and previous[0] == "orient":
+                steps[-1] = ("orient", (previous[1][0].then(name, args[0]),), index + 1)
+            else:
+                steps.append(("orient", (Orientation().then(name, args[0]),), index + 1))
+        elif name in POINT_OPERATIONS:
+            table = POINT_OPERATIONS[name](*args)
+            if previous is not None and previous[0] == "table":
+                steps[-1] = ("table", (previous[1][0].then(table),), index + 1)
+            else:
+                steps.append(("table", (table,), index + 1))
+        elif name in OPERATIONS or name == "region":
+            steps.append((name, args, index + 1))
+        else:
+            raise ValueError("unknown operation: %s" % name)
+
+        # a fused step that does nothing is dropped; the next operation starts a new step
+        if steps[-1][0] in ("orient", "table") and steps[-1][1][0].is_identity():
+            steps[-1] = ("identity", (), index + 1)
+    return [step for step in steps if step[0] != "identity"]
+
+'''
+This function applies one step of fuse_chain to the image
+'''
+def apply_step(image, name, args, progress=None):
+    with trace.span(name, image, category="filter"):
+        if name == "orient":
+            return args[0].apply(image, progress)
+        if name == "table":
+            return apply_table(image, args[0], progress)
+        if name == "region":
+            return apply_in_region(image, *args, progress=progress)
+        function, _ = OPERATIONS[name]
+        return function(image, *args, progress=progress)
+
+'''
+This function applies a chain of operations (as returned by parse_chain) to the image
+Rotations and mirrors are fused into a single permutation of the pixels and point operations
+into a single lookup table, see fuse_chain
+'''
+def apply_chain(image, chain):
+    for name, args, _ in fuse_chain(chain):
+        image = apply_step(image, name, args)
+    return image
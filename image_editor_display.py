@@ -0,0 +1,117 @@
+import math
+from PyQt6.QtCore import QRect
+from PyQt6.QtGui import QImage
+import image_editor_buffers as buffers
+import image_editor_lazy as lazy
+import image_editor_trace as trace
+cv2 = lazy.module("cv2")
+
+'''
+This module keeps what the canvas needs to show an image of any size quickly
+An ImagePyramid holds the image at full resolution (level 0, the image itself, not a copy) and
+reduced versions of it, each half the size of the previous one. The canvas draws the part of the
+image that is visible from the smallest level that still has enough pixels for the zoom, so the
+cost of showing the image follows the size of the screen rather than the size of the image.
+Levels are only built when the canvas first needs them, and after an edit of part of the image
+(a brush stroke) only that part of the levels already built is computed again.
+Levels saved with the image (in a project, see image_editor_project) are read instead of being built.
+'''
+
+MIN_LEVEL_SIZE = 32 # levels stop once the longer side would be smaller than this
+
+'''
+This class is the resolution pyramid of an image
+'''
+class ImagePyramid:
+
+    def __init__(self, image=None):
+        self.set_image(QImage() if image is None else image)
+
+    '''
+    This method replaces the image; the reduced levels are rebuilt when they are needed
+    stored maps the index of levels saved before to an object whose load() reads them (a project.StoredImage)
+    '''
+    def set_image(self, image, stored=None):
+        self.levels = [buffers.as_editable(image)]
+        self.stored = {} if stored is None else dict(stored)
+
+    '''
+    This method returns the number of levels the image can have
+    '''
+    def level_count(self):
+        size = max(self.levels[0].width(), self.levels[0].height())
+        count = 1
+        while size // 2 >= MIN_LEVEL_SIZE:
+            size //= 2
+            count += 1
+        return count
+
+    '''
+    This method returns the level to draw at zoom (widget pixels per image pixel):
+    the smallest one with at least one pixel per widget pixel
+    '''
+    def level_for_zoom(self, zoom):
+        if zoom >= 1:
+            return 0
+        return min(int(math.floor(math.log2(1 / zoom))), self.level_count() - 1)
+
+    '''
+    This method returns a level of the pyramid, building the missing levels up to it
+    Level n is 2**n times smaller than the image (the odd last row or column is left out)
+    '''
+    def level(self, index):
+        while len(self.levels) <= index:
+            stored = self.stored.pop(len(self.levels), None)
+            if stored is not None:
+                self.levels.append(stored.load())
+                continue
+            previous = self.levels[-1]
+            with trace.span("pyramid level", previous):
+                level, out = buffers.new_image(previous.width() // 2, previous.height() // 2, previous.format())
+                _reduce(buffers.image_to_array(previous), out)
+            self.levels.append(level)
+        return self.levels[index]
+
+    '''
+    This method takes an image that differs from the previous one only inside rect (in image pixels),
+    e.g. after a brush stroke, and computes only that part of the levels already built
+    '''
+    def update_rect(self, image, rect):
+        self.levels[0] = image
+        self.stored = {} # they do not have the change
+        left, top, right, bottom = rect.left(), rect.top(), rect.right() + 1, rect.bottom() + 1
+        with trace.span("pyramid update", width=rect.width(), height=rect.height()):
+            for index in range(1, len(self.levels)):
+                source = buffers.image_to_array(self.levels[index - 1])
+                out = buffers.image_to_array(self.levels[index], writable=True)
+                # the rectangle at this level covers every pixel made from a changed pixel of the previous one
+                left, top = left // 2, top // 2
+                right, bottom = min(-(-right // 2), out.shape[1]), min(-(-bottom // 2), out.shape[0])
+                if left >= right or top >= bottom:
+                    break
+                _reduce(source[2 * top:2 * bottom, 2 * left:2 * right], out[top:bottom, left:right])
+
+    '''
+    This method returns the rectangle of image pixels that a rectangle of the widget shows at zoom
+    '''
+    @staticmethod
+    def image_rect(widget_rect, zoom):
+        left, top = int(widget_rect.left() / zoom), int(widget_rect.top() / zoom)
+        right, bottom = math.ceil((widget_rect.right() + 1) / zoom), math.ceil((widget_rect.bottom() + 1) / zoom)
+        return QRect(left, top, right - left, bottom - top)
+
+    '''
+    This method returns the rectangle of the widget that shows a rectangle of image pixels at zoom
+    '''
+    @staticmethod
+    def widget_rect(image_rect, zoom):
+        left, top = int(image_rect.left() * zoom), int(image_rect.top() * zoom)
+        right, bottom = math.ceil((image_rect.right() + 1) * zoom), math.ceil((image_rect.bottom() + 1) * zoom)
+        return QRect(left, top, right - left, bottom - top)
+
+'''
+This function halves an array into out, each pixel the average of a 2x2 block
+'''
+def _reduce(source, out):
+    height, width = out.shape[:2]
+    cv2.resize(source[:2 * height, :2 * width], (width, height), dst=out, interpolation=cv2.INTER_AREA)
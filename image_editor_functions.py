@@ -1,9 +1,21 @@
+import os
 from PyQt6.QtWidgets import QLabel, QMessageBox, QFileDialog
-from PyQt6.QtCore import Qt, QPoint
-from PyQt6.QtGui import QPixmap, QImage, QTransform, QColor
-from statistics import median
-import cv2 
-import numpy as np
+from PyQt6.QtCore import Qt, QPoint, QPointF, QRect, QRectF, QSize, QTimer, pyqtSignal
+from PyQt6.QtGui import QPixmap, QImage, QColor, QPainter, QPen
+import image_editor_brush as brush
+import image_editor_buffers as buffers
+import image_editor_cache as result_cache
+import image_editor_core as core
+import image_editor_display as display
+import image_editor_graph as graph
+import image_editor_history as history
+import image_editor_loader as loader
+import image_editor_preview as preview
+import image_editor_project as project
+import image_editor_save as save
+import image_editor_stats as stats
+import image_editor_trace as trace
+import image_editor_workers as workers
 
 '''
 This class represents the various functionalities of the image editor
@@ -13,6 +25,10 @@ Has three different categories of image editing features:
     * Painting
 '''
 class EditorFunctions(QLabel):
+
+    zoom_requested = pyqtSignal(float, QPoint) # zoom factor asked with ctrl + mouse wheel, and where the mouse is
+    image_changed = pyqtSignal() # the image was replaced or edited (at the end of brush strokes)
+    project_saved = pyqtSignal(str, int, int) # path of a project saved, bytes written, size of the file
    
     def __init__(self, parent, image=None):
         
@@ -21,34 +37,67 @@ class EditorFunctions(QLabel):
         self.image = QImage() # create image object to apply image processing techniques
 
         self.initial_image = self.image # store the initial version of the image for reverting purposes
+        # undo/redo stack of the edits; the image and the source of the graph on the canvas are not its to free
+        self.history = history.EditHistory(held_frames=lambda: (self.image, self.graph.source))
+        self.graph = graph.EditGraph(self.image) # operations applied to the image, computed lazily
+        self.stroke = None # records the tiles touched by the brush stroke in progress
+        self.stroke_key = None # cacheKey of the image before the brush stroke in progress
+        self.live_histogram = stats.LiveHistogram() # histogram of the image, see image_histogram
+        self.runner = workers.FilterRunner(self) # runs the filters on worker threads
+        self.proxy_cache = {} # downscaled proxies of the image for live previews
+        self.preview_pixmap = None # preview shown instead of the image while a filter dialog is open
+
+        # opens files on a worker thread, showing a reduced version first
+        self.loader = loader.ImageLoader(self)
+        self.loader.preview_ready.connect(self.show_loading_preview)
+        self.loader.loaded.connect(self.finish_loading)
+        self.loader.failed.connect(self.loading_failed)
+        self.loading_size = QSize() # size of the image being opened while its preview is shown
+        self.loading_path = "" # file being opened
+        self.project = project.Project() # project file the session was opened from or saved to, see save_project
+
+        # saves files on a worker thread from a snapshot of the image, so editing can go on
+        self.saver = save.ImageSaver(self)
+        self.saver.failed.connect(lambda path, message: self.errorMessage("Cannot save image: %s" % message))
+        self.save_options = save.SaveOptions() # encoder options of the last save, offered again next time
         
         self.paint_mode = False # if true, draw pen on image instead of rubber_band
-        self.prev_paint_loc = None # store location of last pixel painted
+        self.prev_paint_loc = None # store location (x, y) of the last point painted
+        self.brush = brush.Brush() # size and opacity of the paintbrush
+        self.brush_stroke = None # rasterizes the brush stroke in progress
+
+        # mouse moves are painted once per refresh of the screen, however fast they come
+        self.pending_points = []
+        self.paint_timer = QTimer(self)
+        self.paint_timer.setSingleShot(True)
+        self.paint_timer.timeout.connect(self.flush_paint)
+
+        self.selection = None # core.Selection the filters are limited to, None for the whole image
+        self.selection_shape = "rectangle" # shape of the next selections, see core.Selection
+        self.selection_origin = None # image point where the selection being dragged started
 
         self.paint_color = QColor("black") # setup paint color black as default
 
-        # Load image onto canvas as a pixmap
-        self.setPixmap(QPixmap().fromImage(self.image))
+        # Load image onto canvas; only the visible part is drawn, from the pyramid level matching the zoom
+        self.pyramid = display.ImagePyramid(self.image)
+        self.zoom = 1.0 # widget pixels per image pixel
         self.setAlignment(Qt.AlignmentFlag.AlignCenter)
 
     '''
     This method allows the user to open an image file onto the image canvas
     Allows various file types in the dialog
     '''
+    @trace.traced("open")
     def open_image(self):
         # dialog to open file
         image_file, _ = QFileDialog.getOpenFileName(self, "Open Image", 
-                "", "PNG Files (*.png);;JPG Files (*.jpeg *.jpg );;Bitmap Files (*.bmp)")
+                "", "PNG Files (*.png);;JPG Files (*.jpeg *.jpg );;Bitmap Files (*.bmp);;Image Lab Projects (*.imlab)")
         
         # if an image file was selected
         if image_file:
-            # Get image format
-            self.image = QImage(image_file)
-            self.initial_image = self.image.copy() # copy the initial image for reverting purposes
-
-            # Set the image on the image canvas
-            self.setPixmap(QPixmap().fromImage(self.image))
-            self.resize(self.pixmap().size())
+            # decode it in the background; the editor stays responsive meanwhile
+            self.loading_path = image_file
+            self.loader.load(image_file, self.screen().availableGeometry().size())
 
         # if no image was selected
         elif image_file == "":
@@ -58,10 +107,83 @@ class EditorFunctions(QLabel):
         else:
             self.errorMessage("Cannot open image.")
     
+    '''
+    This method shows the reduced version of the image being opened, stretched to the size of the full image
+    Editing waits for the full image; until then there is no image to edit
+    '''
+    def show_loading_preview(self, preview_image, full_size):
+        self.loading_size = full_size
+        self.set_image(QImage())
+        self.show_preview(preview_image)
+
+    '''
+    This method replaces the preview (if any) with the full resolution image once it is decoded
+    '''
+    def finish_loading(self, image):
+        self.loading_size = QSize()
+        self.preview_pixmap = None
+        if project.is_project(self.loading_path):
+            self.open_project(image, self.loading_path)
+        else:
+            self.set_image(image)
+
+    '''
+    This method continues the session saved in a project file, image being its current image
+    The original image, the levels of the pyramid and the history stay in the file until they are needed
+    '''
+    def open_project(self, image, path):
+        try:
+            project_file = project.ProjectFile(path)
+        except (OSError, ValueError) as error:
+            self.set_image(image)
+            self.errorMessage("Cannot open the history of the project: %s" % error)
+            return
+        self.set_image(image, project_file.stored_original())
+        self.project = project.Project(project_file)
+        self.project.remember(self.image, project_file.manifest["current"])
+        self.history.replace(*self.project.read_history())
+        self.pyramid.set_image(self.image, project_file.stored_levels())
+
+    def loading_failed(self, message):
+        if self.loading_size.isValid():
+            self.loading_size = QSize()
+            self.clear_preview()
+            self.update_canvas()
+        self.errorMessage("Cannot open image.")
+
+    '''
+    This method replaces the image on the canvas with a new one, forgetting everything about the previous one
+    original is the image to revert to, a copy of image by default, or a project.StoredImage read when first needed
+    '''
+    def set_image(self, image, original=None):
+        self.cancel_background_work()
+        self.image = image
+        # name the pixels of the image, so results computed for the same pixels before are found again
+        fingerprint = result_cache.fingerprint(self.image)
+        if original is None:
+            self.initial_image = self.image.copy() # copy the initial image for reverting purposes
+            result_cache.derive(self.initial_image, fingerprint)
+        else:
+            self.initial_image = original
+        self.history.clear() # edits of the previous image cannot be undone anymore
+        self.project.close() # nothing reads from the file of the previous image anymore
+        self.project = project.Project() # saving asks where, until the session is saved or opened as a project
+        self.graph = graph.EditGraph(self.image) # nor can the results computed for it be reused
+        self.live_histogram.clear()
+        self.stroke = None
+        self.brush_stroke = None
+        self.pending_points = []
+        self.selection = None
+        self.zoom = 1.0
+
+        # Set the image on the image canvas
+        self.update_canvas()
+
     '''
     This method allows the user to save the image they edited
     By default saves as .png but can save as other file types
     '''
+    @trace.traced("save")
     def save_image(self):
         # if there is an image on the canvas
         if self.image.isNull() == False:
@@ -70,7 +192,10 @@ class EditorFunctions(QLabel):
 
             # if there is an image on the canvas and we have an image to save
             if image_file and self.image.isNull() == False:
-                self.image.save(image_file) # save the image
+                options, ok_pressed = save.SaveOptionsDialog.getOptions(self, save.file_format(image_file), self.save_options)
+                if ok_pressed:
+                    self.save_options = options
+                    self.saver.save(self.image, image_file, options) # save the image in the background
             # otherwise we cannot save
             else:
                 self.errorMessage("Cannot save image.")
@@ -78,17 +203,51 @@ class EditorFunctions(QLabel):
         else:
             self.errorMessage("There is no image to save.",error="Save Not Needed")
 
+    '''
+    This method returns the original image, reading it from the project file the first time when it is stored there
+    '''
+    def original_image(self):
+        if isinstance(self.initial_image, project.StoredImage):
+            self.initial_image = self.initial_image.load()
+        return self.initial_image
+
+    '''
+    This method saves the session (the image, its original and the undo/redo history) to a project file
+    Saving again to the same file only writes what changed since; save_as asks for a new file
+    '''
+    @trace.traced("save project")
+    def save_project(self, save_as=False):
+        if self.image.isNull():
+            self.errorMessage("There is no image to save.", error="Save Not Needed")
+            return
+        path = self.project.path
+        if save_as or path is None:
+            path, _ = QFileDialog.getSaveFileName(self, "Save Project", "", "Image Lab Projects (*.imlab)")
+            if not path:
+                return
+            if not project.is_project(path):
+                path += project.EXTENSION
+
+        self.finish_stroke()
+        levels = [self.pyramid.level(index) for index in range(1, self.pyramid.level_count())]
+        try:
+            written = self.project.save(path, self.image, self.initial_image, levels, self.history)
+        except (OSError, ValueError) as error:
+            self.errorMessage("Cannot save project: %s" % error)
+            return
+        self.project_saved.emit(path, written, os.path.getsize(path))
+
     '''
     This method reverts the image on the canvas back to the original
     Acts as an undo button; replaces image on canvas with the initial image
     '''
+    @trace.traced("revert")
     def revert_original(self):
         # if there is an image on the canvas
         if self.image.isNull() == False:
-            self.image = self.initial_image # replace image on canvas with original
-
-            self.setPixmap(QPixmap().fromImage(self.image))
-            self.repaint()
+            # replace image on canvas with original; a shallow copy so in-place painting never reaches initial_image
+            before = self.graph_of(self.image)
+            self.commit_graph(before, before.rebase(QImage(self.original_image())))
         # there is no image to revert
         else:
             self.errorMessage("no image to revert")
@@ -98,23 +257,12 @@ class EditorFunctions(QLabel):
     Relative to the x-axis
     '''
     # concept drawn from reference: https://doc.qt.io/qt-6/qtransform.html
+    @trace.traced("rotate")
     def rotate_image(self, direction):
         # if there is an imagfe on the canvas
         if self.image.isNull() == False:
-            if direction == "right": # rotate to the right
-                rotate = QTransform().rotate(90)
-            elif direction == "left": # rotate to the left
-                rotate = QTransform().rotate(-90)
-
-            pixmap = QPixmap(self.image)
-
-            rotated = pixmap.transformed(rotate, mode=Qt.TransformationMode.SmoothTransformation)
-            self.resize(self.image.height(), self.image.width())
-           
-            self.image = QImage(rotated) 
-        
-            self.setPixmap(rotated.scaled(self.size(), Qt.AspectRatioMode.KeepAspectRatioByExpanding, Qt.TransformationMode.SmoothTransformation)) # allows the image to fit in window after rotate
-            self.repaint()
+            # rotations and mirrors add up into one exact transformation of the source (see image_editor_graph)
+            self.edit_graph("rotate", direction)
         # if there is no image on the canvas
         else:
             self.errorMessage("no image to rotate")
@@ -124,22 +272,11 @@ class EditorFunctions(QLabel):
     Can be flipped over the x-axis or y-axis
     '''
     # code drawn from reference: https://stackoverflow.com/questions/28409248/how-to-flip-a-qimage
+    @trace.traced("mirror")
     def mirror_image(self, axis):
         # if there is an image on the canvas
         if self.image.isNull() == False:
-            if axis == "horizontal": # mirror the image over the x-axis
-                mirror_horizontal = QTransform().scale(-1, 1)
-                pixmap = QPixmap(self.image)
-                mirrored = pixmap.transformed(mirror_horizontal)
-            elif axis == "vertical": # mirror the image over the y-axis
-                mirror_vertical = QTransform().scale(1, -1)
-                pixmap = QPixmap(self.image)
-                mirrored = pixmap.transformed(mirror_vertical)
-
-            self.image = QImage(mirrored)
-            
-            self.setPixmap(mirrored)
-            self.repaint()
+            self.edit_graph("mirror", axis)
         # if there is no image on the canvas
         else:
             self.errorMessage("no image to Mirror")
@@ -150,31 +287,11 @@ class EditorFunctions(QLabel):
     blur_strenth is of type (int)
     '''
     # conceptualization drawn from reference: https://datacarpentry.org/image-processing/06-blurring.html#gaussian-blur
+    @trace.traced("blur")
     def blur_image(self, blur_strength):
         # if there is an image on the canvas
         if self.image.isNull() == False:
-            # Ensure the image is in a format that uses 4 bytes per pixel
-            image_format = QImage.Format.Format_ARGB32
-            converted_image = self.image.convertToFormat(image_format)
-
-            # Convert QImage to OpenCV format
-            width = converted_image.width()
-            height = converted_image.height()
-            ptr = converted_image.bits()
-            ptr.setsize(converted_image.sizeInBytes())
-            arr = np.array(ptr).reshape((height, width, 4))
-
-            # Apply blur using OpenCV
-            # Ensure blur_strength is odd
-            blur_strength = blur_strength if blur_strength % 2 == 1 else blur_strength + 1
-            blurred = cv2.GaussianBlur(arr, (blur_strength, blur_strength), 0)
-
-            # Convert back to QImage
-            blurred_image = QImage(blurred.data, blurred.shape[1], blurred.shape[0], image_format)
-            self.image = blurred_image
-            
-            self.setPixmap(QPixmap.fromImage(self.image))
-            self.repaint()
+            self.edit_graph("blur", blur_strength, background=True)
         # if there is no image on the canvas
         else:
            #ignore
@@ -183,14 +300,11 @@ class EditorFunctions(QLabel):
     '''
     This method applies grayscale on an image to achieve black/white effect
     '''
+    @trace.traced("grayscale")
     def black_white_image(self):
         # if there is an image on the canvas
         if self.image.isNull() == False:
-            temp_converted_img = self.image.convertToFormat(QImage.Format.Format_Grayscale8)
-            self.image = QImage(temp_converted_img)
-            
-            self.setPixmap(QPixmap().fromImage(temp_converted_img))
-            self.repaint()
+            self.edit_graph("grayscale")
         # if there is no image on the canvas
         else:
             self.errorMessage("no image to convert to grayscale")
@@ -201,23 +315,11 @@ class EditorFunctions(QLabel):
     pixel_size is of type (int)
     '''
     # reference for conceptualization: https://stackoverflow.com/questions/47143332/how-to-pixelate-a-square-image-to-256-big-pixels-with-python
+    @trace.traced("pixelate")
     def pixelate_image(self, pixel_size):
         # if there is an image on the canvas and pixelation effect was desired
         if self.image.isNull() == False and pixel_size > 0:
-            original_size = self.image.size()
-            # Scale down the image to create the pixelated effect
-            small = self.image.scaled(original_size.width() // pixel_size,
-                                      original_size.height() // pixel_size,
-                                      Qt.AspectRatioMode.IgnoreAspectRatio,
-                                      Qt.TransformationMode.FastTransformation)
-            # Scale it back up to its original size
-            pixelated = small.scaled(original_size,
-                                     Qt.AspectRatioMode.IgnoreAspectRatio,
-                                     Qt.TransformationMode.FastTransformation)
-            self.image = pixelated
-            
-            self.setPixmap(QPixmap.fromImage(self.image))
-            self.repaint()
+            self.edit_graph("pixelate", pixel_size, background=True)
         # if there is no image on the canvas or no pixelation effect was desired
         else:
             # ignore
@@ -229,107 +331,127 @@ class EditorFunctions(QLabel):
     contrast_level is of type (int)
     '''
     # uses algorithm from reference: https://www.dfstudios.co.uk/articles/programming/image-programming-algorithms/image-processing-algorithms-part-5-contrast-adjustment/
+    @trace.traced("contrast")
     def adjust_contrast_image(self, contrast_level):
+        self.apply_point_operation("contrast", contrast_level)
+
+    '''
+    This method changes the brightness of the image
+    brightness_level is of type (int), added to every color channel
+    '''
+    @trace.traced("brightness")
+    def adjust_brightness_image(self, brightness_level):
+        self.apply_point_operation("brightness", brightness_level)
+
+    '''
+    This method applies gamma correction to the image
+    gamma is of type (float); above 1 brightens the midtones, below 1 darkens them
+    '''
+    @trace.traced("gamma")
+    def adjust_gamma_image(self, gamma):
+        self.apply_point_operation("gamma", gamma)
+
+    '''
+    This method stretches the tones between black_point and white_point to the full range
+    '''
+    @trace.traced("levels")
+    def adjust_levels_image(self, black_point, white_point, gamma=1.0):
+        self.apply_point_operation("levels", black_point, white_point, gamma)
+
+    '''
+    This method stretches each color channel to the full range from the histogram of the image
+    clip is the percent of the darkest and of the lightest values let go to black and white
+    '''
+    @trace.traced("auto levels")
+    def auto_levels_image(self, clip=stats.DEFAULT_CLIP):
+        self.apply_point_operation("autolevels", clip)
+
+    '''
+    This method stretches the tones to the full range from the luminance histogram, keeping the colors as they are
+    '''
+    @trace.traced("auto contrast")
+    def auto_contrast_image(self, clip=stats.DEFAULT_CLIP):
+        self.apply_point_operation("autocontrast", clip)
+
+    '''
+    This method applies a point operation (a lookup table, see image_editor_point_ops)
+    to the whole image in a single vectorized pass; consecutive ones are fused into one table
+    '''
+    def apply_point_operation(self, name, *args):
         # if there is an image on the canvas
         if self.image.isNull() == False:
-            contrasted = self.image.copy()
-            contrast_factor = (259*(contrast_level + 255))/(255*(259 - contrast_level))
-            for i in range(self.image.width()):
-                for j in range(self.image.height()):
-                    new_color = contrasted.pixelColor(i,j) # get the original pixel colors
-                    new_color.setRed(int(round(median([0,(contrast_factor*(new_color.red() -128) + 128),255]),0)))
-                    new_color.setBlue(int(round(median([0,(contrast_factor*(new_color.blue() -128) + 128),255]),0)))
-                    new_color.setGreen(int(round(median([0,(contrast_factor*(new_color.green() -128) + 128),255]),0)))
-                    contrasted.setPixelColor(i,j,new_color) # set the new pixel colors
-            
-            self.image = contrasted
-            
-            self.setPixmap(QPixmap.fromImage(self.image))
-            self.repaint()
+            self.edit_graph(name, *args, background=True)
         # if there is no image
         else:
             # ignore
             pass
 
     '''
-    This method allows painting to be applied to the image with a brush
-    Default brush size of 3
+    This method paints a dab of the brush centered on the pixel origin, or a line to it from the last point painted
+    brush_size overrides the size of the brush for this dab
     '''
-    def paint_pixels_image(self, origin, brush_size=3):
-        # store all pixels in set, then paint them to ensure no duplicates
-        color = self.paint_color
-        pixels_to_paint = set()
-        
-        # paint around origin in radius of brush_size
-        for x in range(brush_size):
-            for y in range(brush_size):
-                pixels_to_paint.add(QPoint(origin.x() + x, origin.y() + y))
-        
-        #when mouse is held, draw a line between a point and the previous point from last call to function
-        if self.prev_paint_loc != None and self.prev_paint_loc != origin:
-            line_x = origin.x() - self.prev_paint_loc.x()
-            line_y = origin.y() - self.prev_paint_loc.y()
-            distance = (line_x**2 + line_y**2) ** (1/2)
-            step_x = line_x/distance
-            step_y = line_y/distance
-            for i in range(int(round(distance))):
-                for x in range(brush_size):
-                    for y in range(brush_size):
-                        pixels_to_paint.add(QPoint(self.prev_paint_loc.x() + x + int(round((i*step_x))), self.prev_paint_loc.y() + y + int(round((i*step_y))) ))
-       
-        image_clone = self.image.copy()
-        for point in pixels_to_paint:
-            image_clone.setPixelColor(point,color)
-        
-        self.image = image_clone
-        self.prev_paint_loc = origin
-        
-        self.setPixmap(QPixmap.fromImage(self.image))
-        self.repaint()
+    def paint_pixels_image(self, origin, brush_size=None):
+        self.paint_points([(origin.x() + 0.5, origin.y() + 0.5)], brush_size)
 
     '''
-    This method applies a sketch/pencil drawing effect on the image
+    This method paints the brush along points (x, y in image coordinates), continuing the stroke in progress
+    All the segments are rasterized at once and the canvas is refreshed once, see image_editor_brush
     '''
+    @trace.traced("brush")
+    def paint_points(self, points, brush_size=None):
+        # nothing to paint on
+        if self.image.isNull() or not points:
+            return
 
-    # reference algorithm: https://www.askpython.com/python/examples/images-to-pencil-sketch
-    def sketch_image(self):
-        # if there is an image on the canvas
-        if self.image.isNull() == False:
-            # Convert QImage to format (BGR)
-            image = self.image.convertToFormat(QImage.Format.Format_RGB32)
-            # Convert QImage to OpenCV format
-            width = image.width()
-            height = image.height()
-            ptr = image.bits()
-            ptr.setsize(image.sizeInBytes())
-            arr = np.array(ptr).reshape((height, width, 4))
+        # a grayscale image takes gray paint as it is; other colors need a color format,
+        # so convert once, at the start of the stroke
+        gray_paint = self.paint_color.red() == self.paint_color.green() == self.paint_color.blue()
+        if (self.image.format() not in buffers.FOUR_CHANNEL_FORMATS
+                and not (gray_paint and self.image.format() == QImage.Format.Format_Grayscale8)):
+            self.commit_edit(self.image.convertToFormat(buffers.color_format(self.image)),
+                             lambda image: image.convertToFormat(buffers.color_format(image)))
 
-            # Convert RGB to grayscale
-            gray_image = cv2.cvtColor(arr, cv2.COLOR_RGB2GRAY)
+        # keep the tiles about to be painted on so the stroke can be undone
+        if self.stroke is None:
+            self.stroke = history.StrokeRecorder()
+            self.stroke_key = self.image.cacheKey()
+            # the edit graph keeps the image too (as a cached result or as its source);
+            # let go of it so painting does not copy the whole image
+            self.graph.cache.forget(self.image)
+            if self.graph.source.cacheKey() == self.image.cacheKey():
+                self.graph = self.graph.rebase(QImage())
+        if self.brush_stroke is None:
+            self.brush_stroke = brush.BrushStroke(self.brush, self.paint_color, self.image, self.stroke)
+        self.brush_stroke.radius = (self.brush.size if brush_size is None else brush_size) / 2
 
-            #Invert the gray image
-            inverted_gray = cv2.bitwise_not(gray_image)
+        # a line from the previous point when the mouse is held
+        if self.prev_paint_loc is not None:
+            points = [self.prev_paint_loc] + list(points)
+        dirty_rects = self.brush_stroke.paint(self.image, points)
+        self.prev_paint_loc = points[-1]
 
-            # Apply GaussianBlur to the grayscale image
-            blurred_image = cv2.GaussianBlur(inverted_gray, (21, 21), 0)
+        # convert only the touched rectangles to the displayed pixmap and schedule a repaint of them
+        for dirty_rect in dirty_rects:
+            self.update_canvas_rect(dirty_rect)
 
-            #Invert blurred image
-            inverted_blur = cv2.bitwise_not(blurred_image)
-
-            # Calculate the DodgeV2 operation
-            pencil_sketch = cv2.divide(gray_image, inverted_blur, scale=256.0)
-
-            # Convert OpenCV image back to QImage
-            height, width = pencil_sketch.shape[:2]
-            bytes_per_line = width
-
-            sketched = QImage(pencil_sketch.data, width, height, bytes_per_line, QImage.Format.Format_Grayscale8)
+    '''
+    This method paints the mouse positions received since the last refresh of the screen, as one polyline
+    '''
+    def flush_paint(self):
+        self.paint_timer.stop()
+        points, self.pending_points = self.pending_points, []
+        self.paint_points(points)
 
-            sketch_to_rgb = sketched.convertToFormat(QImage.Format.Format_RGB32)
-            self.image = sketch_to_rgb
+    '''
+    This method applies a sketch/pencil drawing effect on the image
+    '''
 
-            self.setPixmap(QPixmap.fromImage(self.image))
-            self.repaint()
+    # reference algorithm: https://www.askpython.com/python/examples/images-to-pencil-sketch
+    @trace.traced("sketch")
+    def sketch_image(self):
+        # if there is an image on the canvas
+        if self.image.isNull() == False:
+            self.edit_graph("sketch", background=True)
         # if there is no image on the canvas
         else:
             self.errorMessage("no image to Sketch")
@@ -337,31 +459,61 @@ class EditorFunctions(QLabel):
     '''
     This method inverts the colors of the image to achieve a "negative" effect
     '''
+    @trace.traced("invert")
     def invert_colors_image(self):
         # if there is an image on the canvas
         if self.image.isNull() == False:
-            # Convert QImage to format (BGR)
-            image = self.image.convertToFormat(QImage.Format.Format_RGB32)
-            # Convert QImage to OpenCV format
-            width = image.width()
-            height = image.height()
-            ptr = image.bits()
-            ptr.setsize(image.sizeInBytes())
-            arr = np.array(ptr).reshape((height, width, 4))
-
-            # Invert the colors
-            inverted_image = cv2.bitwise_not(arr)
-
-            # Convert back to QImage
-            bytes_per_line = width * 4
-            inverted_image_as_QImage = QImage(inverted_image.data, width, height, bytes_per_line, QImage.Format.Format_RGB32)
-
-            self.image = inverted_image_as_QImage
-            self.setPixmap(QPixmap.fromImage(self.image))
-            self.repaint()
+            self.apply_point_operation("invert")
         else:
             self.errorMessage("no image to invert")
 
+    '''
+    This method crops the image to the selection; later edits only work on the pixels kept
+    The crop is an operation of the edit graph like any other, so it can be undone
+    '''
+    @trace.traced("crop")
+    def crop_image(self):
+        # if there is an image on the canvas and a part of it is selected
+        if self.image.isNull() == False and self.selection is not None:
+            self.edit_graph("crop", self.selection.left, self.selection.top, self.selection.width, self.selection.height)
+        elif self.image.isNull() == False:
+            self.errorMessage("Select the part of the image to keep first.", error="Nothing Selected")
+        else:
+            self.errorMessage("no image to crop")
+
+    '''
+    This method selects the whole image: filters apply to all of it again
+    '''
+    def select_all(self):
+        self.selection = None
+        self.update()
+
+    '''
+    This method removes the selection; filters apply to the whole image again
+    '''
+    def clear_selection(self):
+        self.selection = None
+        self.update()
+
+    '''
+    This method sets the shape of selections, "rectangle" or "ellipse", including the current one
+    '''
+    def set_selection_shape(self, shape):
+        self.selection_shape = shape
+        if self.selection is not None:
+            rect = self.selection.rect()
+            self.selection = core.Selection(rect.x(), rect.y(), rect.width(), rect.height(), shape)
+            self.update()
+
+    '''
+    This method returns the selection between two points of the image (its corners), or None when it is empty
+    '''
+    def selection_between(self, start, end):
+        rect = QRect(start, end).normalized().intersected(self.image.rect())
+        if rect.width() < 2 or rect.height() < 2:
+            return None
+        return core.Selection(rect.x(), rect.y(), rect.width(), rect.height(), self.selection_shape)
+
     '''
     This method allows the paintbrush to be toggled on or off to allow drawing
     '''
@@ -370,37 +522,342 @@ class EditorFunctions(QLabel):
         self.prev_paint_loc = None
 
     '''
-    This method handles pressing the mouse when drawing on the image and handles make RubberBank when moving the mouse.
-    - Another feature we where trying to add is cropping. we initily started making the rubber band
+    This method handles pressing the mouse when drawing on the image and starts a selection otherwise
     '''
     def mousePressEvent(self, event):   
-        self.origin = event.pos()
+        self.origin = self.image_point(event.pos())
         # if paint brush is toggled on
         if self.paint_mode:
-            self.paint_pixels_image(self.origin)
-        # if paint brush is toggled off
-        else:
-            # ignore
-            pass
+            self.paint_points([self.image_position(event.position())])
+        # if paint brush is toggled off, drag to select; a click removes the selection
+        elif self.image.isNull() == False:
+            self.selection_origin = self.origin
+            self.clear_selection()
 
     '''
-    This method handles moving the mouse across the image when drawing
+    This method handles moving the mouse across the image when drawing or selecting
     '''
     def mouseMoveEvent(self, event):
         # if paintbrush is toggled on
         if self.paint_mode:
-            self.paint_pixels_image(event.pos())
+            self.pending_points.append(self.image_position(event.position()))
+            if not self.paint_timer.isActive():
+                self.paint_timer.start(self.frame_interval())
         # if paintbrush is toggled off
-        else: 
-            #ignore
-            pass
+        elif self.selection_origin is not None:
+            self.selection = self.selection_between(self.selection_origin, self.image_point(event.pos()))
+            self.update()
 
     '''
     This method handles when the mouse is released
     '''
     def mouseReleaseEvent(self, event):
+        self.flush_paint() # the end of the stroke
         self.prev_paint_loc = None # reset the location of last drawn point
-        
+        self.selection_origin = None
+        self.finish_stroke()
+
+    '''
+    This method adds the brush stroke in progress to the undo history
+    '''
+    def finish_stroke(self):
+        self.brush_stroke = None
+        if self.stroke is not None:
+            delta = self.stroke.finish(self.image)
+            if delta is not None:
+                # only the tiles the stroke went over are counted again
+                self.live_histogram.update(self.stroke_key, self.image,
+                                           [(delta.before[key], delta.after[key]) for key in delta.before])
+            self.history.push(delta)
+            self.stroke = None
+            self.image_changed.emit()
+
+    '''
+    This method replaces the image on the canvas with the result of an edit and records it for undo
+    redo_function replays the edit on an image; undo_function, when given, is its exact inverse
+    so nothing but the two functions needs to be stored
+    Otherwise only the tiles the edit changed are kept, or the whole previous image
+    when the size or format changed; after_image is kept when the edit cannot be replayed
+    '''
+    def commit_edit(self, edited, redo_function=None, undo_function=None, after_image=None):
+        self.finish_stroke()
+        previous = self.image
+        # keep what is needed to undo the edit
+        with trace.span("undo record", edited):
+            if undo_function is not None:
+                entry = history.OperationRecord(redo_function, undo_function)
+            elif (redo_function is not None and previous.size() == edited.size() and previous.format() == edited.format()
+                  and previous.format() in buffers.EDITABLE_FORMATS):
+                entry = history.TileDelta.from_images(previous, edited, redo_function)
+            else:
+                entry = history.FrameRecord(previous, redo_function, after_image)
+        if isinstance(entry, history.TileDelta):
+            self.live_histogram.update_regions(previous, edited, entry.rects())
+        self.history.push(entry)
+
+        self.image = edited
+        self.update_canvas()
+
+    '''
+    This method returns the edit graph whose result is image
+    The graph starts over from image when the image was changed outside of it (e.g. painted on)
+    '''
+    def graph_of(self, image):
+        if not self.graph.is_output(image):
+            # the image is new to the cache when it was painted on; it is not hashed for so little chance of a hit
+            result_cache.mark_unique(image)
+            self.graph = self.graph.rebase(image)
+        return self.graph
+
+    '''
+    This method adds an operation of core.OPERATIONS to the edit graph and shows the result
+    With background the graph is computed on a worker thread; the result is dropped
+    if the image was changed in the meantime (e.g. painted on or undone)
+    '''
+    def edit_graph(self, name, *args, background=False):
+        before = self.graph_of(self.image)
+        if self.selection is not None and name in core.REGION_OPERATIONS:
+            # only the selected pixels are computed and changed
+            after = before.append("region", self.selection, name, args)
+        else:
+            after = before.append(name, *args)
+            # the selection does not fit the image anymore once it is turned or cropped
+            self.selection = None
+        if not background:
+            self.commit_graph(before, after, after.render())
+            return
+
+        source_key = self.image.cacheKey()
+
+        def apply_result(result):
+            if self.image.cacheKey() == source_key:
+                self.commit_graph(before, after, result)
+
+        self.runner.submit(self.image, lambda image, progress: after.render(progress), apply_result, name)
+
+    '''
+    This method makes after the edit graph of the image and records the change for undo
+    Undoing or redoing only switches between the two graphs, whose results are usually cached
+    The tiles the edit changed are kept too when the result before it was computed, so undoing
+    does not compute it again once the cache dropped it
+    '''
+    def commit_graph(self, before, after, result=None):
+        self.finish_stroke()
+        previous = self.image
+        result = after.render() if result is None else result
+        delta = None
+        if (before.nodes and previous.size() == result.size() and previous.format() == result.format()
+                and previous.format() in buffers.EDITABLE_FORMATS):
+            with trace.span("undo record", result):
+                delta = history.TileDelta.from_images(previous, result, lambda image: self.switch_graph(after))
+        self.graph = after
+        self.image = result
+        self.history.push(history.GraphRecord(before, after, self.switch_graph, delta))
+        if after.nodes and after.nodes[-1][0] == "region":
+            # only the selection changed
+            self.live_histogram.update_regions(previous, self.image, [after.nodes[-1][1][0].rect()])
+        self.update_canvas()
+
+    '''
+    This method makes graph the edit graph of the image and returns its result
+    result, when given, is that result obtained some other way, which the graph adopts
+    '''
+    def switch_graph(self, edit_graph, result=None):
+        self.graph = edit_graph
+        if result is None:
+            return edit_graph.render()
+        edit_graph.adopt(result)
+        return result
+
+    '''
+    This method cancels the filter running in the background, if any
+    '''
+    def cancel_background_work(self):
+        self.runner.cancel()
+
+    '''
+    This method undoes the last edit
+    '''
+    @trace.traced("undo")
+    def undo_edit(self):
+        self.finish_stroke()
+        if self.history.can_undo():
+            self.follow_history(self.history.undo_stack[-1], self.history.undo)
+        else:
+            self.errorMessage("nothing to undo", error="Undo")
+
+    '''
+    This method redoes the last undone edit
+    '''
+    @trace.traced("redo")
+    def redo_edit(self):
+        self.finish_stroke()
+        if self.history.can_redo():
+            self.follow_history(self.history.redo_stack[-1], self.history.redo)
+        else:
+            self.errorMessage("nothing to redo", error="Redo")
+
+    '''
+    This method replaces the image by the result of undoing or redoing entry, step being history.undo or history.redo
+    '''
+    def follow_history(self, entry, step):
+        previous = self.image
+        self.image = step(self.image)
+        if isinstance(entry, history.TileDelta):
+            self.live_histogram.update_regions(previous, self.image, entry.rects())
+        self.update_canvas()
+
+    '''
+    This method returns the histogram of the image (see image_editor_stats), None when there is no image
+    It is counted when first asked for and then kept up to date by the edits that change only regions of the image
+    '''
+    def image_histogram(self):
+        return self.live_histogram.of(self.image)
+
+    '''
+    This method shows the current image on the canvas
+    '''
+    def update_canvas(self):
+        self.pyramid.set_image(self.image)
+        self.resize(self.canvas_size())
+        self.update()
+        self.image_changed.emit()
+
+    '''
+    This method refreshes a rectangle of the canvas after the image was changed in place
+    Only that rectangle of the pyramid is computed again and repainted
+    '''
+    def update_canvas_rect(self, rect):
+        if rect.isEmpty():
+            return
+        self.pyramid.update_rect(self.image, rect)
+        self.update(display.ImagePyramid.widget_rect(rect, self.zoom))
+
+    '''
+    This method returns the size of the canvas: the size of the image at the current zoom
+    '''
+    def canvas_size(self):
+        size = self.image.size() if self.loading_size.isEmpty() else self.loading_size
+        return QSize(round(size.width() * self.zoom), round(size.height() * self.zoom))
+
+    '''
+    This method sets the zoom (widget pixels per image pixel), between 1/64 and 32
+    '''
+    def set_zoom(self, zoom):
+        self.zoom = min(max(zoom, 1 / 64), 32.0)
+        self.resize(self.canvas_size())
+        self.update()
+
+    '''
+    This method returns the image pixel under a point of the canvas
+    '''
+    def image_point(self, point):
+        return QPoint(int(point.x() / self.zoom), int(point.y() / self.zoom))
+
+    '''
+    This method returns the exact position (x, y) in the image of a point of the canvas, between pixels when zoomed in
+    '''
+    def image_position(self, point):
+        return (point.x() / self.zoom, point.y() / self.zoom)
+
+    '''
+    This method returns the time between two refreshes of the screen showing the canvas, in milliseconds
+    '''
+    def frame_interval(self):
+        screen = self.screen()
+        refresh_rate = screen.refreshRate() if screen is not None else 0
+        return max(1, int(1000 / (refresh_rate if refresh_rate > 0 else 60)))
+
+    '''
+    This method asks for a zoom when the mouse wheel turns with ctrl held; without ctrl the canvas scrolls
+    '''
+    def wheelEvent(self, event):
+        if event.modifiers() & Qt.KeyboardModifier.ControlModifier and event.angleDelta().y() != 0:
+            self.zoom_requested.emit(1.25 if event.angleDelta().y() > 0 else 0.8, event.position().toPoint())
+            event.accept()
+        else:
+            super().wheelEvent(event)
+
+    '''
+    This method returns a proxy of the image about the size of the screen divided by reduction,
+    with the scale from the image to the proxy. Proxies are cached until the image changes
+    '''
+    def preview_proxy(self, reduction=1):
+        key = (self.image.cacheKey(), reduction)
+        if key not in self.proxy_cache:
+            # proxies of an older image are of no use anymore
+            self.proxy_cache = {k: v for k, v in self.proxy_cache.items() if k[0] == key[0]}
+            max_size = self.screen().availableGeometry().size() / reduction
+            if reduction == 1:
+                self.proxy_cache[key] = preview.make_proxy(self.image, max_size)
+            else:
+                # smaller proxies are made from the screen sized one, not from the full image
+                base, base_scale = self.preview_proxy(1)
+                proxy, scale = preview.make_proxy(base, max_size)
+                self.proxy_cache[key] = (proxy, base_scale * scale)
+        return self.proxy_cache[key]
+
+    '''
+    This method shows a preview (a filtered proxy) stretched over the canvas instead of the image
+    '''
+    def show_preview(self, image):
+        self.preview_pixmap = QPixmap.fromImage(image)
+        self.update()
+
+    '''
+    This method goes back to showing the image after a preview
+    '''
+    def clear_preview(self):
+        self.preview_pixmap = None
+        self.update()
+
+    '''
+    This method draws the exposed part of the canvas pixmap (or of the preview) on the widget
+    '''
+    def paintEvent(self, event):
+        if self.image.isNull() and self.preview_pixmap is None:
+            super().paintEvent(event)
+            return
+        rect = event.rect()
+        with trace.span("repaint", width=rect.width(), height=rect.height()):
+            self.draw_canvas(rect)
+
+    '''
+    This method draws a rectangle of the canvas from the pyramid level matching the zoom (or from the preview)
+    '''
+    def draw_canvas(self, rect):
+        painter = QPainter(self)
+        if self.preview_pixmap is not None:
+            # map the exposed rectangle of the canvas to the same part of the smaller preview
+            scale_x = self.preview_pixmap.width() / self.width()
+            scale_y = self.preview_pixmap.height() / self.height()
+            source = QRectF(rect.x() * scale_x, rect.y() * scale_y, rect.width() * scale_x, rect.height() * scale_y)
+            painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+            painter.drawPixmap(QRectF(rect), self.preview_pixmap, source)
+        else:
+            level_index = self.pyramid.level_for_zoom(self.zoom)
+            level = self.pyramid.level(level_index)
+            scale = self.zoom * 2**level_index # widget pixels per pixel of the level
+            source = QRectF(rect.x() / scale, rect.y() / scale, rect.width() / scale, rect.height() / scale)
+            # smooth when reducing, sharp pixels when zoomed in
+            painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, scale < 1)
+            painter.drawImage(QRectF(rect), level, source)
+        if self.selection is not None:
+            self.draw_selection(painter)
+        painter.end()
+
+    '''
+    This method draws the outline of the selection, dashed black over white so it shows on any image
+    '''
+    def draw_selection(self, painter):
+        outline = QRectF(display.ImagePyramid.widget_rect(self.selection.rect(), self.zoom)).adjusted(0.5, 0.5, -0.5, -0.5)
+        for color, style in ((Qt.GlobalColor.white, Qt.PenStyle.SolidLine), (Qt.GlobalColor.black, Qt.PenStyle.DashLine)):
+            painter.setPen(QPen(color, 1, style))
+            if self.selection.shape == "ellipse":
+                painter.drawEllipse(outline)
+            else:
+                painter.drawRect(outline)
+
     '''
     This method handles error messages
     '''
@@ -0,0 +1,106 @@
+from PyQt6.QtGui import QImage
+import image_editor_cache as result_cache
+import image_editor_core as core
+
+'''
+This module holds the lazy, non destructive edit graph of the image editor
+An EditGraph is a source image and the list of operations applied to it since; nothing is
+computed until the result is needed (to show it or save it). The operations are fused before
+they run (see core.fuse_chain): any sequence of rotations and mirrors is a single exact
+permutation of the source pixels and consecutive point operations a single lookup table.
+The result of every step is cached (see image_editor_cache) under the fingerprint of the source
+and the operations leading to it, so changing the end of the graph (adding an operation, undoing
+the last one) only computes what comes after the longest part that did not change, and a graph
+repeating the steps of another one on the same pixels (after a revert) finds them computed.
+
+Graphs are values: append, pop and rebase return a new graph sharing the cache of the old one,
+so the undo history can keep the graph of every step at no cost.
+'''
+
+'''
+This class is a source image with the operations to apply to it, as (name, args) tuples
+with the names and arguments of core.OPERATIONS
+'''
+class EditGraph:
+
+    def __init__(self, source, nodes=(), cache=None):
+        self.source = QImage(source) # shallow copy; painting on the caller's image in place detaches it from this one
+        self.nodes = tuple(nodes)
+        self.cache = cache if cache is not None else result_cache.results
+        self.output_key = source.cacheKey() if not self.nodes else None # cacheKey of the last rendered result
+
+    '''
+    This method returns the graph with one more operation
+    '''
+    def append(self, name, *args):
+        return EditGraph(self.source, self.nodes + ((name, args),), self.cache)
+
+    '''
+    This method returns the graph without its last operation
+    '''
+    def pop(self):
+        return EditGraph(self.source, self.nodes[:-1], self.cache)
+
+    '''
+    This method returns an empty graph on a new source, e.g. after the image was painted on
+    '''
+    def rebase(self, image):
+        return EditGraph(image, (), self.cache)
+
+    '''
+    This method returns True when image is the result of this graph (it was not changed since)
+    '''
+    def is_output(self, image):
+        return self.output_key is not None and image.cacheKey() == self.output_key
+
+    '''
+    This method returns True when the result of the graph is known without computing anything:
+    the graph has no operation left once fused, or its result is cached
+    '''
+    def is_cached(self):
+        steps = core.fuse_chain(self.nodes)
+        return not steps or self._key(steps[-1][2]) in self.cache
+
+    '''
+    This method records image, obtained some other way (e.g. undoing the tiles an edit changed), as the result of the graph
+    '''
+    def adopt(self, image):
+        steps = core.fuse_chain(self.nodes)
+        if steps:
+            self.cache.put(self._key(steps[-1][2]), image)
+            result_cache.derive(image, self._key(steps[-1][2]))
+        self.output_key = image.cacheKey()
+
+    '''
+    This method returns the key of the result of the first end operations, which is also its fingerprint
+    The source is hashed the first time only, and only if nothing named it before (see image_editor_cache)
+    '''
+    def _key(self, end):
+        return (result_cache.fingerprint(self.source), self.nodes[:end])
+
+    '''
+    This method computes the result of the graph, starting from the longest cached part of it
+    progress(fraction) is called as the steps run and may raise OperationCancelled (see core.run_filter)
+    '''
+    def render(self, progress=None):
+        steps = core.fuse_chain(self.nodes)
+        image, first = self.source, 0
+        for index in range(len(steps) - 1, -1, -1):
+            cached = self.cache.get(self._key(steps[index][2]))
+            if cached is not None:
+                image, first = cached, index + 1
+                result_cache.derive(image, self._key(steps[index][2]))
+                break
+
+        remaining = steps[first:]
+        for index, (name, args, end) in enumerate(remaining):
+            step_progress = None
+            if progress is not None:
+                step_progress = lambda fraction, index=index: progress((index + fraction) / len(remaining))
+            image = core.apply_step(image, name, args, step_progress)
+            self.cache.put(self._key(end), image)
+            result_cache.derive(image, self._key(end))
+
+        self.output_key = image.cacheKey()
+        # a shallow copy, so the source and the cached results stay as they are if it is painted on
+        return QImage(image)
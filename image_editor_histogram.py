@@ -0,0 +1,107 @@
+from PyQt6.QtWidgets import QWidget, QLabel, QVBoxLayout
+from PyQt6.QtCore import Qt, QPointF, QSize, QTimer
+from PyQt6.QtGui import QPainter, QPolygonF, QColor, QFontDatabase
+import image_editor_lazy as lazy
+import image_editor_stats as stats
+np = lazy.module("numpy")
+
+'''
+This module holds the histogram panel of the image editor
+The panel follows the image of the canvas: it asks for the histogram when the image changes, which
+only counts the regions an edit changed (see image_editor_stats.LiveHistogram), and not at all while hidden
+'''
+
+# colors the histogram of each channel is drawn in, in the order of stats.CHANNELS
+CHANNEL_COLORS = (QColor(220, 40, 40, 140), QColor(40, 170, 40, 140), QColor(40, 80, 220, 140), QColor(90, 90, 90, 110))
+LUMINANCE = stats.CHANNELS.index("luminance")
+
+'''
+This class draws the histograms of the red, green and blue channels over the luminance histogram
+Counts are drawn on a square root scale so that small peaks stay visible next to large ones
+'''
+class HistogramView(QWidget):
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.counts = None # counts of stats.Histogram being shown, None for no image
+        self.setMinimumSize(256, 120)
+
+    def sizeHint(self):
+        return QSize(300, 160)
+
+    def set_counts(self, counts):
+        self.counts = counts
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor("white"))
+        if self.counts is None or self.counts[LUMINANCE].sum() == 0:
+            return
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        heights = np.sqrt(self.counts.astype(np.float64))
+        heights /= max(heights.max(), 1)
+        width, height = self.width(), self.height()
+        xs = np.arange(256) * (width - 1) / 255
+        # the luminance is drawn first, filled, under the channels
+        for row in (LUMINANCE, 0, 1, 2):
+            points = [QPointF(x, (height - 1) * (1 - y)) for x, y in zip(xs, heights[row])]
+            if row == LUMINANCE:
+                painter.setPen(Qt.PenStyle.NoPen)
+                painter.setBrush(CHANNEL_COLORS[row])
+                painter.drawPolygon(QPolygonF([QPointF(0, height - 1)] + points + [QPointF(width - 1, height - 1)]))
+            else:
+                painter.setPen(CHANNEL_COLORS[row])
+                painter.setBrush(Qt.BrushStyle.NoBrush)
+                painter.drawPolyline(QPolygonF(points))
+
+'''
+This class is the histogram panel: the histograms of the image of canvas (an EditorFunctions)
+with the minimum, maximum, mean and median of each channel
+'''
+class HistogramPanel(QWidget):
+
+    def __init__(self, canvas, parent=None):
+        super().__init__(parent)
+        self.canvas = canvas
+        self.view = HistogramView(self)
+        self.summary = QLabel(self)
+        self.summary.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        self.summary.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.view, 1)
+        layout.addWidget(self.summary)
+
+        # any number of changes in a row is shown once, when the editor is idle again
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.timeout.connect(self.refresh)
+        canvas.image_changed.connect(self.schedule_refresh)
+
+    def schedule_refresh(self):
+        if self.isVisible() and not self.refresh_timer.isActive():
+            self.refresh_timer.start(0)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.schedule_refresh()
+
+    '''
+    This method shows the histogram of the image as it is now
+    '''
+    def refresh(self):
+        # strokes are counted when they end, which shows them again
+        if self.canvas.stroke is not None:
+            return
+        histogram = self.canvas.image_histogram()
+        if histogram is None:
+            self.view.set_counts(None)
+            self.summary.setText("No image")
+            return
+        # a copy, the histogram of the canvas changes with the image
+        self.view.set_counts(histogram.counts.copy())
+        lines = ["%-9s %4s %4s %7s %6s" % ("", "min", "max", "mean", "median")]
+        for name, (minimum, maximum, mean, median) in histogram.summary().items():
+            lines.append("%-9s %4d %4d %7.1f %6d" % (name, minimum, maximum, mean, median))
+        self.summary.setText("\n".join(lines))
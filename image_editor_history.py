@@ -0,0 +1,384 @@
+import zlib
+from PyQt6.QtCore import QRect
+from PyQt6.QtGui import QImage
+import image_editor_buffers as buffers
+import image_editor_lazy as lazy
+np = lazy.module("numpy")
+
+'''
+This module holds the undo/redo history of the image editor
+Edits are not stored as whole images. Each step keeps only what is needed to go back and forth:
+    * TileDelta - the tiles of the image an edit changed (e.g. a brush stroke), before and after
+    * OperationRecord - an operation and its inverse, no pixels at all
+    * GraphRecord - a change of the edit graph, undone and redone by switching graphs
+    * FrameRecord - the previous image, for edits that change the size or format (e.g. grayscale)
+Edits that can be replayed (filters) keep a redo function instead of their result.
+The history has a byte budget: when it is exceeded the oldest entries are compressed, then dropped.
+The budget counts the images entries keep alive as well, such as the sources of the edit graphs.
+'''
+
+TILE_SIZE = 64 # side of the square tiles deltas are stored in
+DEFAULT_BYTE_BUDGET = 256 * 1024 * 1024 # default memory budget of the whole history
+
+'''
+This class stores the tiles a single edit changed, in place on an image of fixed size and format
+before holds the original content of the tiles; after holds their new content, or is None
+when the edit can be replayed with redo_function instead
+'''
+class TileDelta:
+
+    def __init__(self, before, after=None, redo_function=None):
+        self.before = before # {(tile_row, tile_column): tile pixels}
+        self.after = after
+        self.redo_function = redo_function
+        self.compressed = False
+
+    '''
+    This method builds a delta by comparing an image with the result of an edit
+    Only tiles that differ are kept
+    '''
+    @classmethod
+    def from_images(cls, before_image, after_image, redo_function=None):
+        before_array = buffers.image_to_array(before_image)
+        after_array = buffers.image_to_array(after_image)
+        before, after = {}, {}
+        for key in _changed_tiles(before_array, after_array):
+            tile_slice = _tile_slice(*key)
+            before[key] = before_array[tile_slice].copy()
+            if redo_function is None:
+                after[key] = after_array[tile_slice].copy()
+        return cls(before, None if redo_function is not None else after, redo_function)
+
+    def undo(self, image):
+        return self._write(image, self.before)
+
+    def redo(self, image):
+        if self.after is None:
+            return self.redo_function(image)
+        return self._write(image, self.after)
+
+    '''
+    This method writes stored tiles back into the image and returns it
+    '''
+    def _write(self, image, tiles):
+        image = QImage(image) # shallow copy; writing detaches it from anything it shares pixels with
+        array = buffers.image_to_array(image, writable=True)
+        for (tile_row, tile_column), tile in tiles.items():
+            if self.compressed:
+                tile = _decompress(tile)
+            top, left = tile_row*TILE_SIZE, tile_column*TILE_SIZE
+            array[top:top + tile.shape[0], left:left + tile.shape[1]] = tile
+        return image
+
+    '''
+    This method returns the rectangles of the image the stored tiles cover
+    '''
+    def rects(self):
+        rects = []
+        for (tile_row, tile_column), tile in self.before.items():
+            height, width = (tile[1] if self.compressed else tile.shape)[:2]
+            rects.append(QRect(tile_column*TILE_SIZE, tile_row*TILE_SIZE, width, height))
+        return rects
+
+    def compress(self):
+        if not self.compressed:
+            self.before = {key: _compress(tile) for key, tile in self.before.items()}
+            if self.after is not None:
+                self.after = {key: _compress(tile) for key, tile in self.after.items()}
+            self.compressed = True
+
+    @property
+    def nbytes(self):
+        total = 0
+        for tiles in (self.before, self.after or {}):
+            for tile in tiles.values():
+                total += len(tile[0]) if self.compressed else tile.nbytes
+        return total
+
+'''
+This class records the tiles touched by a brush stroke while it is being painted
+touch must be called with each rectangle before it is painted on;
+finish turns the stroke into a TileDelta once the stroke is over
+'''
+class StrokeRecorder:
+
+    def __init__(self):
+        self.before = {}
+
+    def touch(self, image, rect):
+        array = buffers.image_to_array(image)
+        height, width = array.shape[:2]
+        first_row, last_row = max(rect.top(), 0) // TILE_SIZE, min(rect.bottom(), height - 1) // TILE_SIZE
+        first_column, last_column = max(rect.left(), 0) // TILE_SIZE, min(rect.right(), width - 1) // TILE_SIZE
+        for tile_row in range(first_row, last_row + 1):
+            for tile_column in range(first_column, last_column + 1):
+                if (tile_row, tile_column) not in self.before:
+                    self.before[(tile_row, tile_column)] = array[_tile_slice(tile_row, tile_column)].copy()
+
+    '''
+    This method returns a copy of the pixels of rect as they were before the stroke; rect must have been touched
+    '''
+    def original(self, rect):
+        first = next(iter(self.before.values()))
+        pixels = np.empty((rect.height(), rect.width()) + first.shape[2:], dtype=first.dtype)
+        top, left = rect.top(), rect.left()
+        for tile_row in range(top // TILE_SIZE, rect.bottom() // TILE_SIZE + 1):
+            for tile_column in range(left // TILE_SIZE, rect.right() // TILE_SIZE + 1):
+                tile = self.before[(tile_row, tile_column)]
+                # the part of the tile inside rect, in the coordinates of the tile and of rect
+                tile_top, tile_left = tile_row * TILE_SIZE, tile_column * TILE_SIZE
+                row_start, column_start = max(top, tile_top), max(left, tile_left)
+                row_end = min(top + rect.height(), tile_top + tile.shape[0])
+                column_end = min(left + rect.width(), tile_left + tile.shape[1])
+                pixels[row_start - top:row_end - top, column_start - left:column_end - left] = \
+                    tile[row_start - tile_top:row_end - tile_top, column_start - tile_left:column_end - tile_left]
+        return pixels
+
+    def finish(self, image):
+        if not self.before:
+            return None
+        array = buffers.image_to_array(image)
+        after = {key: array[_tile_slice(*key)].copy() for key in self.before}
+        return TileDelta(self.before, after)
+
+'''
+This class records an invertible operation: nothing but the function and its inverse is stored
+'''
+class OperationRecord:
+
+    def __init__(self, forward, backward):
+        self.forward = forward
+        self.backward = backward
+        self.compressed = False
+        self.nbytes = 0
+
+    def undo(self, image):
+        return self.backward(image)
+
+    def redo(self, image):
+        return self.forward(image)
+
+    def compress(self):
+        pass
+
+'''
+This class records a change of the edit graph (see image_editor_graph): undo and redo switch between
+the graph before the edit and the graph after it, whose results are usually cached
+    switch(graph, result) makes graph the edit graph of the image and returns its result,
+    computing it when result is None
+    delta is a TileDelta from the result before the edit to the result after it, so undoing does not
+    compute the graph before again once its result was dropped from the cache; it is None when that
+    result is only the source of the graph
+The graphs keep their source images alive; the history counts them, once, in its budget (see EditHistory.nbytes)
+'''
+class GraphRecord:
+
+    def __init__(self, before, after, switch, delta=None):
+        self.before = before
+        self.after = after
+        self.switch = switch
+        self.delta = delta
+        self.compressed = False
+
+    def undo(self, image):
+        if self.delta is None or self.before.is_cached():
+            return self.switch(self.before, None)
+        return self.switch(self.before, self.delta.undo(image))
+
+    def redo(self, image):
+        return self.switch(self.after, None)
+
+    '''
+    This method returns the images the record keeps alive
+    '''
+    def frames(self):
+        return [self.before.source, self.after.source]
+
+    def compress(self):
+        if self.delta is not None:
+            self.delta.compress()
+        self.compressed = True
+
+    @property
+    def nbytes(self):
+        return 0 if self.delta is None else self.delta.nbytes
+
+'''
+This class stores the whole previous image, for edits that change its size or format
+The edit itself is replayed with redo_function, or restored from after_image
+'''
+class FrameRecord:
+
+    def __init__(self, before_image, redo_function=None, after_image=None):
+        self.before = QImage(before_image) # shallow copy, shares pixels until either side is modified
+        self.after = None if after_image is None else QImage(after_image)
+        self.redo_function = redo_function
+        self.compressed = False
+
+    def undo(self, image):
+        return _restore(self.before) if self.compressed else QImage(self.before)
+
+    def redo(self, image):
+        if self.redo_function is not None:
+            return self.redo_function(image)
+        return _restore(self.after) if self.compressed else QImage(self.after)
+
+    def compress(self):
+        if not self.compressed:
+            self.before = _freeze(self.before)
+            if self.after is not None:
+                self.after = _freeze(self.after)
+            self.compressed = True
+
+    @property
+    def nbytes(self):
+        total = 0
+        for frame in (self.before, self.after):
+            if frame is not None:
+                total += len(frame[0]) if self.compressed else frame.sizeInBytes()
+        return total
+
+'''
+This class is the undo/redo stack of the editor
+byte_budget bounds the memory of all entries together
+held_frames, when given, returns the images kept alive outside of the history (e.g. the image on the canvas):
+entries holding them too free nothing when they are dropped, so they are not counted
+'''
+class EditHistory:
+
+    def __init__(self, byte_budget=DEFAULT_BYTE_BUDGET, held_frames=None):
+        self.byte_budget = byte_budget
+        self.held_frames = held_frames
+        self.replace([], [])
+
+    def clear(self):
+        self.replace([], [])
+
+    '''
+    This method replaces all entries of the history, e.g. with the ones read from a project
+    '''
+    def replace(self, undo_stack, redo_stack):
+        self.undo_stack = list(undo_stack)
+        self.redo_stack = list(redo_stack)
+        # running totals, updated as entries come and go instead of walking the stacks
+        self.entry_bytes = 0 # what the entries store
+        self.frame_bytes = 0 # the images graph records keep alive, each counted once
+        self.frames = {} # cacheKey of each of those images -> [number of references, size in bytes]
+        for entry in self.undo_stack + self.redo_stack:
+            self._count(entry, 1)
+
+    '''
+    This method adds an entry for an edit that was just applied
+    Anything that could be redone is forgotten
+    '''
+    def push(self, entry):
+        if entry is None:
+            return
+        for dropped in self.redo_stack:
+            self._count(dropped, -1)
+        self.redo_stack = []
+        self.undo_stack.append(entry)
+        self._count(entry, 1)
+        self.enforce_budget()
+
+    def can_undo(self):
+        return len(self.undo_stack) > 0
+
+    def can_redo(self):
+        return len(self.redo_stack) > 0
+
+    '''
+    This method undoes the last edit of image and returns the resulting image
+    '''
+    def undo(self, image):
+        entry = self.undo_stack.pop()
+        self.redo_stack.append(entry)
+        return entry.undo(image)
+
+    '''
+    This method redoes the last undone edit of image and returns the resulting image
+    '''
+    def redo(self, image):
+        entry = self.redo_stack.pop()
+        self.undo_stack.append(entry)
+        return entry.redo(image)
+
+    '''
+    This property is the memory of all entries: what they store, and the images of graph records
+    that nothing but the history holds, each one counted once however many entries share it
+    '''
+    @property
+    def nbytes(self):
+        held = set() if self.held_frames is None else {frame.cacheKey() for frame in self.held_frames()}
+        return self.entry_bytes + self.frame_bytes - sum(self.frames[key][1] for key in held if key in self.frames)
+
+    '''
+    This method keeps the history within its byte budget
+    The oldest entries are compressed first; if that is not enough they are dropped
+    '''
+    def enforce_budget(self):
+        total = self.nbytes
+        for entry in self.undo_stack:
+            if total <= self.byte_budget:
+                return
+            if not entry.compressed:
+                stored = entry.nbytes
+                entry.compress()
+                self.entry_bytes += entry.nbytes - stored
+                total += entry.nbytes - stored
+        while total > self.byte_budget and self.undo_stack:
+            self._count(self.undo_stack.pop(0), -1)
+            total = self.nbytes
+
+    '''
+    This method adds (sign 1) or removes (sign -1) an entry from the running totals
+    The images of graph records are counted by reference, so an image shared by entries is freed with the last of them
+    '''
+    def _count(self, entry, sign):
+        self.entry_bytes += sign * entry.nbytes
+        if isinstance(entry, GraphRecord):
+            for frame in entry.frames():
+                references = self.frames.setdefault(frame.cacheKey(), [0, frame.sizeInBytes()])
+                if references[0] == 0:
+                    self.frame_bytes += references[1]
+                references[0] += sign
+                if references[0] == 0:
+                    self.frame_bytes -= references[1]
+                    del self.frames[frame.cacheKey()]
+
+
+'''
+This function lists the tiles whose pixels differ between two arrays of the same shape as (tile_row, tile_column)
+Each band of tiles is compared in one pass over its whole rows, reduced to one flag per column, then per tile column
+'''
+def _changed_tiles(before_array, after_array):
+    height, width = before_array.shape[:2]
+    channels = before_array.shape[2] if before_array.ndim == 3 else 1
+    column_starts = np.arange(0, width, TILE_SIZE)
+    for tile_row in range((height + TILE_SIZE - 1) // TILE_SIZE):
+        band = slice(tile_row*TILE_SIZE, (tile_row + 1)*TILE_SIZE)
+        changed = (before_array[band] != after_array[band]).reshape(-1, width * channels).any(axis=0)
+        changed = changed.reshape(width, channels).any(axis=1)
+        for tile_column in np.flatnonzero(np.logical_or.reduceat(changed, column_starts)):
+            yield tile_row, int(tile_column)
+
+def _tile_slice(tile_row, tile_column):
+    return (slice(tile_row*TILE_SIZE, (tile_row + 1)*TILE_SIZE),
+            slice(tile_column*TILE_SIZE, (tile_column + 1)*TILE_SIZE))
+
+'''
+These functions compress tiles and frames with zlib, keeping what is needed to restore them
+'''
+def _compress(tile):
+    return zlib.compress(np.ascontiguousarray(tile).tobytes(), 1), tile.shape
+
+def _decompress(compressed):
+    data, shape = compressed
+    return np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(shape)
+
+def _freeze(image):
+    return _compress(buffers.image_to_array(image)) + (image.format(),)
+
+def _restore(frozen):
+    data, shape, image_format = frozen
+    return buffers.array_to_image(_decompress((data, shape)), image_format)
@@ -0,0 +1,85 @@
+import argparse
+import os
+import sys
+from PyQt6.QtCore import Qt
+from PyQt6.QtGui import QIcon, QImage, QPainter, QPixmap
+
+'''
+This module gives the editor its icons
+The icons of the icons directory are kept in one prebuilt atlas (icons/atlas.png), each one already
+scaled down to CELL_SIZE in a row of cells, so starting the editor reads and decodes one small file
+instead of every icon at its full size (up to 512 pixels). The names of the icons are saved in the
+atlas, in the order of the cells. Icons are found next to this file, wherever the editor is started from.
+The atlas is built again after adding or changing an icon with
+    python image_editor_icons.py
+An icon that is not in the atlas yet is read from its own file.
+'''
+
+ICON_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "icons")
+ATLAS_PATH = os.path.join(ICON_DIRECTORY, "atlas.png")
+CELL_SIZE = 64 # icons are shown at 30 pixels at most, this keeps them sharp on screens of twice the density
+NAMES_KEY = "icons" # text of the atlas listing the names of the icons, comma separated
+
+_atlas = None # (atlas QImage, names of its cells) once read
+_icons = {} # name: QIcon
+
+'''
+This function returns the QIcon named name, the name of its file in the icons directory without .png
+'''
+def icon(name):
+    if name not in _icons:
+        atlas, names = _read_atlas()
+        if name in names:
+            cell = atlas.copy(names.index(name) * CELL_SIZE, 0, CELL_SIZE, CELL_SIZE)
+            _icons[name] = QIcon(QPixmap.fromImage(cell))
+        else:
+            _icons[name] = QIcon(os.path.join(ICON_DIRECTORY, name + ".png"))
+    return _icons[name]
+
+def _read_atlas():
+    global _atlas
+    if _atlas is None:
+        atlas = QImage(ATLAS_PATH)
+        names = atlas.text(NAMES_KEY).split(",") if not atlas.isNull() and atlas.text(NAMES_KEY) else []
+        _atlas = (atlas, names)
+    return _atlas
+
+'''
+This function builds the atlas at path from the .png icons of directory and returns the names of its icons
+Every icon is scaled to fit a cell keeping its proportions, centered on a transparent background
+'''
+def build_atlas(directory=ICON_DIRECTORY, path=ATLAS_PATH):
+    names = sorted(os.path.splitext(name)[0] for name in os.listdir(directory)
+                   if name.lower().endswith(".png") and os.path.join(directory, name) != path)
+    atlas = QImage(CELL_SIZE * max(len(names), 1), CELL_SIZE, QImage.Format.Format_ARGB32_Premultiplied)
+    atlas.fill(Qt.GlobalColor.transparent)
+    painter = QPainter(atlas)
+    for index, name in enumerate(names):
+        source = QImage(os.path.join(directory, name + ".png"))
+        if source.isNull():
+            painter.end()
+            raise ValueError("cannot read icon %s" % name)
+        scaled = source.scaled(CELL_SIZE, CELL_SIZE, Qt.AspectRatioMode.KeepAspectRatio,
+                               Qt.TransformationMode.SmoothTransformation)
+        painter.drawImage(index * CELL_SIZE + (CELL_SIZE - scaled.width()) // 2, (CELL_SIZE - scaled.height()) // 2, scaled)
+    painter.end()
+    atlas.setText(NAMES_KEY, ",".join(names))
+    if not atlas.save(path, "png"):
+        raise OSError("cannot write %s" % path)
+    return names
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the icon atlas of the editor from its icons.")
+    parser.add_argument("--directory", default=ICON_DIRECTORY, help="directory of the .png icons")
+    parser.add_argument("--output", help="path of the atlas (default: atlas.png in the directory)")
+    args = parser.parse_args(argv)
+    try:
+        names = build_atlas(args.directory, args.output or os.path.join(args.directory, "atlas.png"))
+    except (OSError, ValueError) as error:
+        print(error, file=sys.stderr)
+        return 1
+    print("%d icons in the atlas: %s" % (len(names), ", ".join(names)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
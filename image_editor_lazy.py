@@ -0,0 +1,34 @@
+import importlib
+import sys
+import types
+
+'''
+This module lets the editor start without importing the modules that take long to import (numpy and cv2
+take most of the time the editor used to need before its window was shown). A module asks for them with
+    np = lazy.module("numpy")
+instead of import numpy as np, and the module is imported the first time one of its attributes is used,
+which is when the first image is opened or filtered. Modules must not use them when they are imported:
+constants built from them are built when first needed instead.
+'''
+
+'''
+This class stands for a module that is not imported yet
+The first attribute asked for imports the module and copies its attributes in, then turns this object
+into a plain module, so that from then on its attributes are found as fast as on the module itself
+'''
+class DeferredModule(types.ModuleType):
+
+    def __getattr__(self, name):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        self.__class__ = types.ModuleType
+        return getattr(module, name)
+
+'''
+This function returns the module named name: the module itself when it is already imported,
+otherwise a DeferredModule importing it when it is first used
+'''
+def module(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    return DeferredModule(name)
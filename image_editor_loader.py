@@ -0,0 +1,191 @@
+import threading
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, QCoreApplication, QSize, Qt, QBuffer, QByteArray, QIODevice, pyqtSignal
+from PyQt6.QtGui import QImage, QImageReader, QImageIOHandler
+import image_editor_buffers as buffers
+import image_editor_cache as result_cache
+import image_editor_project as project
+import image_editor_trace as trace
+
+'''
+This module opens image files without blocking the editor window
+The file is decoded on a worker thread. When the format can be decoded at a reduced size
+(JPEG: the decoder skips most of the DCT work), a preview about the size of the screen is
+decoded first and shown while the full resolution image is still being decoded.
+The EXIF orientation of photos is applied while decoding, so pictures taken with a rotated
+camera open upright. Project files (see image_editor_project) show the saved level of their
+pyramid that fits the preview size, then their current image.
+'''
+
+'''
+This function returns the size of the image in a file as it will be shown (after its EXIF
+orientation is applied), or an invalid QSize if the file cannot be read
+'''
+def oriented_size(reader):
+    size = reader.size()
+    if size.isValid() and reader.transformation() & QImageIOHandler.Transformation.TransformationRotate90:
+        size = size.transposed()
+    return size
+
+'''
+This function returns the size of the image of a file as it will be shown
+'''
+def image_size(path):
+    if project.is_project(path):
+        with project.ProjectFile(path) as project_file:
+            return project_file.size()
+    return oriented_size(QImageReader(path))
+
+'''
+This function decodes an image file, upright, in a format the editor can work on
+With max_size the image is decoded at a size fitting in it when the format allows it (see can_reduce)
+Raises ValueError when the file cannot be read
+'''
+def read_image(path, max_size=None):
+    if project.is_project(path):
+        return project.read_current(path, max_size)
+    reader = QImageReader(path)
+    reader.setAutoTransform(True)
+    if max_size is not None:
+        full_size = oriented_size(reader)
+        if full_size.isValid() and (full_size.width() > max_size.width() or full_size.height() > max_size.height()):
+            # the scaled size is that of the stored image, before the orientation is applied
+            scaled = full_size.scaled(max_size, Qt.AspectRatioMode.KeepAspectRatio)
+            if reader.transformation() & QImageIOHandler.Transformation.TransformationRotate90:
+                scaled = scaled.transposed()
+            reader.setScaledSize(scaled)
+    image = reader.read()
+    if image.isNull():
+        raise ValueError("cannot read image %s: %s" % (path, reader.errorString()))
+    return buffers.as_editable(image)
+
+'''
+This function decodes an image file held in memory (bytes), upright, in a format the editor can work on
+Returns (image, format of the file as a lowercase name, e.g. "png" or "jpeg")
+Raises ValueError when the data cannot be read
+'''
+def decode_image(data):
+    device = QBuffer()
+    device.setData(QByteArray(data))
+    device.open(QIODevice.OpenModeFlag.ReadOnly)
+    reader = QImageReader(device)
+    reader.setAutoTransform(True)
+    image = reader.read()
+    if image.isNull():
+        raise ValueError("cannot read image: %s" % reader.errorString())
+    return buffers.as_editable(image), bytes(reader.format()).decode().lower()
+
+'''
+This function returns True when the image in a file can be decoded faster at a reduced size
+'''
+def can_reduce(path):
+    if project.is_project(path):
+        return True
+    return QImageReader(path).supportsOption(QImageIOHandler.ImageOption.ScaledSize)
+
+'''
+This class holds the signals of a load; QRunnable is not a QObject so it cannot have any itself
+'''
+class LoadSignals(QObject):
+    preview = pyqtSignal(int, QImage, QSize) # load id, reduced image, size of the full image
+    loaded = pyqtSignal(int, QImage) # load id, full resolution image
+    failed = pyqtSignal(int, str) # load id, error message
+
+'''
+This class decodes one file on a worker thread: the preview first when preview_size is given, then the full image
+'''
+class LoadJob(QRunnable):
+
+    def __init__(self, load_id, path, preview_size=None):
+        super().__init__()
+        self.load_id = load_id
+        self.path = path
+        self.preview_size = preview_size
+        self.cancel_event = threading.Event()
+        self.signals = LoadSignals()
+        self.setAutoDelete(False) # the loader keeps the job until its signals have been handled
+
+    def run(self):
+        try:
+            if self.preview_size is not None and not self.cancel_event.is_set():
+                with trace.span("decode preview", category="open", path=self.path):
+                    preview = read_image(self.path, self.preview_size)
+                    full_size = image_size(self.path)
+                self.signals.preview.emit(self.load_id, preview, full_size)
+            if self.cancel_event.is_set():
+                # tells the loader it can forget the job
+                self.signals.failed.emit(self.load_id, "cancelled")
+                return
+            with trace.span("decode", category="open", path=self.path):
+                image = read_image(self.path)
+            # hashed here rather than on the GUI thread when the editor takes the image (see image_editor_cache)
+            result_cache.fingerprint(image)
+            self.signals.loaded.emit(self.load_id, image)
+        except Exception as error:
+            self.signals.failed.emit(self.load_id, str(error))
+
+'''
+This class opens files in the background and delivers the images of the latest file asked for
+on the GUI thread: preview_ready(reduced image, full size), then loaded(image), or failed(message)
+Asking for a new file drops whatever is still coming for the previous one
+'''
+class ImageLoader(QObject):
+
+    preview_ready = pyqtSignal(QImage, QSize)
+    loaded = pyqtSignal(QImage)
+    failed = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1) # one file at a time; a newer one waits for the decoder to be free
+        self.generation = 0
+        self.jobs = {}
+
+    '''
+    This method starts opening a file; preview_size is the largest size of the preview,
+    none is made when it is None or the format cannot be decoded at a reduced size
+    '''
+    def load(self, path, preview_size=None):
+        self.cancel()
+        self.generation += 1
+        if preview_size is not None and not can_reduce(path):
+            preview_size = None
+        job = LoadJob(self.generation, path, preview_size)
+        job.signals.preview.connect(self._preview)
+        job.signals.loaded.connect(self._loaded)
+        job.signals.failed.connect(self._failed)
+        self.jobs[job.load_id] = job
+        self.pool.start(job)
+        return job.load_id
+
+    '''
+    This method drops the file being opened, if any
+    '''
+    def cancel(self):
+        for job in self.jobs.values():
+            job.cancel_event.set()
+
+    def is_busy(self):
+        return self.generation in self.jobs
+
+    '''
+    This method blocks until the files being opened are done and their images delivered
+    Meant for scripts and benchmarks; the GUI never needs it
+    '''
+    def wait(self):
+        self.pool.waitForDone()
+        QCoreApplication.processEvents()
+
+    def _preview(self, load_id, image, full_size):
+        if load_id == self.generation:
+            self.preview_ready.emit(image, full_size)
+
+    def _loaded(self, load_id, image):
+        self.jobs.pop(load_id, None)
+        if load_id == self.generation:
+            self.loaded.emit(image)
+
+    def _failed(self, load_id, message):
+        self.jobs.pop(load_id, None)
+        if load_id == self.generation:
+            self.failed.emit(message)
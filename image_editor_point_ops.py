@@ -0,0 +1,178 @@
+from PyQt6.QtGui import QImage
+import image_editor_buffers as buffers
+import image_editor_lazy as lazy
+cv2 = lazy.module("cv2")
+np = lazy.module("numpy")
+
+'''
+This module holds the point operation engine of the image editor
+A point operation maps every channel value to a new value independently of its neighbours,
+so it can be written as a 256 entry lookup table (LUT) per channel and applied to the
+whole image buffer in one vectorized pass instead of visiting pixels one by one.
+Consecutive point operations compose into a single table, so a chain of them still costs one pass.
+'''
+
+'''
+This class represents a point operation as one lookup table per color channel
+Tables are stored in (red, green, blue) order as an array of shape (3, 256) of uint8
+Alpha is never touched by a lookup table
+'''
+class LookupTable:
+
+    def __init__(self, red, green=None, blue=None):
+        # a single table is shared by all three channels
+        green = red if green is None else green
+        blue = red if blue is None else blue
+        self.table = np.stack([np.asarray(red, dtype=np.uint8),
+                               np.asarray(green, dtype=np.uint8),
+                               np.asarray(blue, dtype=np.uint8)])
+
+    '''
+    This method builds a lookup table from a mapping of channel values
+    func takes a float array of the values 0..255 and returns the mapped values,
+    which are rounded and clamped to the 0..255 range
+    '''
+    @classmethod
+    def from_function(cls, func, green_func=None, blue_func=None):
+        tables = [_evaluate(f) for f in (func, green_func or func, blue_func or func)]
+        return cls(*tables)
+
+    '''
+    This method builds the lookup table that leaves every value unchanged
+    '''
+    @classmethod
+    def identity(cls):
+        return cls(np.arange(256, dtype=np.uint8))
+
+    '''
+    This method composes two lookup tables: the result applies self first and then other
+    '''
+    def then(self, other):
+        composed = LookupTable.identity()
+        for channel in range(3):
+            composed.table[channel] = other.table[channel][self.table[channel]]
+        return composed
+
+    '''
+    This method returns True if all channels share the same table
+    '''
+    def is_uniform(self):
+        return bool((self.table[0] == self.table[1]).all() and (self.table[0] == self.table[2]).all())
+
+    '''
+    This method returns True if the table leaves every value unchanged
+    '''
+    def is_identity(self):
+        return bool((self.table == np.arange(256, dtype=np.uint8)).all())
+
+    '''
+    This method applies the table to a numpy image buffer
+    arr is either (height, width) for grayscale or (height, width, 4) in the byte order
+    of QImage's 32 bit formats (blue, green, red, alpha)
+    out may be the same array as arr to map values in place
+    '''
+    def apply_to_array(self, arr, out=None):
+        if arr.ndim == 2:
+            if not self.is_uniform():
+                raise ValueError("a per channel lookup table cannot be applied to a single channel buffer")
+            lut = self.table[0]
+        else:
+            # cv2 wants one table per channel in buffer order (b, g, r, a), alpha left untouched
+            lut = np.empty((256, 1, 4), dtype=np.uint8)
+            lut[:, 0, 0] = self.table[2]
+            lut[:, 0, 1] = self.table[1]
+            lut[:, 0, 2] = self.table[0]
+            lut[:, 0, 3] = np.arange(256, dtype=np.uint8)
+        if out is None:
+            return cv2.LUT(arr, lut)
+        return cv2.LUT(arr, lut, dst=out)
+
+    '''
+    This method applies the table to a QImage and returns a new QImage
+    Grayscale images stay grayscale when the table treats all channels alike
+    '''
+    def apply(self, image):
+        if image.isNull():
+            return QImage(image)
+
+        if image.format() == QImage.Format.Format_Grayscale8 and self.is_uniform():
+            source = image
+        else:
+            source = buffers.as_format(image, buffers.color_format(image))
+
+        result, out = buffers.new_image_like(source)
+        self.apply_to_array(buffers.image_to_array(source), out=out)
+        return result
+
+
+'''
+This function composes lookup tables in the order they are given
+so that applying the result costs a single pass over the image
+'''
+def compose(*tables):
+    composed = LookupTable.identity()
+    for table in tables:
+        composed = composed.then(table)
+    return composed
+
+
+'''
+This function returns the lookup table of the contrast adjustment
+contrast_level is of type (int) in the range -255 to 255
+'''
+# uses algorithm from reference: https://www.dfstudios.co.uk/articles/programming/image-programming-algorithms/image-processing-algorithms-part-5-contrast-adjustment/
+def contrast_table(contrast_level):
+    contrast_factor = (259*(contrast_level + 255))/(255*(259 - contrast_level))
+    return LookupTable.from_function(lambda values: contrast_factor*(values - 128) + 128)
+
+
+'''
+This function returns the lookup table that adds brightness_level to every channel
+brightness_level is of type (int) in the range -255 to 255
+'''
+def brightness_table(brightness_level):
+    return LookupTable.from_function(lambda values: values + brightness_level)
+
+
+'''
+This function returns the lookup table of a gamma correction
+gamma is of type (float); values above 1 brighten the midtones and values below 1 darken them
+'''
+def gamma_table(gamma):
+    if gamma <= 0:
+        raise ValueError("gamma must be positive")
+    return LookupTable.from_function(lambda values: 255*(values/255)**(1/gamma))
+
+
+'''
+This function returns the lookup table of a levels adjustment
+Input values between black_point and white_point are stretched to output_black..output_white,
+with an optional gamma applied to the midtones
+'''
+def levels_table(black_point, white_point, gamma=1.0, output_black=0, output_white=255):
+    if white_point <= black_point:
+        raise ValueError("white point must be greater than black point")
+    if gamma <= 0:
+        raise ValueError("gamma must be positive")
+
+    def levels(values):
+        normalized = np.clip((values - black_point)/(white_point - black_point), 0, 1)
+        return output_black + (output_white - output_black)*normalized**(1/gamma)
+
+    return LookupTable.from_function(levels)
+
+
+'''
+This function returns the lookup table that inverts every channel (negative effect)
+'''
+def invert_table():
+    return LookupTable(np.arange(255, -1, -1, dtype=np.uint8))
+
+
+'''
+This function evaluates a mapping over every channel value and rounds it into a uint8 table
+The mapping is evaluated once per value instead of once per pixel
+'''
+def _evaluate(func):
+    values = np.asarray(func(np.arange(256, dtype=np.float64)), dtype=np.float64)
+    return np.clip(np.rint(values), 0, 255).astype(np.uint8)
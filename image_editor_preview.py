@@ -0,0 +1,150 @@
+import time
+from PyQt6.QtWidgets import QDialog, QDialogButtonBox, QHBoxLayout, QLabel, QSlider, QSpinBox, QVBoxLayout
+from PyQt6.QtCore import Qt, QTimer
+import image_editor_blur as blur_engine
+import image_editor_core as core
+
+'''
+This module provides the live preview of parameterized filters
+While the user drags a slider the filter runs on a small proxy of the image (about the size of the
+screen) and the result is shown on the canvas; only the value that is finally accepted is applied
+to the full resolution image. Parameters measured in pixels are scaled to the proxy so the preview
+looks like the final output
+'''
+
+FRAME_BUDGET = 1 / 60 # seconds a preview may take while the slider is being dragged
+
+'''
+This function returns a proxy of image whose size fits in max_size, and the scale from image to proxy
+The image itself is returned (scale 1) when it already fits
+'''
+def make_proxy(image, max_size):
+    if image.width() <= max_size.width() and image.height() <= max_size.height():
+        return image, 1.0
+    proxy = image.scaled(max_size, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+    return proxy, proxy.width() / image.width()
+
+'''
+These functions scale filter parameters measured in full resolution pixels to a proxy
+'''
+def scale_blur_strength(blur_strength, scale):
+    # the sigma is scaled, not the kernel size: the sigma of a kernel is not proportional to its size
+    # (see blur_engine.kernel_sigma), so a kernel scaled as a whole blurs the proxy more than the image
+    kernel_size = blur_strength if blur_strength % 2 == 1 else blur_strength + 1
+    return blur_engine.sigma_kernel_size(blur_engine.kernel_sigma(kernel_size) * scale)
+
+def scale_pixel_size(pixel_size, scale):
+    return max(1, int(round(pixel_size * scale)))
+
+'''
+These functions render the preview of a filter on a proxy: preview(proxy, value, scale)
+'''
+def preview_blur(proxy, blur_strength, scale):
+    return core.blur(proxy, scale_blur_strength(blur_strength, scale))
+
+def preview_pixelate(proxy, pixel_size, scale):
+    return core.pixelate(proxy, scale_pixel_size(pixel_size, scale))
+
+def preview_contrast(proxy, contrast_level, scale):
+    return core.contrast(proxy, contrast_level)
+
+def preview_brightness(proxy, brightness_level, scale):
+    return core.brightness(proxy, brightness_level)
+
+'''
+This class is a dialog with a slider that previews a filter live on the canvas
+Use FilterPreviewDialog.getInt like QInputDialog.getInt; it returns (value, ok)
+'''
+class FilterPreviewDialog(QDialog):
+
+    def __init__(self, parent, canvas, title, label, value, minimum, maximum, preview):
+        super().__init__(parent)
+        self.canvas = canvas
+        self.preview = preview
+        self.setWindowTitle(title)
+
+        # proxies: one about the size of the visible canvas area, and a smaller one used while
+        # dragging if the first one cannot be rendered within the frame budget
+        self.proxies = [canvas.preview_proxy(1), canvas.preview_proxy(2)]
+        self.level = 0
+        self.pending_value = None
+
+        self.slider = QSlider(Qt.Orientation.Horizontal)
+        self.slider.setRange(minimum, maximum)
+        self.slider.setValue(value)
+        self.spin_box = QSpinBox()
+        self.spin_box.setRange(minimum, maximum)
+        self.spin_box.setValue(value)
+
+        self.slider.valueChanged.connect(self.spin_box.setValue)
+        self.spin_box.valueChanged.connect(self.slider.setValue)
+        self.slider.valueChanged.connect(self.schedule_preview)
+        self.slider.sliderReleased.connect(lambda: self.schedule_preview(self.slider.value(), full_quality=True))
+
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+
+        value_layout = QHBoxLayout()
+        value_layout.addWidget(self.slider)
+        value_layout.addWidget(self.spin_box)
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel(label))
+        layout.addLayout(value_layout)
+        layout.addWidget(buttons)
+
+        # coalesces slider moves: only the latest value is rendered when the event loop is free
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.render_preview)
+        self.schedule_preview(value)
+
+    def value(self):
+        return self.slider.value()
+
+    '''
+    This method asks for a preview of value at the next turn of the event loop
+    '''
+    def schedule_preview(self, value, full_quality=False):
+        self.pending_value = value
+        if full_quality:
+            self.level = 0
+        if not self.timer.isActive():
+            self.timer.start(0)
+
+    '''
+    This method renders the latest requested value on a proxy and shows it on the canvas
+    '''
+    def render_preview(self):
+        if self.pending_value is None:
+            return
+        value, self.pending_value = self.pending_value, None
+        proxy, scale = self.proxies[self.level]
+
+        start = time.perf_counter()
+        previewed = self.preview(proxy, value, scale)
+        if self.canvas.selection is not None:
+            # the filter will only change the selection
+            previewed = core.composite(proxy, previewed, self.canvas.selection.scaled(scale))
+        self.canvas.show_preview(previewed)
+        elapsed = time.perf_counter() - start
+
+        # drop to the smaller proxy while dragging if this one is too slow for a smooth preview
+        if elapsed > FRAME_BUDGET and self.slider.isSliderDown():
+            self.level = len(self.proxies) - 1
+        elif not self.slider.isSliderDown():
+            self.level = 0
+
+    def done(self, result):
+        self.timer.stop()
+        self.canvas.clear_preview()
+        super().done(result)
+
+    '''
+    This method shows the dialog and returns (value, ok) when it is closed
+    '''
+    @staticmethod
+    def getInt(parent, canvas, title, label, value, minimum, maximum, preview):
+        dialog = FilterPreviewDialog(parent, canvas, title, label, value, minimum, maximum, preview)
+        ok_pressed = dialog.exec() == QDialog.DialogCode.Accepted
+        return dialog.value(), ok_pressed
@@ -0,0 +1,521 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import weakref
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from PyQt6.QtCore import QSize
+from PyQt6.QtGui import QImage
+import image_editor_buffers as buffers
+import image_editor_history as history
+import image_editor_lazy as lazy
+import image_editor_save as save
+import image_editor_trace as trace
+np = lazy.module("numpy")
+
+'''
+This module saves the editing session of an image to a project file (.imlab) and opens it again
+A project keeps the original image, the current image with the reduced levels the canvas shows it
+from (see image_editor_display), and the undo/redo history. Everything is cut into chunks that are
+compressed on their own and named by a hash of their pixels, so pixels found in several places are
+stored once:
+    * images are cut into tiles of TILE_SIZE, the size of the tiles of the history
+    * every step of the history is kept as the tiles it changed before and after (see image_editor_history),
+      or as the images before and after when it changed the size or format
+A part of the image that was not edited is the same chunks in the original, the current image and the history.
+Opening reads only the chunks it needs: the level of the pyramid that fits the screen, then the current
+image. The original and the history stay in the file (mapped in memory) until they are reverted to or undone.
+Saving again to the same file only appends the chunks it does not hold yet and a new manifest, so saving
+after a small edit writes little; the file is rewritten once more than half of it is chunks no longer used.
+File layout:
+    header - MAGIC, the version, the offset and length of the manifest
+    chunks - zlib compressed pixel buffers, one after the other
+    manifest - zlib compressed JSON: the images and the history as lists of chunk ids, and where each chunk is
+'''
+
+EXTENSION = ".imlab"
+MAGIC = b"IMLABPRJ"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQQ") # magic, version, unused, manifest offset, manifest length
+TILE_SIZE = history.TILE_SIZE # side of the tiles images are stored in
+COMPRESSION_LEVEL = 1 # fast, as the history compresses its tiles
+
+'''
+This function returns True if path names a project file
+'''
+def is_project(path):
+    return path.lower().endswith(EXTENSION)
+
+'''
+This function opens a project file and returns its current image
+With max_size the largest level of its pyramid that fits in it is read instead, which is much less to read
+'''
+def read_current(path, max_size=None):
+    with ProjectFile(path) as project_file:
+        record = project_file.manifest["current"] if max_size is None else project_file.fitting_level(max_size)
+        return project_file.read_image(record)
+
+'''
+This class is a project file open for reading
+The manifest is read when it is opened; chunks are read from the file mapped in memory when they are used
+Images and history entries read from it lazily (StoredImage, StoredDelta) are its readers:
+when the session is saved to another file they move to it (see move_to)
+'''
+class ProjectFile:
+
+    def __init__(self, path):
+        self.path = path
+        self.readers = weakref.WeakSet()
+        with open(path, "rb") as file:
+            magic, version, _, offset, length = HEADER.unpack(file.read(HEADER.size).ljust(HEADER.size, b"\0"))
+            if magic != MAGIC:
+                raise ValueError("%s is not an Image Lab project" % path)
+            if version > VERSION:
+                raise ValueError("%s was saved by a newer version of Image Lab" % path)
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if offset + length > len(self.map):
+            raise ValueError("%s is truncated" % path)
+        with trace.span("read manifest", category="open", path=path):
+            self.manifest = json.loads(zlib.decompress(self.map[offset:offset + length]))
+        self.chunks = {chunk_id: tuple(place) for chunk_id, place in self.manifest["chunks"].items()}
+        self.manifest_offset = offset
+        self.end = offset + length # where chunks are appended by the next save
+        self.live_bytes = sum(length for _, length in self.chunks.values())
+        self.garbage_bytes = offset - HEADER.size - self.live_bytes # chunks and manifests no longer used
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    '''
+    This method unmaps the file; chunks cannot be read from it anymore
+    '''
+    def close(self):
+        try:
+            self.map.close()
+        except BufferError:
+            pass # chunks of it are still referenced (e.g. by a history entry kept elsewhere); unmapped once they are gone
+
+    '''
+    This method moves the readers of the file to project_file, the file the session was saved to, then closes it
+    Readers whose chunks project_file does not hold (entries dropped from the history since) stay with this file
+    '''
+    def move_to(self, project_file):
+        for reader in list(self.readers):
+            if all(chunk_id in project_file.chunks for chunk_id in _record_ids(reader.record)):
+                self.readers.discard(reader)
+                reader.reopen(project_file)
+        if not self.readers:
+            self.close()
+
+    '''
+    This method returns the compressed bytes of a chunk, without reading them yet
+    '''
+    def chunk(self, chunk_id):
+        offset, length = self.chunks[chunk_id]
+        return memoryview(self.map)[offset:offset + length]
+
+    def array(self, chunk_id, shape):
+        return np.frombuffer(zlib.decompress(self.chunk(chunk_id)), dtype=np.uint8).reshape(shape)
+
+    '''
+    This method returns the size of the current image
+    '''
+    def size(self):
+        return QSize(self.manifest["current"]["width"], self.manifest["current"]["height"])
+
+    '''
+    This method returns the record of the largest image of the pyramid (the current image or a reduced level)
+    that fits in max_size, or of the smallest one when none does
+    '''
+    def fitting_level(self, max_size):
+        records = [self.manifest["current"]] + self.manifest["levels"]
+        for record in records:
+            if record["width"] <= max_size.width() and record["height"] <= max_size.height():
+                return record
+        return records[-1]
+
+    '''
+    This method reads the image of a record (see ProjectWriter.put_image), decompressing its tiles in parallel
+    '''
+    def read_image(self, record):
+        image_format = QImage.Format[record["format"]]
+        image, out = buffers.new_image(record["width"], record["height"], image_format)
+        channels = () if image_format == QImage.Format.Format_Grayscale8 else (4,)
+        tiles = list(_grid(record["height"], record["width"], record["tile_size"]))
+
+        def read_tile(tile):
+            (top, left, height, width), chunk_id = tile
+            out[top:top + height, left:left + width] = self.array(chunk_id, (height, width) + channels)
+
+        with trace.span("read image", image, category="open"):
+            with ThreadPoolExecutor() as pool:
+                list(pool.map(read_tile, zip(tiles, record["tiles"])))
+        return image
+
+    '''
+    This method returns the original image and the levels of the pyramid as StoredImages, read when first needed
+    The original is None when it is the current image
+    '''
+    def stored_original(self):
+        original = self.manifest["original"]
+        return None if original == self.manifest["current"] else StoredImage(self, original)
+
+    def stored_levels(self):
+        return {index + 1: StoredImage(self, record) for index, record in enumerate(self.manifest["levels"])}
+
+'''
+This class is an image kept in a project file, read when load is called
+'''
+class StoredImage:
+
+    def __init__(self, project_file, record):
+        self.record = record
+        self.reopen(project_file)
+
+    def reopen(self, project_file):
+        self.project_file = project_file
+        project_file.readers.add(self)
+
+    def size(self):
+        return QSize(self.record["width"], self.record["height"])
+
+    def load(self):
+        return self.project_file.read_image(self.record)
+
+    @property
+    def nbytes(self):
+        return sum(self.project_file.chunks[chunk_id][1] for chunk_id in _record_ids(self.record))
+
+'''
+This class is a step of the history read from a project that changed the size or format of the image
+(see history.FrameRecord): the images before and after it stay in the file until it is undone or redone
+'''
+class StoredFrame:
+
+    def __init__(self, before, after):
+        self.before = before # StoredImages
+        self.after = after
+        self.compressed = True
+
+    def undo(self, image):
+        return self.before.load()
+
+    def redo(self, image):
+        return self.after.load()
+
+    def compress(self):
+        pass
+
+    @property
+    def nbytes(self):
+        return self.before.nbytes + self.after.nbytes
+
+'''
+This class is a step of the history read from a project that changed tiles of the image (see history.TileDelta)
+Its tiles are the compressed chunks of the file, decompressed when it is undone or redone
+'''
+class StoredDelta(history.TileDelta):
+
+    def __init__(self, project_file, record):
+        super().__init__({}, {})
+        self.record = record
+        self.compressed = True
+        self.reopen(project_file)
+
+    def reopen(self, project_file):
+        channels = () if self.record["channels"] == 1 else (self.record["channels"],)
+        self.before, self.after = {}, {}
+        for tile_row, tile_column, height, width, before_id, after_id in self.record["tiles"]:
+            self.before[(tile_row, tile_column)] = (project_file.chunk(before_id), (height, width) + channels)
+            self.after[(tile_row, tile_column)] = (project_file.chunk(after_id), (height, width) + channels)
+        project_file.readers.add(self)
+
+'''
+This class writes a project file, appending to the one it was opened from (source) when it can
+put and put_image store chunks and return their ids; finish writes the manifest, which only lists
+the chunks it uses: the others are left in the file as garbage until it is rewritten
+'''
+class ProjectWriter:
+
+    def __init__(self, path, source=None):
+        self.path = path
+        self.source = source # ProjectFile holding the chunks of records saved before
+        self.append = source is not None and _same_file(source, path) and source.garbage_bytes <= source.live_bytes
+        if self.append:
+            self.file = open(path, "r+b")
+            self.temporary = None
+            self.end = source.end
+            self.chunks = dict(source.chunks)
+        else:
+            handle, self.temporary = save.create_temporary(path, prefix=".image_lab_", suffix=".tmp")
+            self.file = os.fdopen(handle, "w+b")
+            self.end = HEADER.size
+            self.chunks = {}
+        self.pending = {} # chunk id: compressed bytes being computed
+        self.used = set() # ids of the chunks the manifest uses
+        self.pool = ThreadPoolExecutor()
+        self.written_bytes = 0
+
+    '''
+    This method stores the pixels of an array (unless a chunk with the same pixels exists) and returns its id
+    '''
+    def put(self, array):
+        data = np.ascontiguousarray(array)
+        chunk_id = hashlib.sha256(data).hexdigest()[:32] # sha256 has hardware support, blake2b rarely
+        if chunk_id not in self.chunks and chunk_id not in self.pending:
+            self.pending[chunk_id] = self.pool.submit(zlib.compress, data, COMPRESSION_LEVEL)
+        self.used.add(chunk_id)
+        return chunk_id
+
+    '''
+    This method marks the chunks of a record saved before as used
+    '''
+    def reuse(self, record):
+        self.used.update(_record_ids(record))
+        return record
+
+    '''
+    This method stores an image as tiles of TILE_SIZE and returns its record
+    '''
+    def put_image(self, image):
+        image = buffers.as_editable(image)
+        array = buffers.image_to_array(image)
+        tiles = [self.put(array[top:top + height, left:left + width])
+                 for top, left, height, width in _grid(image.height(), image.width(), TILE_SIZE)]
+        return {"width": image.width(), "height": image.height(), "format": image.format().name,
+                "tile_size": TILE_SIZE, "tiles": tiles}
+
+
+    '''
+    This method writes the chunks, then the manifest, then the header pointing to it
+    Until the header is written the file still opens as it was saved before
+    '''
+    def finish(self, manifest):
+        try:
+            self.file.seek(self.end)
+            for chunk_id, future in self.pending.items():
+                self._write_chunk(chunk_id, future.result())
+            # a new file takes the chunks of earlier records from the file they were saved in
+            for chunk_id in self.used - set(self.chunks):
+                self._write_chunk(chunk_id, self.source.chunk(chunk_id))
+
+            manifest = dict(manifest, chunks={chunk_id: self.chunks[chunk_id] for chunk_id in sorted(self.used)})
+            data = zlib.compress(json.dumps(manifest, separators=(",", ":")).encode(), COMPRESSION_LEVEL)
+            offset = self.end
+            self.file.write(data)
+            self.file.truncate()
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.seek(0)
+            self.file.write(HEADER.pack(MAGIC, VERSION, 0, offset, len(data)))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.written_bytes += HEADER.size + len(data)
+        except BaseException:
+            self.abort()
+            raise
+        self.close()
+        if self.temporary is not None:
+            save.replace_file(self.temporary, self.path)
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+        self.file.close()
+
+    '''
+    This method gives up writing; a file appended to still opens as it was, a new one is deleted
+    '''
+    def abort(self):
+        self.close()
+        if self.temporary is not None:
+            os.remove(self.temporary)
+
+    def _write_chunk(self, chunk_id, data):
+        self.file.write(data)
+        self.chunks[chunk_id] = (self.end, len(data))
+        self.end += len(data)
+        self.written_bytes += len(data)
+
+'''
+This class is the project an editing session belongs to: the file it was opened from or last saved to,
+and what of the session is already in that file, so saving again only adds what changed
+'''
+class Project:
+
+    def __init__(self, project_file=None):
+        self.file = project_file
+        self.image_records = {} # cacheKey of an image saved: its record
+        self.entry_records = weakref.WeakKeyDictionary() # history entry saved: its record
+
+    @property
+    def path(self):
+        return None if self.file is None else self.file.path
+
+    '''
+    This method closes the file of the project, once the session is done with it
+    '''
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+    '''
+    This method rebuilds the undo and redo stacks of the file
+    Their tiles and images are read when the entries are undone or redone
+    '''
+    def read_history(self):
+        stacks = []
+        for name in ("undo", "redo"):
+            stack = []
+            for record in self.file.manifest["history"][name]:
+                entry = self._entry(record)
+                self.entry_records[entry] = record
+                stack.append(entry)
+            stacks.append(stack)
+        return stacks
+
+    '''
+    This method records that image is saved in the file as record
+    '''
+    def remember(self, image, record):
+        self.image_records[image.cacheKey()] = record
+
+    '''
+    This method saves a session to path and makes it the file of the project
+        image - the current image; levels - the reduced levels of its pyramid (level 1 first)
+        original - the image revert goes back to, a QImage or a StoredImage not read yet
+        edit_history - the EditHistory of the session; what each of its entries changed is found from the image
+                       next to it (see _other_side), except for those already saved
+    Returns the number of bytes written
+    '''
+    def save(self, path, image, original, levels, edit_history):
+        with trace.span("save project", image, category="save", path=path):
+            writer = ProjectWriter(path, self.file)
+            images, entries = {}, {}
+            try:
+                current = self._image_record(writer, image, images)
+                if isinstance(original, StoredImage):
+                    original = writer.reuse(original.record)
+                else:
+                    original = self._image_record(writer, original, images)
+                level_records = [self._image_record(writer, level, images) for level in levels]
+                undo = self._walk(writer, list(reversed(edit_history.undo_stack)), image, True, images, entries)
+                redo = self._walk(writer, list(reversed(edit_history.redo_stack)), image, False, images, entries)
+            except BaseException:
+                writer.abort()
+                raise
+            writer.finish({"version": VERSION, "current": current, "original": original, "levels": level_records,
+                           "history": {"undo": list(reversed(undo)), "redo": list(reversed(redo))}})
+
+        # what was written can be reused by the next save of the same file
+        project_file = ProjectFile(path)
+        if self.file is not None:
+            self.file.move_to(project_file)
+        self.file = project_file
+        self.image_records.update(images)
+        for entry, record in entries.items():
+            self.entry_records[entry] = record
+        return writer.written_bytes
+
+    def _image_record(self, writer, image, images):
+        record = self.image_records.get(image.cacheKey())
+        if record is not None:
+            return writer.reuse(record)
+        record = images[image.cacheKey()] = writer.put_image(image)
+        return record
+
+    '''
+    This method returns the records of history entries, from the nearest to image to the farthest
+    backward tells if they are undone (undo stack) or redone (redo stack) to go from image to the next one
+    '''
+    def _walk(self, writer, stack, image, backward, images, entries):
+        records = []
+        for index, entry in enumerate(stack):
+            if all(other in self.entry_records for other in stack[index:]):
+                # the rest was saved before: nothing needs to be undone to reach it
+                records.extend(writer.reuse(self.entry_records[other]) for other in stack[index:])
+                break
+            other = _other_side(entry, image, backward)
+            before, after = (other, image) if backward else (image, other)
+            record = entries[entry] = self._step_record(writer, entry, before, after, images)
+            records.append(record)
+            image = other
+        return records
+
+    '''
+    This method stores the change of one history entry from before to after and returns its record
+    '''
+    def _step_record(self, writer, entry, before, after, images):
+        if (before.size() != after.size() or before.format() != after.format()
+                or after.format() not in buffers.EDITABLE_FORMATS):
+            return {"type": "frame", "before": self._image_record(writer, before, images),
+                    "after": self._image_record(writer, after, images)}
+        if isinstance(entry, history.TileDelta) and entry.after is not None and not entry.compressed:
+            delta = entry # a brush stroke knows its tiles
+        else:
+            delta = history.TileDelta.from_images(before, after)
+        tiles = []
+        for (tile_row, tile_column), tile in delta.before.items():
+            tiles.append([tile_row, tile_column, tile.shape[0], tile.shape[1],
+                          writer.put(tile), writer.put(delta.after[(tile_row, tile_column)])])
+        return {"type": "tiles", "channels": buffers.channel_count(after), "tiles": tiles}
+
+    '''
+    This method builds a history entry from its record, compressed as the history keeps old entries:
+    its chunks are read and decompressed when it is undone or redone
+    '''
+    def _entry(self, record):
+        if record["type"] == "frame":
+            return StoredFrame(StoredImage(self.file, record["before"]), StoredImage(self.file, record["after"]))
+        return StoredDelta(self.file, record)
+
+'''
+This function returns the image on the other side of a history entry from image: before it when backward, after it otherwise
+Graph records are not undone or redone, which would switch the edit graph of the session: the image is read
+from their delta, or from their graph, whose result is usually cached (the source when it has no operation)
+'''
+def _other_side(entry, image, backward):
+    if isinstance(entry, history.GraphRecord):
+        edit_graph = entry.before if backward else entry.after
+        if backward and entry.delta is not None and not edit_graph.is_cached():
+            return entry.delta.undo(image)
+        return edit_graph.render()
+    return entry.undo(image) if backward else entry.redo(image)
+
+'''
+This function lists the tiles of an image as (top, left, height, width), row by row
+'''
+def _grid(height, width, tile_size):
+    for top in range(0, height, tile_size):
+        for left in range(0, width, tile_size):
+            yield top, left, min(tile_size, height - top), min(tile_size, width - left)
+
+'''
+This function lists the chunk ids a record (of an image or a history entry) uses
+'''
+def _record_ids(record):
+    for tile in record.get("tiles", ()):
+        if isinstance(tile, str):
+            yield tile
+        else:
+            yield from tile[4:]
+    for side in ("before", "after"):
+        if side in record:
+            yield from _record_ids(record[side])
+
+'''
+This function returns True if a project file was opened from path and was not changed since
+'''
+def _same_file(project_file, path):
+    try:
+        if not os.path.samefile(project_file.path, path):
+            return False
+        with open(path, "rb") as file:
+            _, _, _, offset, _ = HEADER.unpack(file.read(HEADER.size).ljust(HEADER.size, b"\0"))
+        return offset == project_file.manifest_offset
+    except OSError:
+        return False
@@ -0,0 +1,339 @@
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from PyQt6.QtWidgets import QCheckBox, QComboBox, QDialog, QDialogButtonBox, QFormLayout, QSpinBox
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, QCoreApplication, pyqtSignal
+from PyQt6.QtGui import QImage
+import image_editor_buffers as buffers
+import image_editor_lazy as lazy
+import image_editor_trace as trace
+cv2 = lazy.module("cv2")
+np = lazy.module("numpy")
+
+'''
+This module saves images without blocking the editor window, with control over the encoder
+The image is saved from a snapshot taken when saving starts (a shallow copy: the pixels are only
+copied if the editor changes the image meanwhile), so editing can go on while the file is written.
+PNG, JPEG and BMP files are encoded with OpenCV, which exposes the options Qt does not:
+PNG compression level, JPEG quality, progressive JPEG and chroma subsampling. A JPEG can also be
+saved at the best quality that fits a target file size; candidate qualities are encoded in
+parallel to find it. Other formats are saved by Qt.
+'''
+
+ENCODED_FORMATS = ("png", "jpg", "bmp")
+
+# chroma subsampling of JPEG files: full color resolution, halved horizontally, halved both ways
+# mapped to the name of the cv2 constant, which is only looked up when saving (see image_editor_lazy)
+SUBSAMPLING = {
+    "4:4:4": "IMWRITE_JPEG_SAMPLING_FACTOR_444",
+    "4:2:2": "IMWRITE_JPEG_SAMPLING_FACTOR_422",
+    "4:2:0": "IMWRITE_JPEG_SAMPLING_FACTOR_420",
+}
+
+'''
+This class holds the encoder options of a save
+target_size, in bytes, makes JPEG files use the best quality whose file fits in it instead of jpeg_quality
+'''
+class SaveOptions:
+
+    def __init__(self, png_compression=6, jpeg_quality=95, progressive=False, subsampling="4:2:0", target_size=None):
+        self.png_compression = png_compression # 0 (fast, large) to 9 (slow, small)
+        self.jpeg_quality = jpeg_quality # 1 to 100
+        self.progressive = progressive
+        self.subsampling = subsampling
+        self.target_size = target_size
+
+'''
+This function returns the format of a file from its extension: png, jpg, bmp, ... ("" if there is none)
+'''
+def file_format(path):
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    return "jpg" if extension in ("jpg", "jpeg", "jpe") else extension
+
+'''
+This function returns the pixels of an image as the encoder takes them:
+BGR, BGRA when the image has transparency kept by the format, or a single channel for gray images
+'''
+def encoder_array(image, image_format):
+    array = buffers.image_to_array(buffers.as_editable(image))
+    if array.ndim == 3 and (image_format != "png" or not image.hasAlphaChannel()):
+        array = cv2.cvtColor(array, cv2.COLOR_BGRA2BGR)
+    return array
+
+'''
+This function returns the encoder parameters of a format; quality overrides the JPEG quality of the options
+'''
+def encoder_params(image_format, options, quality=None):
+    if image_format == "png":
+        return [cv2.IMWRITE_PNG_COMPRESSION, options.png_compression]
+    if image_format == "jpg":
+        return [cv2.IMWRITE_JPEG_QUALITY, options.jpeg_quality if quality is None else quality,
+                cv2.IMWRITE_JPEG_PROGRESSIVE, int(options.progressive),
+                cv2.IMWRITE_JPEG_SAMPLING_FACTOR, getattr(cv2, SUBSAMPLING[options.subsampling])]
+    return []
+
+'''
+This function encodes an array returned by encoder_array and returns the bytes of the file (a numpy array)
+'''
+def encode_array(array, image_format, options, quality=None):
+    ok, data = cv2.imencode("." + image_format, array, encoder_params(image_format, options, quality))
+    if not ok:
+        raise ValueError("cannot encode the image as %s" % image_format)
+    return data
+
+'''
+This function encodes an image as a file of one of ENCODED_FORMATS and returns its bytes
+'''
+def encode_image(image, image_format, options=None):
+    return encode_array(encoder_array(image, image_format), image_format, options or SaveOptions()).tobytes()
+
+'''
+This function finds the highest JPEG quality whose file is not larger than target_size bytes
+and returns (quality, file bytes); the lowest quality is used when none fits
+The search is k-ary: every round encodes one candidate per worker at the same time (OpenCV
+releases the GIL while encoding) and keeps the interval between the best candidate that fits
+and the first that does not, so 100 qualities take about three rounds on four cores
+'''
+def search_quality(image, target_size, options, workers=None):
+    array = encoder_array(image, "jpg")
+    workers = workers or min(8, os.cpu_count() or 1)
+    best = None
+    low, high = 1, 100 # qualities still to decide
+    with ThreadPoolExecutor(workers) as pool:
+        while low <= high:
+            if high - low + 1 <= workers:
+                candidates = list(range(low, high + 1))
+            else:
+                # spread the candidates evenly inside the interval
+                candidates = sorted(set(np.linspace(low, high, workers + 2)[1:-1].round().astype(int).tolist()))
+            with trace.span("encode candidates", image, qualities=candidates):
+                files = list(pool.map(lambda quality: encode_array(array, "jpg", options, quality), candidates))
+            for quality, data in zip(candidates, files):
+                # file size grows with the quality: everything below a fitting quality fits too
+                if data.size <= target_size:
+                    best = (quality, data)
+                    low = quality + 1
+                else:
+                    high = quality - 1
+                    break
+    if best is None:
+        best = (1, encode_array(array, "jpg", options, 1))
+    return best
+
+'''
+This function creates a new empty file next to path, to be written and then moved over it (see replace_file),
+and returns (its file descriptor, its path)
+The kernel gives it the permissions of any new file (0o666 less the umask), as open() would
+'''
+def create_temporary(path, prefix=".saving-", suffix=""):
+    directory = os.path.dirname(os.path.abspath(path))
+    flags = os.O_CREAT | os.O_EXCL | os.O_RDWR | getattr(os, "O_BINARY", 0)
+    while True:
+        temporary = os.path.join(directory, prefix + os.urandom(6).hex() + suffix)
+        try:
+            return os.open(temporary, flags, 0o666), temporary
+        except FileExistsError:
+            continue
+
+'''
+This function moves a written temporary file over path; a file replaced keeps its permissions
+'''
+def replace_file(temporary, path):
+    if os.path.exists(path):
+        shutil.copymode(path, temporary)
+    os.replace(temporary, path)
+
+'''
+This function writes an image to a file and returns (size of the file, JPEG quality used or None)
+The file is written next to its destination and then moved over it, so an existing file is
+never left half written. Raises ValueError when the image cannot be encoded, OSError when
+the file cannot be written
+'''
+def save_image(image, path, options=None):
+    options = options or SaveOptions()
+    image_format = file_format(path)
+    quality = None
+    handle, temporary = create_temporary(path, suffix="." + (image_format or "png"))
+    file = os.fdopen(handle, "wb") # owns the handle, so it is closed whatever fails below
+    try:
+        with file, trace.span("save", image, category="save", format=image_format):
+            if image_format in ENCODED_FORMATS:
+                if image_format == "jpg" and options.target_size:
+                    quality, data = search_quality(image, options.target_size, options)
+                else:
+                    quality = options.jpeg_quality if image_format == "jpg" else None
+                    data = encode_array(encoder_array(image, image_format), image_format, options)
+                file.write(data.tobytes())
+            else:
+                file.close() # Qt writes the file by its name
+                if not image.save(temporary, image_format.upper() or None):
+                    raise ValueError("cannot save images as %s" % (image_format or "files without an extension"))
+        replace_file(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return os.path.getsize(path), quality
+
+'''
+This class holds the signals of a save; QRunnable is not a QObject so it cannot have any itself
+'''
+class SaveSignals(QObject):
+    saved = pyqtSignal(int, str, int, int) # save id, path, size of the file, JPEG quality (0 for other formats)
+    failed = pyqtSignal(int, str, str) # save id, path, error message
+
+'''
+This class writes one snapshot of an image to a file on a worker thread
+'''
+class SaveJob(QRunnable):
+
+    def __init__(self, save_id, image, path, options):
+        super().__init__()
+        self.save_id = save_id
+        self.image = QImage(image) # shallow copy; the editor detaches before changing its image
+        self.path = path
+        self.options = options
+        self.signals = SaveSignals()
+        self.setAutoDelete(False) # the saver keeps the job until its signals have been handled
+
+    def run(self):
+        try:
+            size, quality = save_image(self.image, self.path, self.options)
+            self.signals.saved.emit(self.save_id, self.path, size, quality or 0)
+        except Exception as error:
+            self.signals.failed.emit(self.save_id, self.path, str(error))
+
+'''
+This class saves images in the background, one after the other in the order they were asked for,
+and reports on the GUI thread: saved(path, size, JPEG quality) or failed(path, message)
+'''
+class ImageSaver(QObject):
+
+    saved = pyqtSignal(str, int, int)
+    failed = pyqtSignal(str, str)
+    busy_changed = pyqtSignal(bool) # True while files are being saved
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1) # saves of the same file land in order
+        self.count = 0
+        self.jobs = {}
+
+    '''
+    This method starts saving the image as it is now to path
+    '''
+    def save(self, image, path, options=None):
+        self.count += 1
+        job = SaveJob(self.count, image, path, options or SaveOptions())
+        job.signals.saved.connect(self._saved)
+        job.signals.failed.connect(self._failed)
+        self.jobs[job.save_id] = job
+        if len(self.jobs) == 1:
+            self.busy_changed.emit(True)
+        self.pool.start(job)
+        return job.save_id
+
+    def is_busy(self):
+        return bool(self.jobs)
+
+    '''
+    This method blocks until every file is saved and the results delivered
+    Used when the editor closes, so no file is left half written
+    '''
+    def wait(self):
+        self.pool.waitForDone()
+        QCoreApplication.processEvents()
+
+    def _saved(self, save_id, path, size, quality):
+        self._forget(save_id)
+        self.saved.emit(path, size, quality)
+
+    def _failed(self, save_id, path, message):
+        self._forget(save_id)
+        self.failed.emit(path, message)
+
+    def _forget(self, save_id):
+        self.jobs.pop(save_id, None)
+        if not self.jobs:
+            self.busy_changed.emit(False)
+
+'''
+This class is a dialog asking for the encoder options of a format
+Use SaveOptionsDialog.getOptions like QInputDialog.getInt; it returns (options, ok)
+'''
+class SaveOptionsDialog(QDialog):
+
+    def __init__(self, parent, image_format, options):
+        super().__init__(parent)
+        self.image_format = image_format
+        self.options = options
+        self.setWindowTitle("Save Options")
+        layout = QFormLayout(self)
+
+        if image_format == "png":
+            self.compression = QSpinBox()
+            self.compression.setRange(0, 9)
+            self.compression.setValue(options.png_compression)
+            self.compression.setToolTip("Higher levels make smaller files but take longer to save")
+            layout.addRow("Compression level:", self.compression)
+
+        elif image_format == "jpg":
+            self.quality = QSpinBox()
+            self.quality.setRange(1, 100)
+            self.quality.setValue(options.jpeg_quality)
+            layout.addRow("Quality:", self.quality)
+
+            self.use_target = QCheckBox("Best quality that fits in")
+            self.target = QSpinBox()
+            self.target.setRange(1, 1024 * 1024)
+            self.target.setSuffix(" KB")
+            self.target.setValue(options.target_size // 1024 if options.target_size else 500)
+            self.use_target.setChecked(bool(options.target_size))
+            self.use_target.toggled.connect(self.target.setEnabled)
+            self.use_target.toggled.connect(lambda checked: self.quality.setDisabled(checked))
+            self.target.setEnabled(self.use_target.isChecked())
+            self.quality.setDisabled(self.use_target.isChecked())
+            layout.addRow(self.use_target, self.target)
+
+            self.progressive = QCheckBox("Progressive")
+            self.progressive.setChecked(options.progressive)
+            layout.addRow("", self.progressive)
+
+            self.subsampling = QComboBox()
+            self.subsampling.addItems(SUBSAMPLING)
+            self.subsampling.setCurrentText(options.subsampling)
+            self.subsampling.setToolTip("4:4:4 keeps all the color detail; 4:2:0 makes the smallest files")
+            layout.addRow("Chroma subsampling:", self.subsampling)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addRow(buttons)
+
+    '''
+    This method returns the options chosen in the dialog
+    '''
+    def chosen_options(self):
+        options = SaveOptions(self.options.png_compression, self.options.jpeg_quality, self.options.progressive,
+                              self.options.subsampling, self.options.target_size)
+        if self.image_format == "png":
+            options.png_compression = self.compression.value()
+        elif self.image_format == "jpg":
+            options.jpeg_quality = self.quality.value()
+            options.target_size = self.target.value() * 1024 if self.use_target.isChecked() else None
+            options.progressive = self.progressive.isChecked()
+            options.subsampling = self.subsampling.currentText()
+        return options
+
+    '''
+    This method shows the dialog and returns (options, ok) when it is closed
+    Formats without options return the options unchanged without showing anything
+    '''
+    @staticmethod
+    def getOptions(parent, image_format, options):
+        if image_format not in ("png", "jpg"):
+            return options, True
+        dialog = SaveOptionsDialog(parent, image_format, options)
+        ok_pressed = dialog.exec() == QDialog.DialogCode.Accepted
+        return dialog.chosen_options(), ok_pressed
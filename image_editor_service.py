@@ -0,0 +1,646 @@
+import argparse
+import http.client
+import http.server
+import json
+import mmap
+import multiprocessing
+import os
+import queue
+import re
+import secrets
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+import urllib.parse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from PyQt6.QtGui import QImage
+import image_editor_buffers as buffers
+import image_editor_core as core
+import image_editor_lazy as lazy
+import image_editor_loader as loader
+import image_editor_save as save
+np = lazy.module("numpy")
+
+'''
+This module runs the operations of image_editor_core.py as a long running local service, so that other tools
+can call them without starting the editor or paying for starting Python and importing OpenCV on every call.
+The service listens on localhost (HTTP) or on a Unix socket and keeps a pool of worker processes that are
+started, and have run every filter once, before the first request comes in:
+    POST /process?ops=<chain>[&format=png|jpg|bmp]
+        the body is an image file; the answer is the file of the result, in the format of the image by default
+    POST /process-shared?ops=<chain>
+        the body is JSON naming a shared memory segment holding the pixels (see ServiceClient.process_image);
+        the pixels of the result are written back into the same segment, so large images are never copied
+        through the socket nor pickled to the workers. Only served on the Unix socket, which only the user
+        running the service can open: the name must start with the prefix given by GET /shared-prefix,
+        so the service never opens segments of other programs
+    GET /metrics
+        the number of requests waiting (queue depth) and being processed, and the percentiles of their latency
+Small requests arriving together are sent to a worker in one batch, which saves a round trip to a worker
+for each of them. Chains are written as for image_editor_batch.py.
+
+Examples:
+    python image_editor_service.py serve --socket /tmp/image-lab.sock --workers 4
+    python image_editor_service.py process photo.jpg out.jpg --ops "rotate:right,blur:5" --socket /tmp/image-lab.sock
+    python image_editor_service.py metrics --socket /tmp/image-lab.sock
+'''
+
+DEFAULT_PORT = 8335
+SMALL_REQUEST_BYTES = 1024 * 1024 # requests with up to this many bytes of pixels or file are batched together
+MAX_BATCH = 16 # requests sent to a worker at once
+BATCH_WINDOW = 0.001 # seconds a small request waits for others to arrive before it is sent
+LATENCY_WINDOW = 1024 # the latency percentiles are those of the last requests
+# formats of the pixels of shared memory segments, rows packed one after the other
+SHARED_FORMATS = {
+    "Grayscale8": QImage.Format.Format_Grayscale8,
+    "RGB32": QImage.Format.Format_RGB32,
+    "ARGB32": QImage.Format.Format_ARGB32,
+}
+SEGMENT_NAME = re.compile(r"[0-9a-f]{12}") # what follows the prefix in the names of shared memory segments
+
+'''
+These functions run in the worker processes
+_start_worker runs when a worker starts: it shares the cores between the workers and runs every filter once
+on a small image, so that the modules they need are imported before the first request. The worker ends
+if the service process is killed
+'''
+def _start_worker(band_threads):
+    threading.Thread(target=_watch_service, args=(os.getppid(),), daemon=True).start()
+    core.set_band_threads(band_threads)
+    image = QImage(64, 64, QImage.Format.Format_RGB32)
+    image.fill(0)
+    core.apply_chain(image, core.parse_chain("rotate:right,blur:5,pixelate:4,contrast:10,sketch,invert"))
+    save.encode_image(image, "png")
+
+def _watch_service(service_process):
+    # a worker whose service was killed has no one to work for
+    while os.getppid() == service_process:
+        time.sleep(1)
+    os._exit(0)
+
+def _ready():
+    time.sleep(0.05) # long enough for the other workers to take the other calls
+    return os.getpid()
+
+'''
+This function runs a batch of tasks in a worker and returns a (result, seconds) tuple for each one
+A task is ("data", chain, file bytes, output format or None) or
+("shared", chain, segment name, segment size, width, height, format name); a result is
+("data", file bytes, format), ("shared", width, height, format name), ("too small", bytes needed) or ("error", message)
+'''
+def run_tasks(tasks):
+    results = []
+    for task in tasks:
+        start = time.perf_counter()
+        # one failing request must not fail the others of its batch
+        try:
+            result = _run_task(task)
+        except Exception as error:
+            result = ("error", str(error))
+        results.append((result, time.perf_counter() - start))
+    return results
+
+def _run_task(task):
+    if task[0] == "data":
+        _, chain, data, output_format = task
+        image, input_format = loader.decode_image(data)
+        output_format = output_format or save.file_format("image." + input_format)
+        if output_format not in save.ENCODED_FORMATS:
+            output_format = "png"
+        return ("data", save.encode_image(core.apply_chain(image, chain), output_format), output_format)
+
+    _, chain, name, size, width, height, format_name = task
+    segment = attach_segment(name)
+    try:
+        image = buffers.array_to_image(segment_array(segment, width, height, format_name), SHARED_FORMATS[format_name])
+        result = buffers.as_editable(core.apply_chain(image, chain))
+        result_format = next(name for name, image_format in SHARED_FORMATS.items() if image_format == result.format())
+        needed = result.width() * result.height() * buffers.channel_count(result)
+        if needed > size:
+            return ("too small", needed)
+        segment_array(segment, result.width(), result.height(), result_format)[...] = buffers.image_to_array(result)
+        return ("shared", result.width(), result.height(), result_format)
+    finally:
+        segment.close()
+
+'''
+This function opens the shared memory segment of a client, which removes it when done
+The segment must not be registered with the resource tracker, which would remove it when the worker ends:
+the tracker is that of the process that started the workers, where the client may run too, so registering
+and unregistering the name there would undo the registration of the client. Before Python 3.13 SharedMemory
+always registers the segments it opens, so they are opened as it does, without it (Windows registers nothing)
+'''
+def attach_segment(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    if os.name == "nt":
+        return shared_memory.SharedMemory(name=name)
+    return _AttachedSegment(name)
+
+'''
+This class is a shared memory segment opened without the resource tracker, with the buf, size and close
+of a SharedMemory
+'''
+class _AttachedSegment:
+
+    def __init__(self, name):
+        import _posixshmem # only on POSIX systems
+        handle = _posixshmem.shm_open("/" + name, os.O_RDWR, mode=0o600)
+        try:
+            self.size = os.fstat(handle).st_size
+            self._map = mmap.mmap(handle, self.size)
+        finally:
+            os.close(handle)
+        self.buf = memoryview(self._map)
+
+    def close(self):
+        self.buf.release()
+        self._map.close()
+
+'''
+This function returns a numpy view of the pixels of an image in a shared memory segment, rows packed
+'''
+def segment_array(segment, width, height, format_name):
+    channels = 1 if format_name == "Grayscale8" else 4
+    shape = (height, width) if channels == 1 else (height, width, channels)
+    if width * height * channels > segment.size:
+        raise ValueError("a %dx%d %s image does not fit in %d bytes" % (width, height, format_name, segment.size))
+    return np.ndarray(shape, dtype=np.uint8, buffer=segment.buf)
+
+'''
+This class is a request waiting for its result; size is the number of bytes of its file or pixels
+'''
+class Request:
+
+    def __init__(self, task, size):
+        self.task = task
+        self.small = size <= SMALL_REQUEST_BYTES
+        self.received = time.perf_counter()
+        self.started = None # sent to a worker
+        self.result = None
+        self.done = threading.Event()
+
+_STOP = object() # tells the dispatcher to stop
+
+'''
+This class is the service: the worker processes, the queue of requests and the metrics
+process() can be called from any number of threads; it blocks until the result is ready
+A request leaves the queue when a worker is free, with the small requests waiting behind it (or arriving
+within batch_window seconds), up to max_batch of them: the busier the service, the larger the batches
+'''
+class ImageService:
+
+    def __init__(self, workers=None, batch_window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_window = batch_window
+        self.max_batch = max(1, max_batch)
+        self.requests = queue.Queue()
+        self.free_workers = threading.Semaphore(self.workers)
+        self.lock = threading.Lock()
+        self.pool = self._new_pool()
+        # shared memory segments of clients are named with it (short: macOS allows 31 characters)
+        self.segment_prefix = "imlab%s_" % secrets.token_hex(4)
+
+        # metrics
+        self.started = time.time()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.batches = 0
+        self.max_queue_depth = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW) # (total, waiting, processing) seconds of each request
+
+        self.dispatcher = threading.Thread(target=self._dispatch, name="service-dispatcher", daemon=True)
+        self.dispatcher.start()
+
+    def _new_pool(self):
+        # workers are started fresh: forking would copy the threads of the server in the middle of their work
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_start_worker, initargs=(max(1, (os.cpu_count() or 1) // self.workers),))
+
+    '''
+    This method starts every worker and waits until they are ready for requests
+    '''
+    def warm_up(self):
+        ready = set()
+        while len(ready) < self.workers:
+            ready.update(future.result() for future in [self.pool.submit(_ready) for _ in range(self.workers)])
+
+    '''
+    This method processes a task (see run_tasks) and returns its result
+    '''
+    def process(self, task, size):
+        request = Request(task, size)
+        self.requests.put(request)
+        with self.lock:
+            self.max_queue_depth = max(self.max_queue_depth, self.requests.qsize())
+        request.done.wait()
+        return request.result
+
+    def _dispatch(self):
+        held = None # a request taken from the queue that could not join the batch, sent next
+        while True:
+            self.free_workers.acquire()
+            if held is not None:
+                request, held = held, None
+            else:
+                request = self.requests.get()
+            if request is _STOP:
+                return
+            batch = [request]
+            deadline = time.perf_counter() + self.batch_window
+            while request.small and len(batch) < self.max_batch:
+                try:
+                    following = self.requests.get(timeout=max(0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if following is _STOP or not following.small:
+                    held = following
+                    break
+                batch.append(following)
+            self._submit(batch)
+
+    def _submit(self, batch):
+        now = time.perf_counter()
+        for request in batch:
+            request.started = now
+        with self.lock:
+            self.in_flight += len(batch)
+            self.batches += 1
+            pool = self.pool
+        try:
+            future = pool.submit(run_tasks, [request.task for request in batch])
+        except (BrokenProcessPool, RuntimeError) as error:
+            self._finish(batch, pool, None, error)
+            return
+        future.add_done_callback(lambda future: self._finish(batch, pool, future))
+
+    '''
+    This method hands the results of a batch sent to pool to its requests
+    '''
+    def _finish(self, batch, pool, future, error=None):
+        if future is not None:
+            try:
+                results = future.result()
+            except Exception as failure:
+                error = failure
+        if error is not None:
+            # a worker died (out of memory, crashed in a filter): its pool cannot be used any more
+            results = [(("error", "worker failed: %s" % (str(error) or type(error).__name__)), 0.0)] * len(batch)
+            broken = None
+            with self.lock:
+                # every batch in flight on the pool fails with it: only the first one replaces it
+                if isinstance(error, BrokenProcessPool) and self.pool is pool:
+                    broken, self.pool = pool, self._new_pool()
+            if broken is not None:
+                broken.shutdown(wait=False)
+        now = time.perf_counter()
+        with self.lock:
+            self.in_flight -= len(batch)
+            for request, (result, seconds) in zip(batch, results):
+                self.latencies.append((now - request.received, request.started - request.received, seconds))
+                if result[0] == "error":
+                    self.failed += 1
+                else:
+                    self.completed += 1
+        self.free_workers.release()
+        for request, (result, _) in zip(batch, results):
+            request.result = result
+            request.done.set()
+
+    '''
+    This method returns the metrics of the service as a dictionary; latencies are in milliseconds:
+    total from receiving the request to its result, waiting in the queue, and processing in a worker
+    '''
+    def metrics(self):
+        with self.lock:
+            latencies = list(self.latencies)
+            metrics = {
+                "workers": self.workers,
+                "uptime_seconds": time.time() - self.started,
+                "queue_depth": self.requests.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "failed": self.failed,
+                "batches": self.batches,
+                "mean_batch_size": (self.completed + self.failed) / self.batches if self.batches else 0.0,
+            }
+        for index, name in enumerate(("latency_ms", "queue_ms", "processing_ms")):
+            values = sorted(latency[index] * 1000 for latency in latencies)
+            metrics[name] = {"count": len(values)}
+            if values:
+                metrics[name].update({"mean": sum(values) / len(values), "p50": _percentile(values, 50),
+                                      "p90": _percentile(values, 90), "p99": _percentile(values, 99), "max": values[-1]})
+        return metrics
+
+    def close(self):
+        self.requests.put(_STOP)
+        self.free_workers.release() # the dispatcher may be waiting for a worker
+        self.dispatcher.join()
+        with self.lock:
+            pool, self.pool = self.pool, None
+        pool.shutdown()
+
+'''
+This function returns the value below which percent of the sorted values fall (nearest rank)
+'''
+def _percentile(values, percent):
+    rank = max(1, -(-len(values) * percent // 100))
+    return values[int(rank) - 1]
+
+'''
+This class answers the HTTP requests of the service, see the module description
+Errors are answered as JSON: {"error": message}
+'''
+class ServiceHandler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1" # connections are kept open for the next requests of a client
+
+    def do_GET(self):
+        path = urllib.parse.urlsplit(self.path).path
+        if path == "/metrics":
+            self._send_json(200, self.server.service.metrics())
+        elif path == "/shared-prefix" and self.server.shares_memory:
+            self._send_json(200, {"prefix": self.server.service.segment_prefix})
+        else:
+            self._send_json(404, {"error": "unknown path"})
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if url.path not in ("/process", "/process-shared"):
+            self._send_json(404, {"error": "unknown path"})
+            return
+        if url.path == "/process-shared" and not self.server.shares_memory:
+            self._send_json(403, {"error": "shared memory is only served on the Unix socket of the service"})
+            return
+        if url.path == "/process-shared" and self.headers.get_content_type() != "application/json":
+            self._send_json(415, {"error": "the body must be application/json"})
+            return
+        try:
+            chain = core.parse_chain(query.get("ops", [""])[0])
+            if url.path == "/process":
+                output_format = query.get("format", [None])[0]
+                if output_format is not None:
+                    output_format = save.file_format("image." + output_format)
+                    if output_format not in save.ENCODED_FORMATS:
+                        raise ValueError("format must be one of %s" % ", ".join(save.ENCODED_FORMATS))
+                task, size = ("data", chain, body, output_format), len(body)
+            else:
+                pixels = json.loads(body)
+                if pixels.get("format") not in SHARED_FORMATS:
+                    raise ValueError("format must be one of %s" % ", ".join(SHARED_FORMATS))
+                width, height, segment_size = int(pixels["width"]), int(pixels["height"]), int(pixels["size"])
+                name, prefix = str(pixels["name"]), self.server.service.segment_prefix
+                if not (name.startswith(prefix) and SEGMENT_NAME.fullmatch(name[len(prefix):])):
+                    raise ValueError("the name of the segment must be the prefix of GET /shared-prefix and 12 hex digits")
+                task = ("shared", chain, name, segment_size, width, height, pixels["format"])
+                size = width * height * (1 if pixels["format"] == "Grayscale8" else 4)
+        except (ValueError, KeyError, TypeError) as error:
+            self._send_json(400, {"error": str(error)})
+            return
+
+        result = self.server.service.process(task, size)
+        if result[0] == "data":
+            self._send(200, result[1], "image/" + ("jpeg" if result[2] == "jpg" else result[2]))
+        elif result[0] == "shared":
+            self._send_json(200, {"width": result[1], "height": result[2], "format": result[3]})
+        elif result[0] == "too small":
+            self._send_json(507, {"error": "the result does not fit in the shared memory", "needed": result[1]})
+        else:
+            self._send_json(422, {"error": result[1]})
+
+    def _send_json(self, status, value):
+        self._send(status, json.dumps(value).encode(), "application/json")
+
+    def _send(self, status, data, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass # the metrics tell how requests went
+
+class TCPServiceServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    shares_memory = False # any local user (or a web page through the browser) can reach a port
+
+    def server_bind(self):
+        # HTTPServer looks the name of the host up, which can take long and is not needed on localhost
+        socketserver.TCPServer.server_bind(self)
+        self.server_name, self.server_port = self.server_address[:2]
+
+class UnixServiceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    shares_memory = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address) # left by a service that did not stop cleanly
+        super().server_bind()
+        os.chmod(self.server_address, 0o600) # only the user running the service may call it
+
+'''
+This function creates the server of a service, listening on the Unix socket at socket_path,
+or on localhost at port when socket_path is None; serve_forever() runs it
+'''
+def create_server(service, socket_path=None, port=DEFAULT_PORT):
+    if socket_path:
+        server = UnixServiceServer(socket_path, ServiceHandler)
+    else:
+        server = TCPServiceServer(("127.0.0.1", port), ServiceHandler)
+    server.service = service
+    return server
+
+class _UnixConnection(http.client.HTTPConnection):
+
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+'''
+This class is a client of the service, at a Unix socket path or at a localhost port
+A client keeps its connection open between calls; use one client per thread
+Calls raise ServiceError when the service answers with an error
+'''
+class ServiceClient:
+
+    def __init__(self, socket_path=None, port=DEFAULT_PORT, timeout=None):
+        self.socket_path = socket_path
+        self.port = port
+        self.timeout = timeout
+        self.connection = None
+        self.segment_prefix = None # asked for the first time an image is sent through shared memory
+
+    def _request(self, method, path, body=None, content_type=None):
+        for attempt in range(2):
+            if self.connection is None:
+                if self.socket_path:
+                    self.connection = _UnixConnection(self.socket_path)
+                else:
+                    self.connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=self.timeout)
+            try:
+                self.connection.request(method, path, body, {"Content-Type": content_type} if content_type else {})
+                response = self.connection.getresponse()
+                return response.status, response.read()
+            except (ConnectionError, http.client.HTTPException):
+                # the service closed a connection kept open too long; a new one is opened once
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+
+    def _check(self, status, data):
+        if status != 200:
+            try:
+                message = json.loads(data)["error"]
+            except (ValueError, KeyError):
+                message = data.decode(errors="replace")
+            raise ServiceError(status, message)
+        return data
+
+    '''
+    This method processes an image file (bytes) with a chain of operations (text, e.g. "blur:5,invert")
+    and returns the file of the result, in output_format (png, jpg or bmp) or in the format of the image
+    '''
+    def process(self, data, ops, output_format=None):
+        query = {"ops": ops}
+        if output_format:
+            query["format"] = output_format
+        return self._check(*self._request("POST", "/process?" + urllib.parse.urlencode(query), data,
+                                          "application/octet-stream"))
+
+    '''
+    This method processes a QImage through shared memory and returns the result as a QImage
+    The pixels are copied once into a segment the service reads them from and writes the result into
+    Only a client of the Unix socket of the service can do it
+    '''
+    def process_image(self, image, ops):
+        if not self.socket_path:
+            raise ValueError("images are only sent through shared memory to the Unix socket of the service")
+        if self.segment_prefix is None:
+            self.segment_prefix = json.loads(self._check(*self._request("GET", "/shared-prefix")))["prefix"]
+        image = buffers.as_editable(image)
+        format_name = next((name for name, image_format in SHARED_FORMATS.items() if image_format == image.format()), None)
+        if format_name is None:
+            image = buffers.as_format(image, buffers.color_format(image))
+            format_name = "ARGB32" if image.format() == QImage.Format.Format_ARGB32 else "RGB32"
+        pixels = buffers.image_to_array(image)
+        size = max(pixels.size, 1)
+        while True:
+            segment = shared_memory.SharedMemory(self.segment_prefix + secrets.token_hex(6), create=True, size=size)
+            try:
+                segment_array(segment, image.width(), image.height(), format_name)[...] = pixels
+                body = json.dumps({"name": segment.name, "size": segment.size, "width": image.width(),
+                                   "height": image.height(), "format": format_name}).encode()
+                status, data = self._request("POST", "/process-shared?" + urllib.parse.urlencode({"ops": ops}),
+                                             body, "application/json")
+                if status == 507:
+                    # the result is larger than the image: again, with room for it
+                    size = json.loads(data)["needed"]
+                    continue
+                reply = json.loads(self._check(status, data))
+                return buffers.array_to_image(segment_array(segment, reply["width"], reply["height"], reply["format"]),
+                                              SHARED_FORMATS[reply["format"]])
+            finally:
+                segment.close()
+                segment.unlink()
+
+    def metrics(self):
+        return json.loads(self._check(*self._request("GET", "/metrics")))
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+'''
+This class is the error of a call to the service: the HTTP status and the message of the service
+'''
+class ServiceError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__("%d: %s" % (status, message))
+        self.status = status
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Image Lab operations as a local service, or call it.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="run the service")
+    serve.add_argument("--workers", type=int, default=None, help="number of worker processes (default: all cores)")
+    serve.add_argument("--batch-window", type=float, default=BATCH_WINDOW,
+                       help="seconds a small request waits for others to be sent with it (default: %(default)s)")
+    serve.add_argument("--max-batch", type=int, default=MAX_BATCH,
+                       help="most requests sent to a worker at once, 1 to send them one by one (default: %(default)s)")
+    process = commands.add_parser("process", help="process an image file through the service")
+    process.add_argument("input", help="image file to process")
+    process.add_argument("output", help="file the result is written to")
+    process.add_argument("--ops", required=True, help='comma separated chain, e.g. "rotate:right,blur:5"')
+    process.add_argument("--shared", action="store_true", help="pass the pixels through shared memory (needs --socket)")
+    metrics = commands.add_parser("metrics", help="print the metrics of the service")
+    for command in (serve, process, metrics):
+        command.add_argument("--socket", help="Unix socket of the service (default: localhost)")
+        command.add_argument("--port", type=int, default=DEFAULT_PORT, help="localhost port of the service")
+    args = parser.parse_args(argv)
+    if args.command == "process" and args.shared and not args.socket:
+        parser.error("--shared needs the --socket of the service")
+
+    if args.command == "serve":
+        service = ImageService(args.workers, args.batch_window, args.max_batch)
+        try:
+            server = create_server(service, args.socket, args.port)
+        except OSError as error:
+            service.close()
+            parser.error("cannot listen: %s" % error)
+        service.warm_up()
+        print("serving with %d workers on %s" % (service.workers, args.socket or "127.0.0.1:%d" % args.port), flush=True)
+        # stopped as by Ctrl+C, so the workers and the socket are cleaned up
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if args.socket and os.path.exists(args.socket):
+                os.unlink(args.socket)
+            service.close()
+        return 0
+
+    client = ServiceClient(args.socket, args.port)
+    try:
+        if args.command == "metrics":
+            print(json.dumps(client.metrics(), indent=2))
+        elif args.shared:
+            result = client.process_image(loader.read_image(args.input), args.ops)
+            if not result.save(args.output):
+                print("cannot write %s" % args.output, file=sys.stderr)
+                return 1
+        else:
+            with open(args.input, "rb") as file:
+                data = client.process(file.read(), args.ops, save.file_format(args.output) or None)
+            with open(args.output, "wb") as file:
+                file.write(data)
+    except (OSError, ValueError, ServiceError) as error:
+        print(error, file=sys.stderr)
+        return 1
+    finally:
+        client.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+from PyQt6.QtGui import QImage
+import image_editor_buffers as buffers
+import image_editor_lazy as lazy
+import image_editor_point_ops as point_ops
+import image_editor_trace as trace
+cv2 = lazy.module("cv2")
+np = lazy.module("numpy")
+
+'''
+This module is the statistics engine of the image editor
+A Histogram counts how many pixels have each value of the red, green and blue channels and of the
+luminance. The four counts are taken in a single pass over the image, a band of rows at a time so the
+band is still in the cache while its luminance is counted. Everything else (minimum, maximum, mean,
+percentiles) is read from the 256 counts of a channel, so it costs nothing next to the pass.
+Counts can be taken away and added back, so when an edit changes a region only the pixels of that
+region are counted again (see LiveHistogram). Auto levels and auto contrast are lookup tables built
+from the percentiles, applied in one more pass (see image_editor_point_ops).
+'''
+
+CHANNELS = ("red", "green", "blue", "luminance")
+BAND_PIXELS = 256 * 1024 # pixels counted at once; float counts of cv2 are exact far beyond this
+DEFAULT_CLIP = 0.5 # percent of the darkest and of the lightest pixels auto levels and auto contrast ignore
+
+'''
+This function counts the values of a buffer, (height, width) for grayscale or (height, width, 4)
+in (blue, green, red, alpha) order; alpha is not counted
+Returns the counts as an int64 array of shape (4, 256) in the order of CHANNELS;
+the channels and the luminance of a grayscale buffer all have its counts
+'''
+def count(pixels):
+    counts = np.zeros((len(CHANNELS), 256), dtype=np.int64)
+    if pixels.size == 0:
+        return counts
+    rows = max(1, BAND_PIXELS // pixels.shape[1])
+    for top in range(0, pixels.shape[0], rows):
+        band = pixels[top:top + rows]
+        if band.ndim == 2:
+            counts += _count_channel(band)
+        else:
+            for row, channel in ((0, 2), (1, 1), (2, 0)):
+                counts[row] += _count_channel(band, channel)
+            counts[3] += _count_channel(cv2.cvtColor(band, cv2.COLOR_BGRA2GRAY))
+    return counts
+
+def _count_channel(band, channel=0):
+    return cv2.calcHist([band], [channel], None, [256], [0, 256]).reshape(-1).astype(np.int64)
+
+'''
+This class holds the histograms of an image, see count
+Channels are named as in CHANNELS
+'''
+class Histogram:
+
+    def __init__(self, counts=None):
+        self.counts = np.zeros((len(CHANNELS), 256), dtype=np.int64) if counts is None else counts
+
+    def copy(self):
+        return Histogram(self.counts.copy())
+
+    '''
+    These methods count the pixels of a buffer in, or take them out
+    '''
+    def add(self, pixels):
+        self.counts += count(pixels)
+
+    def remove(self, pixels):
+        self.counts -= count(pixels)
+
+    @property
+    def total(self):
+        return int(self.counts[3].sum())
+
+    def channel(self, name):
+        return self.counts[CHANNELS.index(name)]
+
+    '''
+    These methods return the smallest and largest value of a channel, None when there are no pixels
+    '''
+    def minimum(self, name="luminance"):
+        values = np.flatnonzero(self.channel(name))
+        return int(values[0]) if len(values) else None
+
+    def maximum(self, name="luminance"):
+        values = np.flatnonzero(self.channel(name))
+        return int(values[-1]) if len(values) else None
+
+    def mean(self, name="luminance"):
+        counts = self.channel(name)
+        total = counts.sum()
+        return float(counts @ np.arange(256)) / total if total else None
+
+    '''
+    This method returns the smallest value of a channel that percent of the pixels are at or below
+    '''
+    def percentile(self, percent, name="luminance"):
+        cumulative = np.cumsum(self.channel(name))
+        if cumulative[-1] == 0:
+            return None
+        # at least one pixel, so the 0th percentile is the minimum
+        return int(np.searchsorted(cumulative, max(cumulative[-1] * percent / 100, 1)))
+
+    '''
+    This method returns the minimum, maximum, mean and median of each channel as {name: (min, max, mean, median)}
+    '''
+    def summary(self):
+        return {name: (self.minimum(name), self.maximum(name), self.mean(name), self.percentile(50, name))
+                for name in CHANNELS}
+
+'''
+This function returns the histograms of a QImage
+'''
+def histogram(image):
+    with trace.span("histogram", image):
+        if image.format() != QImage.Format.Format_Grayscale8:
+            image = buffers.as_format(image, buffers.color_format(image))
+        return Histogram(count(buffers.image_to_array(image)))
+
+'''
+This function returns the lookup table of auto levels: each of the red, green and blue channels is stretched
+on its own so that the darkest and lightest clip percent of its values become 0 and 255
+Stretching the channels apart also takes away a color cast
+'''
+def auto_levels_table(histogram, clip=DEFAULT_CLIP):
+    return point_ops.LookupTable(*[_stretch(histogram, clip, name) for name in CHANNELS[:3]])
+
+'''
+This function returns the lookup table of auto contrast: the same stretch for all channels,
+found from the luminance, so the colors keep their hue
+'''
+def auto_contrast_table(histogram, clip=DEFAULT_CLIP):
+    return point_ops.LookupTable(_stretch(histogram, clip, "luminance"))
+
+'''
+This function returns the table mapping the values from the clip to the 100 - clip percentile of a channel to 0..255
+The values are left as they are when the channel has a single value (or no pixels)
+'''
+def _stretch(histogram, clip, name):
+    if not 0 <= clip < 50:
+        raise ValueError("clip must be at least 0 and less than 50 percent")
+    black, white = histogram.percentile(clip, name), histogram.percentile(100 - clip, name)
+    if black is None or white <= black:
+        return point_ops.LookupTable.identity().table[0]
+    return point_ops.levels_table(black, white).table[0]
+
+# auto adjustments of the chain mapped to the function building their lookup table from the histogram
+AUTO_TABLES = {
+    "autolevels": auto_levels_table,
+    "autocontrast": auto_contrast_table,
+}
+
+'''
+This class keeps the histogram of the image shown by the editor, for the histogram panel
+The image is counted when the histogram is first asked for; after that, edits that change only
+some regions of it (brush strokes, edits of a selection, undoing them) only count those regions again.
+Images are told apart by their cacheKey, which changes whenever their pixels are written to
+'''
+class LiveHistogram:
+
+    def __init__(self):
+        self.histogram = None
+        self.key = None # cacheKey of the image histogram counts
+
+    def clear(self):
+        self.histogram = None
+        self.key = None
+
+    '''
+    This method returns the Histogram of image, None for a null image
+    '''
+    def of(self, image):
+        if image.isNull():
+            return None
+        if self.histogram is None or self.key != image.cacheKey():
+            self.histogram = histogram(image)
+            self.key = image.cacheKey()
+        return self.histogram
+
+    '''
+    This method follows an edit that changed regions of the image whose cacheKey was before_key into image
+    changes lists the (before, after) buffers of the regions; they are only looked at when the
+    histogram of the image before is known, otherwise image is counted whole when asked for
+    '''
+    def update(self, before_key, image, changes):
+        if self.histogram is None or self.key != before_key:
+            self.histogram = None
+            return
+        with trace.span("histogram update", image):
+            for before, after in changes:
+                self.histogram.remove(before)
+                self.histogram.add(after)
+        self.key = image.cacheKey()
+
+    '''
+    This method follows an edit from before_image to image (of the same size and format) that changed only rects,
+    which must not overlap
+    '''
+    def update_regions(self, before_image, image, rects):
+        if (before_image.size() != image.size() or before_image.format() != image.format()
+                or image.format() not in buffers.EDITABLE_FORMATS):
+            self.histogram = None
+            return
+        before, after = buffers.image_to_array(before_image), buffers.image_to_array(image)
+        regions = [rect.intersected(image.rect()) for rect in rects]
+        slices = [(slice(rect.top(), rect.top() + rect.height()), slice(rect.left(), rect.left() + rect.width()))
+                  for rect in regions if not rect.isEmpty()]
+        self.update(before_image.cacheKey(), image, [(before[region], after[region]) for region in slices])
@@ -0,0 +1,456 @@
+import argparse
+import os
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from PyQt6.QtCore import QRect, QSize
+from PyQt6.QtGui import QImage, QImageReader, QImageIOHandler
+import image_editor_buffers as buffers
+import image_editor_core as core
+import image_editor_lazy as lazy
+import image_editor_stats as stats
+cv2 = lazy.module("cv2")
+np = lazy.module("numpy")
+
+'''
+This module processes images that do not fit in memory
+A TiledImageStore keeps the pixels in a memory-mapped file (a .npy array on disk) in the same
+layout the editor uses in memory: (height, width) for grayscale, (height, width, 4) in
+(blue, green, red, alpha) order otherwise. Filters stream over the store tile by tile, reading
+the halo each TiledFilter of image_editor_core needs around its tiles so the seams are invisible,
+and write their output to a new store. Only the tiles being worked on need to be resident.
+
+Example:
+    python image_editor_tiles.py panorama.ppm out.png --ops "blur:25,contrast:30" --tile-size 2048
+'''
+
+DEFAULT_TILE_SIZE = 1024 # side of the square tiles filters are run on
+BAND_BYTES = 64 * 1024 * 1024 # about how much is read or written at once when opening and saving
+
+'''
+This class is an image whose pixels live in a memory-mapped file
+'''
+class TiledImageStore:
+
+    def __init__(self, array, path, has_alpha=False, temporary=False):
+        self.array = array # numpy memmap of the pixels
+        self.path = path
+        self.has_alpha = has_alpha
+        self.temporary = temporary # the file is deleted when the store is closed
+
+    '''
+    This method creates a new store of the given size
+    channels is 1 (grayscale) or 4; without a path a temporary file is made in directory
+    '''
+    @classmethod
+    def create(cls, width, height, channels, path=None, directory=None, has_alpha=False):
+        temporary = path is None
+        if temporary:
+            handle, path = tempfile.mkstemp(suffix=".npy", prefix="image_lab_", dir=directory)
+            os.close(handle)
+        shape = (height, width) if channels == 1 else (height, width, 4)
+        array = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=shape)
+        return cls(array, path, has_alpha, temporary)
+
+    '''
+    This method opens an existing store (a .npy file) without reading its pixels
+    '''
+    @classmethod
+    def open(cls, path, writable=False):
+        array = np.load(path, mmap_mode="r+" if writable else "r")
+        if array.dtype != np.uint8 or not (array.ndim == 2 or (array.ndim == 3 and array.shape[2] == 4)):
+            raise ValueError("%s is not an image store" % path)
+        # a four channel store has an alpha channel unless it is opaque everywhere
+        has_alpha = array.ndim == 3 and any(array[top:top + rows, :, 3].min() < 255 for top, rows in _bands(array))
+        return cls(array, path, has_alpha)
+
+    '''
+    This method copies an image that fits in memory into a new store
+    '''
+    @classmethod
+    def from_image(cls, image, directory=None):
+        image = buffers.as_editable(image)
+        store = cls.create(image.width(), image.height(), buffers.channel_count(image),
+                           directory=directory, has_alpha=image.hasAlphaChannel())
+        store.array[...] = buffers.image_to_array(image)
+        return store
+
+    @property
+    def width(self):
+        return self.array.shape[1]
+
+    @property
+    def height(self):
+        return self.array.shape[0]
+
+    @property
+    def channels(self):
+        return 1 if self.array.ndim == 2 else 4
+
+    @property
+    def image_format(self):
+        if self.channels == 1:
+            return QImage.Format.Format_Grayscale8
+        return QImage.Format.Format_ARGB32 if self.has_alpha else QImage.Format.Format_RGB32
+
+    @property
+    def nbytes(self):
+        return self.array.nbytes
+
+    '''
+    This method copies the whole store into a QImage; only for images that fit in memory
+    '''
+    def to_image(self):
+        return buffers.array_to_image(self.array, self.image_format)
+
+    def flush(self):
+        if hasattr(self.array, "flush"):
+            self.array.flush()
+
+    '''
+    This method releases the mapping, deleting the file of a temporary store
+    '''
+    def close(self):
+        self.flush()
+        mapping = getattr(self.array, "_mmap", None)
+        self.array = None
+        if mapping is not None:
+            mapping.close()
+        if self.temporary and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+'''
+This function lists the tiles of an image as (top, left, height, width)
+tile_size is rounded down to a multiple of align so tiles fall on filter blocks
+'''
+def tile_grid(height, width, tile_size=DEFAULT_TILE_SIZE, align=1):
+    tile_size = max(align, tile_size - tile_size % align)
+    for top in range(0, height, tile_size):
+        for left in range(0, width, tile_size):
+            yield top, left, min(tile_size, height - top), min(tile_size, width - left)
+
+'''
+This function lists bands of rows of about BAND_BYTES as (top, rows)
+'''
+def _bands(array):
+    row_bytes = max(1, array.nbytes // max(array.shape[0], 1))
+    rows = max(1, BAND_BYTES // row_bytes)
+    for top in range(0, array.shape[0], rows):
+        yield top, min(rows, array.shape[0] - top)
+
+'''
+This function runs a TiledFilter over a store and returns a new store with the result
+Each tile is read with the filter's halo around it, so the result is identical to
+running the filter on the whole image at once
+progress(fraction) is called after every tile
+'''
+def map_tiles(store, tiled_filter, tile_size=DEFAULT_TILE_SIZE, directory=None, progress=None):
+    source_format = tiled_filter.source_format(_probe(store.image_format))
+    output_format = tiled_filter.output_format(_probe(source_format))
+    output = TiledImageStore.create(store.width, store.height, 1 if output_format == QImage.Format.Format_Grayscale8 else 4,
+                                    directory=directory, has_alpha=output_format == QImage.Format.Format_ARGB32)
+
+    source = store.array
+    if source_format != QImage.Format.Format_Grayscale8 and store.channels == 1:
+        # the filter needs color: widen each region of the grayscale store as it is read
+        kernel = tiled_filter.kernel
+        tiled_filter = core.TiledFilter(lambda region, out, offset: kernel(cv2.cvtColor(region, cv2.COLOR_GRAY2BGRA), out, offset),
+                                        tiled_filter.halo, tiled_filter.align)
+
+    tiles = list(tile_grid(store.height, store.width, tile_size, tiled_filter.align))
+    for index, (top, left, height, width) in enumerate(tiles):
+        tiled_filter.run_region(source, output.array, top, left, height, width)
+        if progress is not None:
+            progress((index + 1) / len(tiles))
+    output.flush()
+    return output
+
+'''
+This function applies a lookup table to a store tile by tile and returns a new store
+'''
+def map_table(store, table, tile_size=DEFAULT_TILE_SIZE, directory=None, progress=None):
+    return map_tiles(store, core.table_filter(table), tile_size, directory, progress)
+
+'''
+This function counts the histograms of a store (see image_editor_stats.py) a band at a time
+'''
+def histogram_store(store):
+    histogram = stats.Histogram()
+    for top, rows in _bands(store.array):
+        histogram.add(store.array[top:top + rows])
+    return histogram
+
+'''
+This function gives a store a new orientation (see core.Orientation) tile by tile
+Every tile is moved to its place in the output as an exact permutation of its pixels
+'''
+def orient_store(store, orientation, tile_size=DEFAULT_TILE_SIZE, directory=None, progress=None):
+    height, width = store.height, store.width
+    rotated = orientation.turns % 2 == 1
+    output = TiledImageStore.create(height if rotated else width, width if rotated else height, store.channels,
+                                    directory=directory, has_alpha=store.has_alpha)
+
+    tiles = list(tile_grid(height, width, tile_size))
+    for index, (top, left, rows, columns) in enumerate(tiles):
+        out_top, out_left, out_rows, out_columns = orientation.map_rect(top, left, rows, columns, height, width)
+        output.array[out_top:out_top + out_rows, out_left:out_left + out_columns] = \
+            orientation.apply_to_array(store.array[top:top + rows, left:left + columns])
+        if progress is not None:
+            progress((index + 1) / len(tiles))
+    output.flush()
+    return output
+
+'''
+This function copies the rectangle of width x height pixels at (left, top) of a store into a new store, band by band
+'''
+def crop_store(store, left, top, width, height, directory=None, progress=None):
+    rect = core.crop_rect(left, top, width, height, store.width, store.height)
+    output = TiledImageStore.create(rect.width(), rect.height(), store.channels, directory=directory, has_alpha=store.has_alpha)
+    for band_top, rows in _bands(output.array):
+        source_top = rect.top() + band_top
+        output.array[band_top:band_top + rows] = store.array[source_top:source_top + rows, rect.left():rect.left() + rect.width()]
+        if progress is not None:
+            progress((band_top + rows) / rect.height())
+    output.flush()
+    return output
+
+'''
+This function converts a store to grayscale tile by tile with the same conversion as the editor
+'''
+def grayscale_store(store, tile_size=DEFAULT_TILE_SIZE, directory=None, progress=None):
+
+    def kernel(source, out, offset):
+        # each tile goes through QImage so the result matches core.grayscale exactly
+        tile = buffers.array_to_image(source, store.image_format)
+        out[...] = buffers.image_to_array(core.grayscale(tile))
+
+    if store.channels == 1:
+        return map_tiles(store, core.table_filter(core.point_ops.LookupTable.identity()), tile_size, directory, progress)
+    return map_tiles(store, core.TiledFilter(kernel, source_format=lambda image: image.format(),
+                                             output_format=lambda source: QImage.Format.Format_Grayscale8),
+                     tile_size, directory, progress)
+
+'''
+This function applies a chain of operations (see core.parse_chain) to a store
+The chain is fused first (see core.fuse_chain); intermediate stores are deleted
+'''
+def apply_chain(store, chain, tile_size=DEFAULT_TILE_SIZE, directory=None, progress=None):
+    steps = [(name, args) for name, args, _ in core.fuse_chain(chain)]
+    if not steps:
+        # nothing to do, but the caller still gets a store of its own
+        return map_table(store, core.point_ops.LookupTable.identity(), tile_size, directory, progress)
+
+    current = store
+    for index, (name, args) in enumerate(steps):
+        step_progress = None
+        if progress is not None:
+            step_progress = lambda fraction, index=index: progress((index + fraction) / len(steps))
+
+        if name == "table":
+            result = map_table(current, args[0], tile_size, directory, step_progress)
+        elif name == "orient":
+            result = orient_store(current, args[0], tile_size, directory, step_progress)
+        elif name == "grayscale":
+            result = grayscale_store(current, tile_size, directory, step_progress)
+        elif name == "crop":
+            result = crop_store(current, *args, directory=directory, progress=step_progress)
+        elif name in core.TILED_FILTERS:
+            # the blur takes the same path as on the whole image in memory, which depends on its size
+            tiled_filter = (core.blur_filter(args[0], QSize(current.width, current.height)) if name == "blur"
+                            else core.TILED_FILTERS[name](*args))
+            result = map_tiles(current, tiled_filter, tile_size, directory, step_progress)
+        elif name in stats.AUTO_TABLES:
+            table = stats.AUTO_TABLES[name](histogram_store(current), *args)
+            result = map_table(current, table, tile_size, directory, step_progress)
+        else:
+            raise ValueError("operation %s cannot run on tiles" % name)
+
+        # intermediate results are not needed anymore; the input store belongs to the caller
+        if current is not store:
+            current.close()
+        current = result
+    return current
+
+'''
+This function opens an image file as a new store, decoding it a band at a time where possible
+    .npy - opened in place, nothing is copied
+    .ppm/.pgm (binary, 8 bit) - memory-mapped and converted a band at a time
+    other formats - decoded a band at a time when the Qt decoder can read parts of the image
+                    (e.g. JPEG), otherwise decoded at once, which needs the whole image in memory
+'''
+def import_image(path, directory=None):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        return TiledImageStore.open(path)
+    if extension in (".ppm", ".pgm"):
+        return _import_netpbm(path, directory)
+
+    reader = QImageReader(path)
+    size = reader.size()
+    if not size.isValid():
+        raise ValueError("cannot read image %s" % path)
+    if not reader.supportsOption(QImageIOHandler.ImageOption.ClipRect):
+        return _import_whole(reader, path, directory)
+
+    store = None
+    for top in range(0, size.height(), max(1, BAND_BYTES // (size.width() * 4))):
+        rows = min(BAND_BYTES // (size.width() * 4), size.height() - top) or 1
+        band_reader = QImageReader(path)
+        band_reader.setClipRect(QRect(0, top, size.width(), rows))
+        band = band_reader.read()
+        if band.isNull():
+            if store is not None:
+                store.close()
+            raise ValueError("cannot read image %s: %s" % (path, band_reader.errorString()))
+        band = buffers.as_editable(band)
+        if store is None:
+            store = TiledImageStore.create(size.width(), size.height(), buffers.channel_count(band),
+                                           directory=directory, has_alpha=band.hasAlphaChannel())
+        store.array[top:top + band.height()] = buffers.image_to_array(band)
+    store.flush()
+    return store
+
+def _import_whole(reader, path, directory):
+    image = reader.read()
+    if image.isNull():
+        raise ValueError("cannot read image %s: %s" % (path, reader.errorString()))
+    return TiledImageStore.from_image(image, directory)
+
+def _import_netpbm(path, directory):
+    magic, width, height, offset = _read_netpbm_header(path)
+    channels = 3 if magic == b"P6" else 1
+    shape = (height, width, 3) if channels == 3 else (height, width)
+    pixels = np.memmap(path, dtype=np.uint8, mode="r", offset=offset, shape=shape)
+
+    store = TiledImageStore.create(width, height, 1 if channels == 1 else 4, directory=directory)
+    for top, rows in _bands(store.array):
+        if channels == 1:
+            store.array[top:top + rows] = pixels[top:top + rows]
+        else:
+            # (red, green, blue) on disk, (blue, green, red, alpha) in the store
+            store.array[top:top + rows, :, :3] = pixels[top:top + rows, :, ::-1]
+            store.array[top:top + rows, :, 3] = 255
+    store.flush()
+    return store
+
+def _read_netpbm_header(path):
+    with open(path, "rb") as file:
+        data = file.read(1024)
+    fields, position = [], 0
+    # magic number, width, height and maximum value separated by whitespace, with optional comments
+    while len(fields) < 4:
+        while data[position:position + 1].isspace():
+            position += 1
+        if data[position:position + 1] == b"#":
+            position = data.index(b"\n", position)
+            continue
+        end = position
+        while end < len(data) and not data[end:end + 1].isspace():
+            end += 1
+        fields.append(data[position:end])
+        position = end
+    magic, width, height, maximum = fields[0], int(fields[1]), int(fields[2]), int(fields[3])
+    if magic not in (b"P5", b"P6") or maximum != 255:
+        raise ValueError("only binary 8 bit PPM/PGM files are supported: %s" % path)
+    return magic, width, height, position + 1
+
+'''
+This function saves a store to an image file, writing it a band at a time where possible
+    .npy - copied band by band
+    .ppm/.pgm - binary netpbm, written band by band
+    .png - written band by band with zlib (each row stored with the PNG "up" filter)
+    other formats - encoded by Qt, which needs the whole image in memory
+'''
+def export_image(store, path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        output = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=store.array.shape)
+        for top, rows in _bands(store.array):
+            output[top:top + rows] = store.array[top:top + rows]
+        output.flush()
+        del output
+    elif extension in (".ppm", ".pgm"):
+        _export_netpbm(store, path)
+    elif extension == ".png":
+        _export_png(store, path)
+    elif not store.to_image().save(path):
+        raise ValueError("cannot write image %s" % path)
+
+def _export_netpbm(store, path):
+    with open(path, "wb") as file:
+        file.write(b"%s\n%d %d\n255\n" % (b"P5" if store.channels == 1 else b"P6", store.width, store.height))
+        for top, rows in _bands(store.array):
+            band = store.array[top:top + rows]
+            file.write(np.ascontiguousarray(band if store.channels == 1 else band[:, :, 2::-1]).tobytes())
+
+def _export_png(store, path):
+    # color type 0 is grayscale, 2 is RGB and 6 is RGBA
+    color_type = 0 if store.channels == 1 else (6 if store.has_alpha else 2)
+    compressor = zlib.compressobj(6)
+    previous = None
+    with open(path, "wb") as file:
+        file.write(b"\x89PNG\r\n\x1a\n")
+        _write_png_chunk(file, b"IHDR", struct.pack(">IIBBBBB", store.width, store.height, 8, color_type, 0, 0, 0))
+        for top, rows in _bands(store.array):
+            band = store.array[top:top + rows]
+            if color_type == 2:
+                band = band[:, :, 2::-1]
+            elif color_type == 6:
+                band = band[:, :, [2, 1, 0, 3]]
+            band = np.ascontiguousarray(band).reshape(rows, -1)
+
+            # "up" filter: each row is stored as its difference with the row above (wrapping at 256)
+            above = np.zeros_like(band[:1]) if previous is None else previous
+            filtered = np.empty((rows, band.shape[1] + 1), dtype=np.uint8)
+            filtered[:, 0] = 2
+            filtered[:, 1:] = band - np.concatenate((above, band[:-1]))
+            previous = band[-1:].copy()
+
+            data = compressor.compress(filtered.tobytes())
+            if data:
+                _write_png_chunk(file, b"IDAT", data)
+        _write_png_chunk(file, b"IDAT", compressor.flush())
+        _write_png_chunk(file, b"IEND", b"")
+
+def _write_png_chunk(file, chunk_type, data):
+    file.write(struct.pack(">I", len(data)))
+    file.write(chunk_type)
+    file.write(data)
+    file.write(struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF))
+
+'''
+This function returns a 1x1 image of a format, to ask a TiledFilter about formats without an image
+'''
+def _probe(image_format):
+    return QImage(1, 1, image_format)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply Image Lab operations to an image larger than memory, tile by tile.")
+    parser.add_argument("input", help="image to process (.ppm/.pgm/.npy stream best, JPEG is decoded in bands)")
+    parser.add_argument("output", help="where to write the result (.png/.ppm/.pgm/.npy are written in bands)")
+    parser.add_argument("--ops", required=True, help='comma separated chain, e.g. "rotate:right,blur:25,contrast:30"')
+    parser.add_argument("--tile-size", type=int, default=DEFAULT_TILE_SIZE, help="side of the tiles in pixels")
+    parser.add_argument("--work-dir", default=None, help="directory for the intermediate memory-mapped files")
+    args = parser.parse_args(argv)
+
+    try:
+        chain = core.parse_chain(args.ops)
+    except ValueError as error:
+        parser.error(str(error))
+
+    start = time.perf_counter()
+    store = import_image(args.input, args.work_dir)
+    result = apply_chain(store, chain, args.tile_size, args.work_dir,
+                         progress=lambda fraction: print("\r%3d%%" % (fraction * 100), end="", flush=True))
+    export_image(result, args.output)
+    print("\rprocessed %dx%d image in %.2f s" % (store.width, store.height, time.perf_counter() - start))
+    if result is not store:
+        result.close()
+    store.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
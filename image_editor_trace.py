@@ -0,0 +1,222 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+import image_editor_buffers as buffers
+
+'''
+This module records where the time of the image editor goes
+Operations of the editor (rotate, blur, a brush move...) and their stages (format conversions,
+filter kernels, QPixmap conversion, repaint) are recorded as spans with their duration, the bytes
+allocated by the QImage/numpy bridge while they ran (see image_editor_buffers) and the size of the
+image. The tracer is off by default; when off, a span costs a single attribute check.
+
+    trace.tracer.enable()
+    with trace.span("blur", image):
+        ...
+    trace.tracer.export_chrome_trace("trace.json") # open in chrome://tracing or ui.perfetto.dev
+    print(trace.tracer.format_summary())
+
+Setting the IMAGE_LAB_TRACE environment variable turns the tracer on at startup.
+The allocation counter is shared by all threads, so the bytes of a span include those of filters
+running on other threads at the same time.
+'''
+
+MAX_EVENTS = 200000 # oldest spans are dropped beyond this, so a long session cannot grow without bound
+JOBS_THREAD = 0 # pseudo thread the spans of background jobs (submit to result) are shown on
+
+'''
+This class is one recorded span
+'''
+class TraceEvent:
+
+    __slots__ = ("name", "category", "start", "duration", "thread", "args")
+
+    def __init__(self, name, category, start, duration, thread, args):
+        self.name = name
+        self.category = category
+        self.start = start # time.perf_counter_ns() at the start
+        self.duration = duration # nanoseconds
+        self.thread = thread
+        self.args = args
+
+'''
+This class measures a span while it is open and records it in the tracer when it closes
+'''
+class Span:
+
+    __slots__ = ("tracer", "name", "category", "args", "start", "allocated")
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.allocated = buffers.allocations.bytes
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter_ns() - self.start
+        self.args["allocated_bytes"] = buffers.allocations.bytes - self.allocated
+        self.tracer.record(TraceEvent(self.name, self.category, self.start, duration, threading.get_ident(), self.args))
+        return False
+
+'''
+This class is the span used while the tracer is off: it does nothing
+'''
+class _NullSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+'''
+This class collects the spans of the whole editor
+'''
+class Tracer:
+
+    def __init__(self, enabled=False, max_events=MAX_EVENTS):
+        self.enabled = enabled
+        self.events = deque(maxlen=max_events)
+        self.lock = threading.Lock()
+        self.thread_names = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        with self.lock:
+            self.events.clear()
+
+    '''
+    This method returns a context manager measuring what runs inside it
+    image, when given, adds the size and format of the image to the span
+    '''
+    def span(self, name, image=None, category="stage", **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        if image is not None:
+            args.update(width=image.width(), height=image.height(), format=image.format().name)
+        return Span(self, name, category, args)
+
+    '''
+    This method records a span measured elsewhere, e.g. a background job from its submission to its result
+    '''
+    def record_interval(self, name, start, category="job", thread=JOBS_THREAD, **args):
+        if self.enabled:
+            self.record(TraceEvent(name, category, start, time.perf_counter_ns() - start, thread, args))
+
+    def record(self, event):
+        with self.lock:
+            if event.thread not in self.thread_names:
+                self.thread_names[event.thread] = "background jobs" if event.thread == JOBS_THREAD else threading.current_thread().name
+            self.events.append(event)
+
+    '''
+    This method saves the spans in the Chrome trace event format (chrome://tracing, ui.perfetto.dev)
+    '''
+    def export_chrome_trace(self, path):
+        with self.lock:
+            events = list(self.events)
+            thread_names = dict(self.thread_names)
+        process = os.getpid()
+        trace_events = [{"name": "thread_name", "ph": "M", "pid": process, "tid": thread, "args": {"name": name}}
+                        for thread, name in thread_names.items()]
+        for event in events:
+            trace_events.append({
+                "name": event.name,
+                "cat": event.category,
+                "ph": "X", # complete event: start and duration
+                "ts": event.start / 1000, # microseconds
+                "dur": event.duration / 1000,
+                "pid": process,
+                "tid": event.thread,
+                "args": event.args,
+            })
+        with open(path, "w") as file:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, file)
+
+    '''
+    This method returns statistics of the durations (in milliseconds) of every span name:
+    a list of dictionaries with the name, category, count, total, mean, p50, p90, p99 and max,
+    slowest total first
+    '''
+    def summary(self, category=None):
+        with self.lock:
+            events = list(self.events)
+        durations = {}
+        for event in events:
+            if category is None or event.category == category:
+                durations.setdefault((event.category, event.name), []).append(event.duration / 1e6)
+
+        rows = []
+        for (event_category, name), values in durations.items():
+            values.sort()
+            rows.append({
+                "name": name,
+                "category": event_category,
+                "count": len(values),
+                "total": sum(values),
+                "mean": sum(values) / len(values),
+                "p50": _percentile(values, 50),
+                "p90": _percentile(values, 90),
+                "p99": _percentile(values, 99),
+                "max": values[-1],
+            })
+        rows.sort(key=lambda row: row["total"], reverse=True)
+        return rows
+
+    '''
+    This method returns the summary as a text table
+    '''
+    def format_summary(self, category=None):
+        lines = ["%-22s %-9s %6s %10s %9s %9s %9s %9s" % ("span", "kind", "count", "total ms", "p50", "p90", "p99", "max")]
+        for row in self.summary(category):
+            lines.append("%-22s %-9s %6d %10.1f %9.2f %9.2f %9.2f %9.2f" % (row["name"][:22], row["category"], row["count"],
+                         row["total"], row["p50"], row["p90"], row["p99"], row["max"]))
+        return "\n".join(lines)
+
+# tracer shared by the whole editor
+tracer = Tracer(enabled=bool(os.environ.get("IMAGE_LAB_TRACE")))
+
+'''
+This function opens a span on the shared tracer, see Tracer.span
+'''
+def span(name, image=None, category="stage", **args):
+    if not tracer.enabled:
+        return _NULL_SPAN
+    return tracer.span(name, image, category, **args)
+
+'''
+This decorator records every call of an editor operation as a span of category "operation"
+The image of the editor (the image attribute of the first argument) is added to the span
+'''
+def traced(name):
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+            with tracer.span(name, getattr(args[0], "image", None) if args else None, category="operation"):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+'''
+This function returns the value below which percent of the sorted values fall (nearest rank)
+'''
+def _percentile(values, percent):
+    rank = max(1, -(-len(values) * percent // 100))
+    return values[int(rank) - 1]
@@ -0,0 +1,324 @@
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from PyQt6.QtGui import QImage
+import cv2
+import image_editor_batch as batch
+import image_editor_buffers as buffers
+import image_editor_core as core
+import image_editor_trace as trace
+
+'''
+This module applies a chain of operations from image_editor_core.py to videos and numbered frame sequences
+The clip is streamed, never loaded: a reader thread decodes the frames, a pool of worker threads
+runs the chain on several frames at once and a writer thread encodes the results in their order.
+The stages are joined by queues of a few frames, so the memory used depends on the queue depth and
+not on the length of the clip, and the slowest stage sets a steady pace for the other two.
+
+Inputs: video files, frame sequences given as a printf pattern ("frames/%04d.png") or a directory of images
+Outputs: video files (.mp4, .avi, .mkv, ...) or frame sequences given as a printf pattern
+
+Examples:
+    python image_editor_video.py clip.mp4 sketched.mp4 --ops "sketch,contrast:30"
+    python image_editor_video.py "frames/%04d.png" out.avi --ops "rotate:right,pixelate:8" --fps 24
+    python image_editor_video.py ./frames "out/%05d.jpg" --ops "blur:15"
+'''
+
+DEFAULT_FPS = 25.0 # frame rate of videos made from frame sequences, unless given
+
+# codec of the videos written, by extension; other extensions use mp4v
+FOURCC = {
+    ".avi": "MJPG",
+    ".mkv": "mp4v",
+    ".mov": "mp4v",
+    ".mp4": "mp4v",
+}
+
+'''
+This function returns the default depth of the queues between the stages: enough frames to keep every worker busy
+'''
+def default_depth(workers):
+    return max(4, 2 * workers)
+
+'''
+This function turns a decoded frame (BGR or gray array) into an image the operations take, copying it once
+'''
+def frame_to_image(frame):
+    if frame.ndim == 2:
+        return buffers.array_to_image(frame, QImage.Format.Format_Grayscale8)
+    image, view = buffers.new_image(frame.shape[1], frame.shape[0], QImage.Format.Format_RGB32)
+    cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA, dst=view)
+    return image
+
+'''
+This function turns an image into a frame the encoders take: a BGR array, or a gray one for grayscale images
+'''
+def image_to_frame(image):
+    array = buffers.image_to_array(buffers.as_editable(image))
+    if array.ndim == 2:
+        return array.copy() # the array belongs to the image, which is dropped once the frame is returned
+    return cv2.cvtColor(array, cv2.COLOR_BGRA2BGR)
+
+'''
+This class decodes the frames of a video file, a printf pattern or a directory of images, one at a time
+Raises ValueError when the source cannot be opened
+'''
+class FrameReader:
+
+    def __init__(self, source):
+        self.source = source
+        self.files = None
+        self.capture = None
+        if os.path.isdir(source):
+            # frames of a directory are decoded as they are stored: grayscale files stay grayscale
+            self.files = [os.path.join(source, name) for name in batch.find_images(source)]
+            if not self.files:
+                raise ValueError("no images in %s" % source)
+            self.fps = None
+            self.frame_count = len(self.files)
+        else:
+            self.capture = cv2.VideoCapture(source)
+            if not self.capture.isOpened():
+                raise ValueError("cannot open %s" % source)
+            self.fps = self.capture.get(cv2.CAP_PROP_FPS) or None
+            # the container may not know, or only roughly
+            self.frame_count = max(0, int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT)))
+        self.index = 0
+
+    '''
+    This method returns the next frame as an array, or None at the end of the clip
+    '''
+    def read(self):
+        if self.files is not None:
+            if self.index == len(self.files):
+                return None
+            path = self.files[self.index]
+            frame = cv2.imread(path, cv2.IMREAD_ANYCOLOR)
+            if frame is None:
+                raise ValueError("cannot read %s" % path)
+        else:
+            ok, frame = self.capture.read()
+            if not ok:
+                return None
+        self.index += 1
+        return frame
+
+    def close(self):
+        if self.capture is not None:
+            self.capture.release()
+
+'''
+This class encodes frames to a video file, or to numbered images when destination is a printf pattern
+The video is opened with the size of its first frame; every frame must have that size
+Raises ValueError when the destination cannot be written
+'''
+class FrameWriter:
+
+    def __init__(self, destination, fps=DEFAULT_FPS, fourcc=None):
+        self.destination = destination
+        self.fps = fps
+        self.sequence = "%" in destination
+        extension = os.path.splitext(destination)[1].lower()
+        self.fourcc = fourcc or FOURCC.get(extension, "mp4v")
+        self.writer = None
+        self.size = None
+        self.index = 0
+        directory = os.path.dirname(destination)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def write(self, frame):
+        size = (frame.shape[1], frame.shape[0])
+        if self.size is None:
+            self.size = size
+        elif size != self.size:
+            raise ValueError("frame %d is %dx%d, the video is %dx%d" % ((self.index,) + size + self.size))
+
+        if self.sequence:
+            path = self.destination % self.index
+            if not cv2.imwrite(path, frame):
+                raise ValueError("cannot write %s" % path)
+        else:
+            if self.writer is None:
+                self.writer = cv2.VideoWriter(self.destination, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, size)
+                if not self.writer.isOpened():
+                    raise ValueError("cannot write %s with the %s codec" % (self.destination, self.fourcc))
+            # videos are written in color; grayscale frames are widened here, at the last moment
+            self.writer.write(cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR) if frame.ndim == 2 else frame)
+        self.index += 1
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+
+'''
+This function puts item in a queue, waiting for room unless stop is set; returns False if it was not put
+'''
+def _put(frames, item, stop):
+    while not stop.is_set():
+        try:
+            frames.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+'''
+This function takes the next item of a queue, waiting for it unless stop is set (then returns None)
+'''
+def _get(frames, stop):
+    while not stop.is_set():
+        try:
+            return frames.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return None
+
+'''
+This function applies the steps of a fused chain (see core.fuse_chain) to a frame; it runs on a worker thread
+Returns the processed frame and the time it took
+'''
+def process_frame(frame, steps):
+    start = time.perf_counter()
+    image = frame_to_image(frame)
+    for name, args, _ in steps:
+        image = core.apply_step(image, name, args)
+    return image_to_frame(image), time.perf_counter() - start
+
+'''
+This function applies a chain of operations (see core.parse_chain) to every frame of source and writes them to destination
+    workers - threads processing frames at the same time (default: all cores)
+    depth - frames each queue between two stages holds; at most about 2 * depth + workers frames are in memory
+    fps - frame rate of the video written (default: the rate of the source, or DEFAULT_FPS)
+    report(frames done, frames in the source or 0 if unknown, frames per second so far) is called after every frame
+Returns a dictionary of totals: frames, seconds, frames per second and the busy time of each stage
+Raises ValueError when the source cannot be read or the destination written
+'''
+def process_video(source, destination, chain, workers=None, depth=None, fps=None, fourcc=None, report=None):
+    steps = core.fuse_chain(chain) # the chain is fused once, for every frame
+    workers = workers or os.cpu_count() or 1
+    depth = depth or default_depth(workers)
+    reader = FrameReader(source)
+    writer = FrameWriter(destination, fps or reader.fps or DEFAULT_FPS, fourcc)
+
+    decoded = queue.Queue(depth) # frames waiting for a worker
+    pending = queue.Queue(depth) # frames being processed or waiting to be written, in order
+    stop = threading.Event()
+    errors = []
+    busy = {"decode": 0.0, "process": 0.0, "encode": 0.0}
+    written = [0]
+    start = time.perf_counter()
+
+    def read_frames():
+        try:
+            while not stop.is_set():
+                began = time.perf_counter()
+                with trace.span("decode frame", category="video"):
+                    frame = reader.read()
+                busy["decode"] += time.perf_counter() - began
+                if frame is None:
+                    break
+                _put(decoded, frame, stop)
+        except Exception as error:
+            errors.append(error)
+            stop.set()
+        _put(decoded, None, stop)
+
+    def write_frames():
+        try:
+            while True:
+                future = _get(pending, stop)
+                if future is None:
+                    return
+                frame, seconds = future.result()
+                busy["process"] += seconds
+                began = time.perf_counter()
+                with trace.span("encode frame", category="video"):
+                    writer.write(frame)
+                busy["encode"] += time.perf_counter() - began
+                written[0] += 1
+                if report is not None:
+                    report(written[0], reader.frame_count, written[0] / (time.perf_counter() - start))
+        except Exception as error:
+            errors.append(error)
+            stop.set()
+
+    reading = threading.Thread(target=read_frames, name="video-decode", daemon=True)
+    writing = threading.Thread(target=write_frames, name="video-encode", daemon=True)
+    reading.start()
+    writing.start()
+    try:
+        # this thread hands the decoded frames to the workers; the order of pending is the order of the clip
+        with ThreadPoolExecutor(workers, thread_name_prefix="video-frame") as pool:
+            while True:
+                frame = _get(decoded, stop)
+                if frame is None:
+                    break
+                if not _put(pending, pool.submit(process_frame, frame, steps), stop):
+                    break
+            _put(pending, None, stop)
+            writing.join()
+    finally:
+        # on an error or an interruption, the other stages stop at their next frame
+        stop.set()
+        reading.join()
+        writing.join()
+        reader.close()
+        writer.close()
+    if errors:
+        raise errors[0]
+
+    elapsed = time.perf_counter() - start
+    return {
+        "frames": written[0],
+        "seconds": elapsed,
+        "frames_per_second": written[0] / elapsed if elapsed > 0 else 0.0,
+        "decode_seconds": busy["decode"],
+        "process_seconds": busy["process"],
+        "encode_seconds": busy["encode"],
+        "workers": workers,
+        "depth": depth,
+    }
+
+'''
+This function prints the progress of a clip on one line
+'''
+def print_progress(done, total, frames_per_second):
+    print("\rframe %d%s  %.1f fps" % (done, "/%d" % total if total else "", frames_per_second), end="", flush=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply a chain of Image Lab operations to a video or a frame sequence.")
+    parser.add_argument("input", help='video file, printf pattern of numbered frames ("frames/%%04d.png") or directory of images')
+    parser.add_argument("output", help='video file (.mp4, .avi, ...) or printf pattern of numbered frames ("out/%%04d.png")')
+    parser.add_argument("--ops", required=True, help='comma separated chain, e.g. "sketch,contrast:30,rotate:right"')
+    parser.add_argument("--workers", type=int, default=None, help="frames processed at the same time (default: all cores)")
+    parser.add_argument("--depth", type=int, default=None, help="frames held between two stages (default: twice the workers)")
+    parser.add_argument("--fps", type=float, default=None, help="frame rate of the output video (default: the input's)")
+    parser.add_argument("--fourcc", default=None, help="codec of the output video, e.g. mp4v or MJPG")
+    args = parser.parse_args(argv)
+
+    try:
+        chain = core.parse_chain(args.ops)
+    except ValueError as error:
+        parser.error(str(error))
+    if args.fourcc is not None and len(args.fourcc) != 4:
+        parser.error("a fourcc has four characters")
+
+    try:
+        totals = process_video(args.input, args.output, chain, args.workers, args.depth, args.fps, args.fourcc,
+                               report=print_progress)
+    except (ValueError, OSError) as error:
+        print("\ncannot process %s: %s" % (args.input, error), file=sys.stderr)
+        return 1
+
+    print("\rprocessed %d frame(s) in %.2f s (%.1f fps; busy: decode %.2f s, process %.2f s, encode %.2f s)" % (
+        totals["frames"], totals["seconds"], totals["frames_per_second"],
+        totals["decode_seconds"], totals["process_seconds"], totals["encode_seconds"]))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, QCoreApplication, pyqtSignal
+from PyQt6.QtGui import QImage
+import image_editor_core as core
+import image_editor_trace as trace
+
+'''
+This module runs the filters of the image editor on a pool of worker threads
+so the window stays responsive while they work
+Filters report their progress through the progress callback of image_editor_core and are
+cancelled by raising OperationCancelled from it. Only the result of the latest job is delivered:
+a job that was superseded by a newer one, or cancelled, never touches the editor's image
+'''
+
+'''
+This class holds the signals of a job; QRunnable is not a QObject so it cannot have any itself
+'''
+class JobSignals(QObject):
+    progress = pyqtSignal(int, float) # job id, fraction done
+    finished = pyqtSignal(int, QImage) # job id, result
+    failed = pyqtSignal(int, str) # job id, error message
+    cancelled = pyqtSignal(int) # job id
+
+'''
+This class is a single filter run on a worker thread
+function is called as function(image, progress) and returns the resulting QImage
+'''
+class FilterJob(QRunnable):
+
+    def __init__(self, job_id, image, function, name="filter"):
+        super().__init__()
+        self.job_id = job_id
+        self.name = name
+        self.submitted = time.perf_counter_ns() # for the trace of the job from submission to result
+        self.image = QImage(image) # shallow copy; the GUI thread never modifies it in place without detaching
+        self.function = function
+        self.cancel_event = threading.Event()
+        self.signals = JobSignals()
+        self.setAutoDelete(False) # the runner keeps the job until its signals have been handled
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    '''
+    This method is called by the filter between bands of work
+    '''
+    def report(self, fraction):
+        if self.cancel_event.is_set():
+            raise core.OperationCancelled()
+        self.signals.progress.emit(self.job_id, fraction)
+
+    def run(self):
+        try:
+            if self.cancel_event.is_set():
+                raise core.OperationCancelled()
+            result = self.function(self.image, self.report)
+            if self.cancel_event.is_set():
+                raise core.OperationCancelled()
+            self.signals.finished.emit(self.job_id, result)
+        except core.OperationCancelled:
+            self.signals.cancelled.emit(self.job_id)
+        except Exception as error:
+            self.signals.failed.emit(self.job_id, str(error))
+
+'''
+This class submits filter jobs to a thread pool and delivers the result of the latest one
+on the GUI thread. Submitting a job supersedes (and cancels) the ones still running
+'''
+class FilterRunner(QObject):
+
+    progress_changed = pyqtSignal(int) # percent done of the latest job
+    busy_changed = pyqtSignal(bool) # True while a job is running
+    failed = pyqtSignal(str) # error message of the latest job
+
+    def __init__(self, parent=None, max_threads=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads or os.cpu_count() or 1)
+        self.generation = 0 # id of the latest job
+        self.jobs = {} # running jobs by id
+        self.callbacks = {}
+
+    '''
+    This method runs function(image, progress) on the pool
+    on_result(result) is called on the GUI thread if the job is still the latest when it finishes
+    name identifies the job in traces (see image_editor_trace)
+    '''
+    def submit(self, image, function, on_result, name="filter"):
+        self.cancel()
+        self.generation += 1
+        job = FilterJob(self.generation, image, function, name)
+        job.signals.progress.connect(self._progress)
+        job.signals.finished.connect(self._finished)
+        job.signals.failed.connect(self._failed)
+        job.signals.cancelled.connect(self._cancelled)
+        self.jobs[job.job_id] = job
+        self.callbacks[job.job_id] = on_result
+
+        self.progress_changed.emit(0)
+        self.busy_changed.emit(True)
+        self.pool.start(job)
+        return job.job_id
+
+    '''
+    This method cancels every running job; their results will be dropped
+    '''
+    def cancel(self):
+        for job in self.jobs.values():
+            job.cancel()
+        if self.jobs:
+            self.busy_changed.emit(False)
+
+    def is_busy(self):
+        return any(job_id == self.generation for job_id in self.jobs)
+
+    '''
+    This method blocks until all jobs are done and their results delivered
+    Meant for scripts and headless use; the GUI never needs it
+    '''
+    def wait(self):
+        self.pool.waitForDone()
+        QCoreApplication.processEvents()
+
+    def _progress(self, job_id, fraction):
+        job = self.jobs.get(job_id)
+        if job_id == self.generation and job is not None and not job.cancel_event.is_set():
+            self.progress_changed.emit(int(fraction * 100))
+
+    def _finished(self, job_id, image):
+        job = self.jobs.get(job_id)
+        on_result = self._forget(job_id)
+        # out of date results of superseded or cancelled jobs are dropped
+        if job_id == self.generation and on_result is not None:
+            self.busy_changed.emit(False)
+            on_result(image)
+            trace.tracer.record_interval(job.name, job.submitted, width=image.width(), height=image.height())
+
+    def _failed(self, job_id, message):
+        self._forget(job_id)
+        if job_id == self.generation:
+            self.busy_changed.emit(False)
+            self.failed.emit(message)
+
+    def _cancelled(self, job_id):
+        self._forget(job_id)
+
+    def _forget(self, job_id):
+        job = self.jobs.pop(job_id, None)
+        on_result = self.callbacks.pop(job_id, None)
+        if job is None or job.cancel_event.is_set():
+            return None
+        return on_result
@@ -0,0 +1,10 @@
+import os
+import sys
+
+'''
+The tests run without a display, and import the modules of the editor from the directory above
+    python -m pytest -q tests
+'''
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,45 @@
+import numpy as np
+from PyQt6.QtGui import QImage
+import image_editor_buffers as buffers
+
+'''
+This module makes the deterministic images the tests run on
+'''
+
+'''
+This function returns an image like a photo: smooth gradients with noise
+'''
+def photo(width, height, gray=False):
+    image, view = buffers.new_image(width, height, QImage.Format.Format_RGB32)
+    rows = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    columns = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    noise = np.random.default_rng(0).integers(0, 32, (height, width)).astype(np.float32)
+    view[:, :, 0] = np.clip(rows * 0.5 + columns * 0.5 + noise, 0, 255).astype(np.uint8)
+    view[:, :, 1] = np.clip(rows + noise, 0, 255).astype(np.uint8)
+    view[:, :, 2] = np.clip(columns + noise, 0, 255).astype(np.uint8)
+    view[:, :, 3] = 255
+    return image.convertToFormat(QImage.Format.Format_Grayscale8) if gray else image
+
+'''
+This function returns a checkerboard of black and white squares of square pixels, the hardest input for a blur
+'''
+def checkerboard(width, height, square=1):
+    image, view = buffers.new_image(width, height, QImage.Format.Format_Grayscale8)
+    rows, columns = np.indices((height, width))
+    view[...] = ((rows // square + columns // square) % 2) * 255
+    return image
+
+'''
+This function returns an image of uniform random noise
+'''
+def noise(width, height):
+    image, view = buffers.new_image(width, height, QImage.Format.Format_RGB32)
+    view[...] = np.random.default_rng(1).integers(0, 256, view.shape, dtype=np.uint8)
+    view[:, :, 3] = 255
+    return image
+
+'''
+This function returns the pixels of an image as an array of its own
+'''
+def pixels(image):
+    return buffers.image_to_array(image).copy()
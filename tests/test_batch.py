@@ -0,0 +1,61 @@
+import os
+import numpy as np
+import pytest
+from PyQt6.QtGui import QImage
+import image_editor_batch as batch
+import image_editor_core as core
+import image_editor_loader as loader
+from editor_images import photo, pixels
+
+'''
+These tests check that a batch gives the results of the chain run in memory, and that its workers
+share the cores instead of each running one band thread per core
+'''
+
+CHAIN = "rotate:right,blur:5,contrast:20"
+
+def test_batch_matches_the_chain_in_memory(tmp_path):
+    input_dir, output_dir = tmp_path / "in", tmp_path / "out"
+    input_dir.mkdir()
+    images = {"image%d.png" % index: photo(120 + index, 80) for index in range(5)}
+    for name, image in images.items():
+        assert image.save(str(input_dir / name))
+    (input_dir / "broken.png").write_bytes(b"not an image")
+
+    results = []
+    totals = batch.run_batch(str(input_dir), str(output_dir), core.parse_chain(CHAIN), workers=2, report=results.append)
+    assert (totals["processed"], totals["failed"]) == (5, 1)
+    assert [os.path.basename(result[0]) for result in results if result[1] is not None] == ["broken.png"]
+    for name, image in images.items():
+        result = loader.read_image(str(output_dir / name))
+        assert np.array_equal(pixels(result), pixels(core.apply_chain(image, core.parse_chain(CHAIN))))
+
+'''
+This class runs the tasks of a batch in the test process, as a pool of one worker would
+'''
+class FakePool:
+
+    def __init__(self, initializer, initargs):
+        self.band_threads = core.BAND_THREADS
+        initializer(*initargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        core.set_band_threads(self.band_threads)
+
+    def imap_unordered(self, function, tasks, chunksize):
+        return map(function, tasks)
+
+@pytest.mark.parametrize("workers", (1, 2, 64))
+def test_workers_share_the_cores(workers, tmp_path, monkeypatch):
+    started = []
+    monkeypatch.setattr(batch.multiprocessing, "Pool", lambda processes, initializer, initargs:
+                        started.append((processes, initargs)) or FakePool(initializer, initargs))
+    for index in range(3):
+        QImage(8, 8, QImage.Format.Format_RGB32).save(str(tmp_path / ("image%d.png" % index)))
+    batch.run_batch(str(tmp_path), str(tmp_path / "out"), core.parse_chain("invert"), workers=workers)
+    processes, (band_threads,) = started[0]
+    assert processes == min(workers, 3)
+    assert band_threads == max(1, (os.cpu_count() or 1) // processes)
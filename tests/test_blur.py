@@ -0,0 +1,32 @@
+import cv2
+import pytest
+import image_editor_blur as blur_engine
+import image_editor_core as core
+from editor_images import checkerboard, noise, photo, pixels
+
+'''
+These tests check how far the blur engine (image_editor_blur.py) is from the exact gaussian:
+within blur_engine.SMOOTH_ERROR levels on a photo, within blur_engine.MAX_ERROR of the path on high frequency inputs
+'''
+
+WIDTH, HEIGHT = 640, 480
+STRENGTHS = (9, 61, 101, 201, 319)
+
+INPUTS = {
+    "photo": lambda strength: photo(WIDTH, HEIGHT),
+    "noise": lambda strength: noise(WIDTH, HEIGHT),
+    "pixel checkerboard": lambda strength: checkerboard(WIDTH, HEIGHT),
+    "squares": lambda strength: checkerboard(WIDTH, HEIGHT, max(1, strength // 4)),
+}
+
+@pytest.mark.parametrize("strength", STRENGTHS)
+@pytest.mark.parametrize("name", INPUTS)
+def test_blur_error_is_bounded(name, strength):
+    image = INPUTS[name](strength)
+    plan = blur_engine.BlurPlan(strength, image.size())
+    exact = cv2.GaussianBlur(pixels(image), (plan.kernel_size, plan.kernel_size), 0, borderType=cv2.BORDER_REFLECT_101)
+    error = int(cv2.absdiff(pixels(core.blur(image, strength)), exact).max())
+    assert error <= (blur_engine.SMOOTH_ERROR if name == "photo" else blur_engine.MAX_ERROR[plan.path])
+
+def test_strengths_cover_every_path():
+    assert {blur_engine.BlurPlan(strength, photo(WIDTH, HEIGHT).size()).path for strength in STRENGTHS} == {"gaussian", "box", "pyramid"}
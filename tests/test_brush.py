@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from PyQt6.QtGui import QColor
+import image_editor_brush as brush
+import image_editor_history as history
+from editor_images import photo, pixels
+
+'''
+These tests check that the points of the mouse coalesced into one polyline paint the same pixels as
+painting each of them as it came, and that the stroke is undone from what its recorder kept
+'''
+
+POINTS = [(10.0, 12.5), (40.3, 15.0), (42.0, 60.7), (41.0, 61.0), (5.5, 30.0), (60.0, 30.0), (60.0, 30.0), (120.2, 90.8)]
+
+def paint(image, batches, size=9, opacity=0.6):
+    recorder = history.StrokeRecorder()
+    stroke = brush.BrushStroke(brush.Brush(size, opacity), QColor(200, 30, 90), image, recorder)
+    previous = None
+    for points in batches:
+        # a line from the previous point, as the editor does while the mouse is held
+        if previous is not None:
+            points = [previous] + points
+        stroke.paint(image, points)
+        previous = points[-1]
+    return recorder.finish(image)
+
+@pytest.mark.parametrize("gray", (False, True), ids=("rgb", "gray"))
+@pytest.mark.parametrize("size, opacity", ((1, 1.0), (9, 0.6), (40, 0.3)))
+def test_coalesced_points_paint_like_each_point(gray, size, opacity):
+    each, coalesced = photo(130, 100, gray=gray), photo(130, 100, gray=gray)
+    paint(each, [[point] for point in POINTS], size, opacity)
+    paint(coalesced, [POINTS[:1], POINTS[1:4], POINTS[4:]], size, opacity)
+    assert np.array_equal(pixels(coalesced), pixels(each))
+
+def test_crossing_stroke_does_not_build_up():
+    image = photo(130, 100)
+    once = photo(130, 100)
+    paint(image, [[(10.0, 50.0), (120.0, 50.0), (10.0, 50.0)]])
+    paint(once, [[(10.0, 50.0), (120.0, 50.0)]])
+    assert np.array_equal(pixels(image), pixels(once))
+
+def test_stroke_is_undone_and_redone():
+    original = photo(130, 100)
+    image = original.copy()
+    delta = paint(image, [POINTS])
+    painted = pixels(image)
+    assert not np.array_equal(painted, pixels(original))
+    undone = delta.undo(image)
+    assert np.array_equal(pixels(undone), pixels(original))
+    assert np.array_equal(pixels(delta.redo(undone)), painted)
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from PyQt6.QtGui import QImage
+import image_editor_buffers as buffers
+import image_editor_core as core
+from editor_images import photo, pixels
+
+'''
+These tests check with the allocation counter that the QImage/numpy bridge copies nothing on its zero copy paths,
+and that a writable view of an image sharing its pixels detaches it instead of writing into the other image
+'''
+
+FILTERS = {
+    "invert": core.invert,
+    "contrast": lambda image: core.contrast(image, 30),
+    "blur": lambda image: core.blur(image, 5),
+    "pixelate": lambda image: core.pixelate(image, 7),
+}
+
+def test_views_do_not_copy():
+    image = photo(301, 203)
+    buffers.allocations.reset()
+    view = buffers.image_to_array(image)
+    writable = buffers.image_to_array(image, writable=True) # the image shares its pixels with no other QImage
+    assert buffers.allocations.count == 0
+    assert view.ctypes.data == int(image.constBits())
+    assert writable.ctypes.data == view.ctypes.data
+
+@pytest.mark.parametrize("gray", (False, True), ids=("rgb", "gray"))
+def test_editable_formats_are_not_converted(gray):
+    image = photo(301, 203, gray=gray)
+    buffers.allocations.reset()
+    assert buffers.as_editable(image) is image
+    assert buffers.as_format(image, image.format()) is image
+    assert buffers.allocations.count == 0
+
+def test_conversion_is_recorded():
+    image = photo(301, 203).convertToFormat(QImage.Format.Format_RGB888)
+    buffers.allocations.reset()
+    converted = buffers.as_editable(image)
+    assert converted.format() == QImage.Format.Format_RGB32
+    assert (buffers.allocations.count, buffers.allocations.bytes) == (1, converted.sizeInBytes())
+
+@pytest.mark.parametrize("gray", (False, True), ids=("rgb", "gray"))
+@pytest.mark.parametrize("name", FILTERS)
+def test_filters_allocate_only_their_result(name, gray):
+    image = photo(301, 203, gray=gray)
+    buffers.allocations.reset()
+    result = FILTERS[name](image)
+    assert (buffers.allocations.count, buffers.allocations.bytes) == (1, result.sizeInBytes())
+
+def test_writable_view_detaches_a_shared_image():
+    original = photo(301, 203)
+    before = pixels(original)
+    shared = QImage(original) # shares the pixels of the original until one of them is written
+    assert int(shared.constBits()) == int(original.constBits())
+    buffers.allocations.reset()
+    view = buffers.image_to_array(shared, writable=True)
+    view[...] = 0
+    assert buffers.allocations.count == 1
+    assert view.ctypes.data != int(original.constBits())
+    assert np.array_equal(pixels(original), before)
+    assert not pixels(shared).any()
+
+def test_read_only_view_cannot_be_written():
+    view = buffers.image_to_array(photo(31, 17))
+    with pytest.raises(ValueError):
+        view[0, 0] = 0
@@ -0,0 +1,76 @@
+import numpy as np
+import image_editor_buffers as buffers
+import image_editor_cache as result_cache
+import image_editor_graph as graph
+from editor_images import photo, pixels
+
+'''
+These tests check that results are served from the cache when they are asked for again,
+that the cache stays within its byte budget dropping the least recently used results first,
+and that fingerprints name the pixels of an image
+'''
+
+def test_repeated_render_is_served_from_the_cache():
+    cache = result_cache.ResultCache()
+    source = photo(301, 203)
+    edit_graph = graph.EditGraph(source, cache=cache).append("blur", 9).append("invert")
+    first = edit_graph.render()
+    buffers.allocations.reset()
+    cache.reset_counters()
+    # a graph of the same edits on a copy of the source finds the result by the fingerprint of its pixels
+    again = graph.EditGraph(source.copy(), cache=cache).append("blur", 9).append("invert").render()
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 0
+    assert buffers.allocations.count == 0
+    assert again.cacheKey() == first.cacheKey()
+    assert np.array_equal(pixels(again), pixels(first))
+
+def test_longer_graph_starts_from_the_cached_part():
+    cache = result_cache.ResultCache()
+    edit_graph = graph.EditGraph(photo(301, 203), cache=cache).append("blur", 9)
+    blurred = edit_graph.render()
+    buffers.allocations.reset()
+    inverted = edit_graph.append("invert").render()
+    assert buffers.allocations.count == 1 # only the result of the invert
+    assert np.array_equal(pixels(inverted)[..., :3], 255 - pixels(blurred)[..., :3])
+
+def test_eviction_keeps_the_cache_within_its_budget():
+    images = [photo(100, 100) for _ in range(5)]
+    cache = result_cache.ResultCache(byte_budget=images[0].sizeInBytes() * 3)
+    for index, image in enumerate(images[:3]):
+        cache.put(index, image)
+    assert cache.get(0) is images[0] # now the most recently used
+    for index, image in enumerate(images[3:], 3):
+        cache.put(index, image)
+        assert cache.nbytes <= cache.byte_budget
+    # 1 and 2 were the least recently used, 0 was used again after they were put
+    assert list(cache.results) == [0, 3, 4]
+    assert cache.nbytes == 3 * images[0].sizeInBytes()
+    assert cache.stats()["evictions"] == 2
+
+def test_value_larger_than_the_budget_is_kept_alone():
+    cache = result_cache.ResultCache(byte_budget=1000)
+    cache.put("small", photo(10, 10))
+    cache.put("large", photo(100, 100))
+    assert list(cache.results) == ["large"]
+
+def test_fingerprint_changes_with_the_pixels():
+    image = photo(301, 203)
+    changed = image.copy()
+    buffers.image_to_array(changed, writable=True)[100, 150, 1] ^= 1
+    assert result_cache.fingerprint(image.copy()) == result_cache.fingerprint(image)
+    assert result_cache.fingerprint(changed) != result_cache.fingerprint(image)
+    assert result_cache.fingerprint(image)[0] == "sha256"
+
+def test_fingerprint_ignores_the_padding_of_the_rows():
+    # rows of 301 gray pixels are padded to 304 bytes; the padding is not part of the image
+    image = photo(301, 203, gray=True)
+    padded = image.copy()
+    assert padded.bytesPerLine() > padded.width()
+    rows = np.frombuffer(padded.bits().asarray(padded.sizeInBytes()), dtype=np.uint8).reshape(padded.height(), -1)
+    rows[:, padded.width():] = 7
+    assert np.array_equal(pixels(padded), pixels(image))
+    assert result_cache.fingerprint(padded) == result_cache.fingerprint(image)
+
+def test_fingerprint_depends_on_the_shape():
+    image = photo(300, 200)
+    assert result_cache.fingerprint(image.copy(0, 0, 200, 300)) != result_cache.fingerprint(image)
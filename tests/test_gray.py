@@ -0,0 +1,32 @@
+import cv2
+import pytest
+from PyQt6.QtGui import QImage
+import image_editor_core as core
+import image_editor_save as save
+from editor_images import photo
+
+'''
+These tests check that grayscale images stay at one byte per pixel through the filters and when saved,
+a quarter of the memory of the same image in color
+'''
+
+CHAINS = ("blur:5", "blur:61", "blur:201", "contrast:30", "pixelate:7", "invert", "sketch", "grayscale",
+          "rotate:right,blur:9,contrast:20,pixelate:5,invert,sketch")
+
+@pytest.mark.parametrize("text", CHAINS)
+def test_gray_stays_one_byte_per_pixel(text):
+    gray = photo(641, 479, gray=True)
+    result = core.apply_chain(gray, core.parse_chain(text))
+    assert result.format() == QImage.Format.Format_Grayscale8
+    # rows of one byte per pixel, padded to a multiple of 4 bytes as Qt does
+    assert result.bytesPerLine() == (result.width() + 3) // 4 * 4
+    assert result.sizeInBytes() * 4 <= photo(641, 479).sizeInBytes() + 4 * 3 * result.height()
+
+def test_sketch_of_color_is_gray():
+    assert core.sketch(photo(320, 240)).format() == QImage.Format.Format_Grayscale8
+
+@pytest.mark.parametrize("extension", ("png", "jpg", "bmp"))
+def test_gray_is_saved_as_one_channel(extension, tmp_path):
+    path = str(tmp_path / ("gray." + extension))
+    save.save_image(photo(320, 240, gray=True), path)
+    assert cv2.imread(path, cv2.IMREAD_UNCHANGED).ndim == 2
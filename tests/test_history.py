@@ -0,0 +1,149 @@
+import numpy as np
+import pytest
+import image_editor_buffers as buffers
+import image_editor_cache as result_cache
+import image_editor_core as core
+import image_editor_graph as graph
+import image_editor_history as history
+from editor_images import photo, pixels
+
+'''
+These tests check that the undo history counts the images the edit graphs of its entries keep alive,
+that a change of graph is undone from its tiles once the result before it left the cache,
+and that every kind of entry gives back the same pixels when undone and redone, compressed or not
+'''
+
+'''
+This function returns the graph of an invert on a new source, and the record of switching to it from the source alone
+'''
+def graph_record(source, cache):
+    before = graph.EditGraph(source, cache=cache)
+    after = before.append("invert")
+    return history.GraphRecord(before, after, lambda edit_graph, result: edit_graph.render() if result is None else result)
+
+def test_graph_sources_are_counted_once():
+    cache = result_cache.ResultCache()
+    source = photo(300, 200)
+    records = [graph_record(source, cache), graph_record(source, cache)]
+    edit_history = history.EditHistory()
+    for record in records:
+        edit_history.push(record)
+    assert edit_history.nbytes == source.sizeInBytes()
+
+def test_held_frames_are_not_counted():
+    cache = result_cache.ResultCache()
+    source = photo(300, 200)
+    edit_history = history.EditHistory(held_frames=lambda: (source,))
+    edit_history.push(graph_record(source, cache))
+    assert edit_history.nbytes == 0
+
+def test_budget_drops_records_holding_frames():
+    cache = result_cache.ResultCache()
+    sources = [photo(300, 200 + index) for index in range(4)]
+    edit_history = history.EditHistory(byte_budget=2 * sources[-1].sizeInBytes())
+    for source in sources:
+        edit_history.push(graph_record(source, cache))
+    assert len(edit_history.undo_stack) == 2
+    assert edit_history.nbytes <= edit_history.byte_budget
+
+def test_undo_uses_the_tiles_once_the_cache_dropped_the_result():
+    cache = result_cache.ResultCache()
+    source = photo(300, 200)
+    before = graph.EditGraph(source, cache=cache).append("invert")
+    after = before.append("blur", 5)
+    previous, result = before.render(), after.render()
+    renders = []
+
+    def switch(edit_graph, adopted):
+        if adopted is None:
+            renders.append(edit_graph)
+            return edit_graph.render()
+        edit_graph.adopt(adopted)
+        return adopted
+
+    record = history.GraphRecord(before, after, switch, history.TileDelta.from_images(previous, result, lambda image: None))
+    cache.clear()
+    undone = record.undo(result)
+    assert renders == []
+    assert np.array_equal(pixels(undone), pixels(previous))
+    assert before.is_cached() and before.is_output(undone)
+
+'''
+This function returns a copy of image with a rectangle of its pixels inverted, the way a brush stroke would change them
+'''
+def stroked(image, top, left, height, width):
+    result = image.copy()
+    view = buffers.image_to_array(result, writable=True)
+    view[top:top + height, left:left + width] ^= 255
+    return result
+
+@pytest.mark.parametrize("compressed", (False, True), ids=("plain", "compressed"))
+@pytest.mark.parametrize("gray", (False, True), ids=("rgb", "gray"))
+def test_tile_delta_round_trip(gray, compressed):
+    # odd sizes, so the changed tiles include partial ones at the right and bottom edges
+    before = photo(301, 203, gray=gray)
+    after = stroked(before, 60, 100, 143, 201)
+    delta = history.TileDelta.from_images(before, after)
+    if compressed:
+        delta.compress()
+    undone = delta.undo(after)
+    assert np.array_equal(pixels(undone), pixels(before))
+    assert np.array_equal(pixels(delta.redo(undone)), pixels(after))
+    assert np.array_equal(pixels(after), pixels(stroked(before, 60, 100, 143, 201))) # undoing left the image alone
+
+@pytest.mark.parametrize("compressed", (False, True), ids=("plain", "compressed"))
+def test_replayed_tile_delta_round_trip(compressed):
+    before = photo(301, 203)
+    replay = lambda image: stroked(image, 10, 20, 30, 40)
+    after = replay(before)
+    delta = history.TileDelta.from_images(before, after, replay)
+    assert delta.after is None
+    if compressed:
+        delta.compress()
+    undone = delta.undo(after)
+    assert np.array_equal(pixels(undone), pixels(before))
+    assert np.array_equal(pixels(delta.redo(undone)), pixels(after))
+
+def test_operation_record_round_trip():
+    before = photo(301, 203)
+    record = history.OperationRecord(core.invert, core.invert)
+    after = record.redo(before)
+    record.compress()
+    undone = record.undo(after)
+    assert np.array_equal(pixels(undone), pixels(before))
+    assert np.array_equal(pixels(record.redo(undone)), pixels(after))
+
+@pytest.mark.parametrize("compressed", (False, True), ids=("plain", "compressed"))
+@pytest.mark.parametrize("replayed", (False, True), ids=("stored", "replayed"))
+def test_frame_record_round_trip(replayed, compressed):
+    before = photo(301, 203)
+    after = core.grayscale(before)
+    record = history.FrameRecord(before, core.grayscale) if replayed else history.FrameRecord(before, after_image=after)
+    if compressed:
+        record.compress()
+    undone = record.undo(after)
+    assert undone.format() == before.format()
+    assert np.array_equal(pixels(undone), pixels(before))
+    redone = record.redo(undone)
+    assert redone.format() == after.format()
+    assert np.array_equal(pixels(redone), pixels(after))
+
+def test_history_round_trip_after_the_budget_compressed_it():
+    images = [photo(301, 203)]
+    edit_history = history.EditHistory(byte_budget=2 * images[0].sizeInBytes())
+    for top in range(0, 200, 40):
+        after = stroked(images[-1], top, top, 40, 60)
+        edit_history.push(history.TileDelta.from_images(images[-1], after))
+        images.append(after)
+    edit_history.push(history.FrameRecord(images[-1], after_image=core.grayscale(images[-1])))
+    images.append(core.grayscale(images[-1]))
+    # the budget compressed the older entries and then dropped as many as it had to
+    kept = len(edit_history.undo_stack)
+    assert kept > 1 and edit_history.undo_stack[0].compressed
+    image = images[-1]
+    for expected in reversed(images[-kept - 1:-1]):
+        image = edit_history.undo(image)
+        assert np.array_equal(pixels(image), pixels(expected))
+    for expected in images[-kept:]:
+        image = edit_history.redo(image)
+        assert np.array_equal(pixels(image), pixels(expected))
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+import image_editor_cache as result_cache
+import image_editor_core as core
+from editor_images import photo, pixels
+
+'''
+These tests check that the filters run in bands on several threads (see core.run_filter) give the same result,
+to the last byte, as on one thread, where the whole image is filtered in one call
+The sizes are not multiples of the bands, the pixel blocks or the pyramid blocks
+'''
+
+SIZES = ((1001, 777), (333, 2101), (65, 67))
+
+OPERATIONS = {
+    "blur gaussian": lambda image: core.blur(image, 31),
+    "blur box": lambda image: core.blur(image, 61),
+    "blur pyramid": lambda image: core.blur(image, 201),
+    "sketch": core.sketch,
+    "sketch filter": lambda image: core.run_filter(image, core.sketch_filter()),
+    "pixelate": lambda image: core.pixelate(image, 7),
+    "pixelate large": lambda image: core.pixelate(image, 100),
+}
+
+@pytest.fixture
+def restore_band_threads():
+    threads = core.BAND_THREADS
+    yield
+    core.set_band_threads(threads)
+
+def run_with_threads(operation, image, threads):
+    core.set_band_threads(threads)
+    result_cache.results.clear() # the sketch would find its planes cached
+    return pixels(operation(image))
+
+@pytest.mark.parametrize("gray", (False, True), ids=("rgb", "gray"))
+@pytest.mark.parametrize("size", SIZES, ids=lambda size: "%dx%d" % size)
+@pytest.mark.parametrize("name", OPERATIONS)
+def test_bands_match_one_thread(name, size, gray, restore_band_threads):
+    image = photo(*size, gray=gray)
+    single = run_with_threads(OPERATIONS[name], image, 1)
+    banded = run_with_threads(OPERATIONS[name], image, 4)
+    assert np.array_equal(banded, single)
+
+def test_band_threads_must_be_positive(restore_band_threads):
+    with pytest.raises(ValueError):
+        core.set_band_threads(0)
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+import image_editor_core as core
+import image_editor_point_ops as point_ops
+from editor_images import noise, pixels
+
+'''
+These tests check that the lookup tables of the point operations give the same pixels as the formulas
+the editor applied pixel by pixel before them: computed in floating point, clamped to 0..255 and rounded
+with Python's round (half to even)
+'''
+
+def baseline_contrast(channels, contrast_level):
+    # the loop of the first editor: round(median([0, factor*(value - 128) + 128, 255]))
+    contrast_factor = (259*(contrast_level + 255))/(255*(259 - contrast_level))
+    values = np.clip(contrast_factor*(channels.astype(np.float64) - 128) + 128, 0, 255)
+    return np.round(values).astype(np.uint8)
+
+@pytest.mark.parametrize("contrast_level", (-255, -128, -37, 0, 1, 50, 127, 200, 255))
+def test_contrast_matches_the_formula(contrast_level):
+    image = noise(257, 131)
+    source = pixels(image)
+    result = pixels(core.contrast(image, contrast_level))
+    assert np.array_equal(result[:, :, :3], baseline_contrast(source[:, :, :3], contrast_level))
+    assert np.array_equal(result[:, :, 3], source[:, :, 3])
+
+def test_contrast_tables_match_the_loop_for_every_level():
+    # every level of the contrast dialog and every value, computed as the first editor did
+    for contrast_level in range(-255, 256):
+        contrast_factor = (259*(contrast_level + 255))/(255*(259 - contrast_level))
+        expected = [int(round(sorted([0, contrast_factor*(value - 128) + 128, 255])[1], 0)) for value in range(256)]
+        table = point_ops.contrast_table(contrast_level).table
+        for channel in range(3):
+            assert list(table[channel]) == expected, contrast_level
+
+@pytest.mark.parametrize("brightness_level", (-255, -60, 0, 1, 99, 255))
+def test_brightness_matches_the_formula(brightness_level):
+    image = noise(131, 257)
+    source = pixels(image)
+    result = pixels(core.brightness(image, brightness_level))
+    expected = np.clip(source[:, :, :3].astype(np.int16) + brightness_level, 0, 255).astype(np.uint8)
+    assert np.array_equal(result[:, :, :3], expected)
+
+def test_invert_matches_bitwise_not():
+    image = noise(100, 70)
+    assert np.array_equal(pixels(core.invert(image))[:, :, :3], 255 - pixels(image)[:, :, :3])
+
+def test_fused_tables_match_the_steps():
+    image = noise(90, 60)
+    steps = core.brightness(core.contrast(core.invert(image), 40), -25)
+    fused = core.apply_chain(image, core.parse_chain("invert,contrast:40,brightness:-25"))
+    assert np.array_equal(pixels(fused), pixels(steps))
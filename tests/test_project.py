@@ -0,0 +1,96 @@
+import numpy as np
+import image_editor_buffers as buffers
+import image_editor_cache as result_cache
+import image_editor_core as core
+import image_editor_graph as graph
+import image_editor_history as history
+import image_editor_project as project
+from editor_images import photo, pixels
+
+'''
+These tests check that a session saved to a project, edited, saved again and opened again
+undoes and redoes through the same pixels, and that saving reads the history without replaying it
+'''
+
+'''
+This function returns a copy of image with a rectangle of its pixels inverted, the way a brush stroke would change them
+'''
+def stroked(image, top, left, height, width):
+    result = image.copy()
+    buffers.image_to_array(result, writable=True)[top:top + height, left:left + width] ^= 255
+    return result
+
+def no_switch(edit_graph, result):
+    raise AssertionError("saving switched the edit graph of the session")
+
+'''
+This function returns the images of a session and its history: a stroke, two graph edits and a change of format
+'''
+def session():
+    cache = result_cache.ResultCache()
+    images = [photo(301, 203)]
+    edit_history = history.EditHistory()
+
+    images.append(stroked(images[-1], 20, 30, 100, 90))
+    edit_history.push(history.TileDelta.from_images(images[-2], images[-1]))
+
+    source = graph.EditGraph(images[-1], cache=cache)
+    inverted = source.append("invert")
+    images.append(inverted.render())
+    edit_history.push(history.GraphRecord(source, inverted, no_switch))
+
+    blurred = inverted.append("blur", 5)
+    images.append(blurred.render())
+    edit_history.push(history.GraphRecord(inverted, blurred, no_switch,
+                                          history.TileDelta.from_images(images[-2], images[-1], no_switch)))
+    cache.clear() # the graph before the blur is undone from its tiles
+
+    images.append(core.grayscale(images[-1]))
+    edit_history.push(history.FrameRecord(images[-2], after_image=images[-1]))
+    return images, edit_history
+
+def assert_round_trip(edit_history, image, images):
+    for expected in reversed(images[:-1]):
+        image = edit_history.undo(image)
+        assert np.array_equal(pixels(image), pixels(expected))
+    for expected in images[1:]:
+        image = edit_history.redo(image)
+        assert np.array_equal(pixels(image), pixels(expected))
+
+def test_saved_edited_and_appended_project_round_trips(tmp_path):
+    path = str(tmp_path / ("session" + project.EXTENSION))
+    images, edit_history = session()
+    session_project = project.Project()
+    first = session_project.save(path, images[-1], images[0], [], edit_history)
+
+    images.append(stroked(images[-1], 150, 200, 40, 60))
+    edit_history.push(history.TileDelta.from_images(images[-2], images[-1]))
+    appended = session_project.save(path, images[-1], images[0], [], edit_history)
+    assert appended < first / 4 # only the tiles of the new stroke and a manifest
+    session_project.close()
+
+    with project.ProjectFile(path) as project_file:
+        opened = project.Project(project_file)
+        current = project_file.read_image(project_file.manifest["current"])
+        assert np.array_equal(pixels(current), pixels(images[-1]))
+        opened_history = history.EditHistory()
+        opened_history.replace(*opened.read_history())
+        assert len(opened_history.undo_stack) == len(images) - 1
+        assert_round_trip(opened_history, current, images)
+        del opened_history
+
+def test_saving_to_another_file_moves_the_history_to_it(tmp_path):
+    first_path, second_path = str(tmp_path / "first.imlab"), str(tmp_path / "second.imlab")
+    images, edit_history = session()
+    project.Project().save(first_path, images[-1], images[0], [], edit_history)
+
+    first_file = project.ProjectFile(first_path)
+    opened = project.Project(first_file)
+    opened_history = history.EditHistory()
+    opened_history.replace(*opened.read_history())
+    original = first_file.stored_original()
+    opened.save(second_path, images[-1], original, [], opened_history)
+    assert first_file.map.closed
+    assert opened.file.path == second_path and original.project_file is opened.file
+    assert np.array_equal(pixels(original.load()), pixels(images[0]))
+    assert_round_trip(opened_history, images[-1], images)
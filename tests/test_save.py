@@ -0,0 +1,33 @@
+import os
+import pytest
+import image_editor_save as save
+from editor_images import photo
+
+'''
+These tests check that a failed save leaves neither its temporary file nor an open handle behind
+'''
+
+def open_handles():
+    return len(os.listdir("/proc/self/fd"))
+
+def failing_encoder(*args):
+    raise RuntimeError("encoder failed")
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc to count the open handles")
+@pytest.mark.parametrize("function", ("encoder_array", "encode_array", "search_quality"))
+def test_failed_save_closes_the_temporary_file(function, tmp_path, monkeypatch):
+    monkeypatch.setattr(save, function, failing_encoder)
+    options = save.SaveOptions(target_size=20000) if function == "search_quality" else None
+    handles = open_handles()
+    with pytest.raises(RuntimeError):
+        save.save_image(photo(64, 48), str(tmp_path / "image.jpg"), options)
+    assert open_handles() == handles
+    assert os.listdir(tmp_path) == []
+
+@pytest.mark.parametrize("extension", ("png", "jpg", "bmp"))
+def test_save_replaces_the_file(extension, tmp_path):
+    path = tmp_path / ("image." + extension)
+    path.write_bytes(b"previous")
+    size, _ = save.save_image(photo(64, 48), str(path))
+    assert size == path.stat().st_size and path.read_bytes() != b"previous"
+    assert os.listdir(tmp_path) == [path.name]
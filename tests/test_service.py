@@ -0,0 +1,166 @@
+import json
+import os
+import signal
+import threading
+import time
+import numpy as np
+import pytest
+from multiprocessing import resource_tracker, shared_memory
+import image_editor_core as core
+import image_editor_loader as loader
+import image_editor_save as save
+import image_editor_service as service
+from editor_images import photo, pixels
+
+'''
+These tests run the service with its worker processes and call it as other tools would:
+the file and shared memory endpoints, who may use shared memory, batching, and the replacement of a broken pool
+'''
+
+CHAIN = "rotate:right,blur:5,invert"
+
+@pytest.fixture(scope="module")
+def servers(tmp_path_factory):
+    image_service = service.ImageService(workers=1)
+    unix_server = service.create_server(image_service, str(tmp_path_factory.mktemp("service") / "service.sock"))
+    tcp_server = service.create_server(image_service, port=0)
+    for server in (unix_server, tcp_server):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    image_service.warm_up()
+    yield unix_server, tcp_server
+    for server in (unix_server, tcp_server):
+        server.shutdown()
+        server.server_close()
+    image_service.close()
+
+@pytest.fixture
+def unix_client(servers):
+    client = service.ServiceClient(servers[0].server_address)
+    yield client
+    client.close()
+
+@pytest.fixture
+def tcp_client(servers):
+    client = service.ServiceClient(port=servers[1].server_port)
+    yield client
+    client.close()
+
+def expected(image, text=CHAIN):
+    return pixels(core.apply_chain(image, core.parse_chain(text)))
+
+@pytest.mark.parametrize("client_name", ("unix_client", "tcp_client"))
+def test_process_file(client_name, request):
+    client = request.getfixturevalue(client_name)
+    image = photo(301, 203)
+    result, _ = loader.decode_image(client.process(save.encode_image(image, "png"), CHAIN))
+    assert np.array_equal(pixels(result), expected(image))
+
+def test_process_file_in_another_format(unix_client):
+    data = unix_client.process(save.encode_image(photo(64, 48), "png"), "invert", "jpg")
+    assert data[:3] == b"\xff\xd8\xff" # the start of a JPEG file
+
+def test_errors_are_answered(unix_client):
+    with pytest.raises(service.ServiceError) as error:
+        unix_client.process(b"not an image", "invert")
+    assert error.value.status == 422
+    with pytest.raises(service.ServiceError) as error:
+        unix_client.process(save.encode_image(photo(64, 48), "png"), "unknown")
+    assert error.value.status == 400
+
+@pytest.mark.parametrize("gray", (False, True), ids=("rgb", "gray"))
+def test_process_shared(unix_client, gray):
+    image = photo(301, 203, gray=gray)
+    result = unix_client.process_image(image, CHAIN + ",sketch")
+    assert result.format() == core.apply_chain(image, core.parse_chain(CHAIN + ",sketch")).format()
+    assert np.array_equal(pixels(result), expected(image, CHAIN + ",sketch"))
+
+def test_shared_memory_is_not_served_on_the_port(tcp_client, servers):
+    with pytest.raises(ValueError):
+        tcp_client.process_image(photo(64, 48), "invert")
+    status, _ = tcp_client._request("POST", "/process-shared?ops=invert", b"{}", "application/json")
+    assert status == 403
+    assert tcp_client._request("GET", "/shared-prefix")[0] == 404
+
+def test_shared_memory_needs_json_and_a_segment_named_by_the_service(unix_client):
+    prefix = json.loads(unix_client._request("GET", "/shared-prefix")[1])["prefix"]
+    segment = shared_memory.SharedMemory(create=True, size=64 * 48 * 4) # named by Python, not by the service
+    try:
+        body = json.dumps({"name": segment.name, "size": segment.size, "width": 64, "height": 48, "format": "RGB32"})
+        assert unix_client._request("POST", "/process-shared?ops=invert", body, "text/plain")[0] == 415
+        status, data = unix_client._request("POST", "/process-shared?ops=invert", body, "application/json")
+        assert status == 400 and "prefix" in json.loads(data)["error"]
+        for name in (prefix + "../../etc", prefix + "0" * 11, prefix.upper() + "0" * 12):
+            body = json.dumps({"name": name, "size": 16, "width": 2, "height": 2, "format": "RGB32"})
+            assert unix_client._request("POST", "/process-shared?ops=invert", body, "application/json")[0] == 400
+    finally:
+        segment.close()
+        segment.unlink()
+
+def test_attaching_does_not_register_the_segment(monkeypatch):
+    calls = []
+    monkeypatch.setattr(resource_tracker, "register", lambda *args: calls.append(args))
+    monkeypatch.setattr(resource_tracker, "unregister", lambda *args: calls.append(args))
+    segment = shared_memory.SharedMemory(create=True, size=4096)
+    try:
+        calls.clear()
+        attached = service.attach_segment(segment.name)
+        attached.buf[:4] = b"abcd"
+        assert attached.size >= 4096
+        attached.close()
+        assert calls == []
+        assert bytes(segment.buf[:4]) == b"abcd"
+    finally:
+        segment.close()
+        segment.unlink()
+
+def test_failing_task_does_not_fail_its_batch():
+    image = photo(64, 48)
+    chain = core.parse_chain("invert")
+    results = service.run_tasks([("data", chain, b"not an image", None), ("data", chain, save.encode_image(image, "png"), None)])
+    assert results[0][0][0] == "error"
+    assert results[1][0][0] == "data"
+    assert np.array_equal(pixels(loader.decode_image(results[1][0][1])[0]), expected(image, "invert"))
+
+def test_small_requests_are_batched():
+    image_service = service.ImageService(workers=1, batch_window=0.5, max_batch=8)
+    try:
+        image_service.warm_up()
+        data = save.encode_image(photo(64, 48), "png")
+        task = ("data", core.parse_chain("invert"), data, None)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(image_service.process(task, len(data))))
+                   for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        metrics = image_service.metrics()
+        assert [result[0] for result in results] == ["data"] * 6
+        assert metrics["completed"] == 6 and metrics["batches"] < 6
+    finally:
+        image_service.close()
+
+def test_broken_pool_is_replaced_once():
+    image_service = service.ImageService(workers=1)
+    try:
+        image_service.warm_up()
+        broken = image_service.pool
+        made = []
+        new_pool = image_service._new_pool
+        image_service._new_pool = lambda: made.append(1) or new_pool()
+        os.kill(next(iter(broken._processes)), signal.SIGKILL)
+        deadline = time.monotonic() + 30
+        while not broken._broken and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        data = save.encode_image(photo(64, 48), "png")
+        task = ("data", core.parse_chain("invert"), data, None)
+        result = image_service.process(task, len(data))
+        assert result[0] == "error" and "worker failed" in result[1]
+        assert image_service.pool is not broken and len(made) == 1
+        for _ in range(2):
+            assert image_service.process(task, len(data))[0] == "data"
+        assert len(made) == 1
+        assert image_service.metrics()["failed"] == 1
+    finally:
+        image_service.close()
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from PyQt6.QtCore import QRect
+from PyQt6.QtGui import QColor
+import image_editor_brush as brush
+import image_editor_buffers as buffers
+import image_editor_history as history
+import image_editor_stats as stats
+from editor_images import photo
+
+'''
+These tests check that the histogram kept up to date by counting only the regions an edit changed
+is the histogram counting the whole image again would give
+'''
+
+def recount(image):
+    return stats.histogram(image).counts
+
+@pytest.mark.parametrize("gray", (False, True), ids=("rgb", "gray"))
+def test_histogram_after_a_stroke_matches_a_recount(gray):
+    image = photo(301, 203, gray=gray)
+    live = stats.LiveHistogram()
+    live.of(image)
+    before_key = image.cacheKey()
+    recorder = history.StrokeRecorder()
+    stroke = brush.BrushStroke(brush.Brush(15, 0.7), QColor(250, 10, 120), image, recorder)
+    stroke.paint(image, [(5.0, 5.0), (290.0, 190.0), (150.0, 20.0)])
+    delta = recorder.finish(image)
+    # as the editor does when the stroke is over (see finish_stroke)
+    live.update(before_key, image, [(delta.before[key], delta.after[key]) for key in delta.before])
+    assert live.key == image.cacheKey()
+    assert np.array_equal(live.of(image).counts, recount(image))
+
+@pytest.mark.parametrize("gray", (False, True), ids=("rgb", "gray"))
+def test_histogram_after_region_updates_matches_a_recount(gray):
+    previous = photo(301, 203, gray=gray)
+    live = stats.LiveHistogram()
+    live.of(previous)
+    rects = [QRect(0, 0, 50, 40), QRect(100, 60, 120, 90), QRect(250, 150, 100, 100)] # the last one crosses the edges
+    edited = previous.copy()
+    view = buffers.image_to_array(edited, writable=True)
+    for rect in rects:
+        view[rect.top():rect.top() + rect.height(), rect.left():rect.left() + rect.width()] ^= 0x5a
+    live.update_regions(previous, edited, rects)
+    assert np.array_equal(live.of(edited).counts, recount(edited))
+    # and back, as undoing the edit does
+    live.update_regions(edited, previous, rects)
+    assert np.array_equal(live.of(previous).counts, recount(previous))
+
+def test_update_of_an_unknown_image_counts_it_again():
+    previous, edited = photo(64, 48), photo(64, 48, gray=True)
+    live = stats.LiveHistogram()
+    live.of(previous)
+    live.update_regions(previous, edited, [QRect(0, 0, 10, 10)]) # the format changed
+    assert live.histogram is None
+    assert np.array_equal(live.of(edited).counts, recount(edited))
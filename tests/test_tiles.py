@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from PyQt6.QtCore import QSize
+import image_editor_blur as blur_engine
+import image_editor_core as core
+import image_editor_tiles as tiles
+from editor_images import photo, pixels
+
+'''
+These tests check that a chain run over the tiles of a store (image_editor_tiles.py) gives the same pixels,
+to the last bit, as the same chain run on the image in memory (core.apply_chain)
+The tiles are 257 pixels, which divides none of the sizes, so every filter meets partial tiles and seams
+'''
+
+TILE_SIZE = 257
+SIZES = ((600, 450), (300, 700))
+
+CHAINS = (
+    "blur:5", # gaussian
+    "blur:61", # box
+    "blur:201", # pyramid
+    "blur:501", # pyramid, its depth limited by the short side of the image
+    "sketch",
+    "pixelate:7",
+    "pixelate:300",
+    "rotate:right,mirror:horizontal",
+    "mirror:vertical,rotate:left",
+    "crop:13:29:411:257",
+    "contrast:30,blur:15,invert",
+    "rotate:right,pixelate:9,crop:5:7:200:150,sketch",
+)
+
+def run_tiled(image, chain, directory):
+    store = tiles.TiledImageStore.from_image(image, str(directory))
+    result = tiles.apply_chain(store, chain, TILE_SIZE, str(directory))
+    try:
+        return np.array(result.array)
+    finally:
+        result.close()
+        store.close()
+
+def test_blur_chains_cover_every_path():
+    paths = {blur_engine.BlurPlan(strength, QSize(width, height)).path
+             for strength in (5, 61, 201) for width, height in SIZES}
+    assert paths == {"gaussian", "box", "pyramid"}
+
+@pytest.mark.parametrize("gray", (False, True), ids=("rgb", "gray"))
+@pytest.mark.parametrize("size", SIZES, ids=lambda size: "%dx%d" % size)
+@pytest.mark.parametrize("text", CHAINS)
+def test_tiled_chain_matches_memory(text, size, gray, tmp_path):
+    image = photo(*size, gray=gray)
+    chain = core.parse_chain(text)
+    expected = pixels(core.apply_chain(image, chain))
+    result = run_tiled(image, chain, tmp_path)
+    assert result.shape == expected.shape
+    assert np.array_equal(result, expected)